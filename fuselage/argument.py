@@ -13,17 +13,21 @@
 # limitations under the License.
 
 import random
+import re
 import sys
 
 from fuselage import error
-from fuselage.utils import force_str
+from fuselage.utils import compile_pattern, force_str
 
 
 class Argument:
 
-    """Stores the argument value on the instance object. It's a bit fugly,
-    neater ways of doing this that do not involve passing extra arguments to
-    Argument are welcome."""
+    """Stores the argument value on the instance object, as the attribute
+    named ``arg_id``.
+
+    Which arguments have been set is recorded in the instance's ``_present``
+    bitmap, at the bit ``ResourceType`` gives the argument in that resource
+    class's ``__masks__``."""
 
     argument_id = 0
     default = None
@@ -35,14 +39,18 @@ class Argument:
         Argument.argument_id += 1
 
     def __get__(self, instance, owner):
+        # This is get and get_raw inlined, as it is by far the hottest path
         if instance is None:
             return self
-        return self.get(instance)
+        elif instance._present & instance.__masks__[self]:
+            return getattr(instance, self.arg_id)
+        else:
+            return self.get_default(instance)
 
     def get(self, instance):
         if instance is None:
             return self
-        elif self.present(instance):
+        elif instance._present & instance.__masks__[self]:
             return self.get_raw(instance)
         else:
             return self.get_default(instance)
@@ -56,7 +64,7 @@ class Argument:
         return getattr(instance, self.arg_id)
 
     def present(self, instance):
-        return hasattr(instance, self.arg_id)
+        return instance._present & instance.__masks__[self] != 0
 
     def serialize(self, instance, builder=None):
         return self.get(instance)
@@ -71,6 +79,7 @@ class Argument:
 
     def save(self, instance, value):
         setattr(instance, self.arg_id, value)
+        instance._present |= instance.__masks__[self]
 
 
 class Boolean(Argument):
@@ -144,6 +153,29 @@ class FullPath(String):
         return "/" + super()._generate_valid()
 
 
+class Regex(String):
+
+    """A python regular expression. It is compiled as soon as it is set, so
+    an invalid expression raises :py:exc:error.ParseError when the bundle is
+    loaded rather than when the resource is applied. Providers should get the
+    compiled expression from :py:func:`fuselage.utils.compile_pattern`."""
+
+    def clean(self, instance, value):
+        value = super().clean(instance, value)
+        if value is not None:
+            try:
+                compile_pattern(value)
+            except re.error as e:
+                raise error.ParseError(
+                    f"'{value}' is not a valid regular expression: {e}"
+                )
+        return value
+
+    @classmethod
+    def _generate_valid(self):
+        return re.escape(super()._generate_valid())
+
+
 class Integer(Argument):
 
     """Represents an integer argument taken from the source file. This can
@@ -12,15 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import hashlib
+import importlib.util
 import io
+import logging
+import marshal
 import modulefinder
 import os
 import pkgutil
+import threading
+import uuid
 import zipfile
+import zlib
 
 from fuselage.bundle import ResourceBundle
 
+logger = logging.getLogger(__name__)
+
+# How much of an asset is compressed to guess how well the rest of it will
+PROBE_SIZE = 64 * 1024
+
+# Assets that don't shrink below this fraction of their size in the probe are
+# stored uncompressed
+MIN_SAVING = 0.9
+
+# Assets bigger than this are compressed with a faster level
+LARGE_ASSET = 1024 * 1024
+
 MAIN_PY = """
 import logging
 import sys
@@ -39,71 +58,388 @@ if __name__=="__main__":
 
 
 class Builder:
-    def __init__(self, zfp):
+    def __init__(self, zfp, bytecode=False):
         self.zipfile = zfp
+        self.bytecode = bytecode
+        self.assets = set()
 
     @classmethod
-    def write_to(cls, fp):
+    def write_to(cls, fp, bytecode=False):
         fp.write(b"#!/usr/bin/env python3\n")
-        obj = cls(zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED))
+        obj = cls(
+            zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED),
+            bytecode=bytecode,
+        )
         obj.fp = fp
         return obj
 
     @classmethod
-    def write_to_path(cls, path):
-        return cls.write_to(open(path, "wb"))
+    def write_to_path(cls, path, bytecode=False):
+        return cls.write_to(open(path, "wb"), bytecode=bytecode)
 
     def add_resource_blob(self, payload):
         name = hashlib.sha1(payload).hexdigest()
-        self.zipfile.writestr(os.path.join("assets", name), payload)
+        self.add_asset(name, payload)
         return "bundle://" + name
 
+    def add_asset(self, name, payload):
+        """Embed ``payload`` under its digest ``name``, unless it already has
+        been. Assets that are already compressed are stored as they are."""
+        if name in self.assets:
+            return
+        self.assets.add(name)
+
+        compress_type, level = get_compression(payload)
+        self.zipfile.writestr(
+            os.path.join("assets", name),
+            payload,
+            compress_type=compress_type,
+            compresslevel=level,
+        )
+
     def embed_resource_bundle(self, bundle: ResourceBundle):
         data = bundle.dumps(self)
         self.zipfile.writestr("resources.json", data)
 
-    def embed_fuselage_runtime(self):
-        finder = modulefinder.ModuleFinder()
-
-        co = compile(MAIN_PY, "__main__.py", "exec")
-        m = finder.add_module("__main__")
-        m.__file__ = "__main__.py"
-        finder.scan_code(co, m)
-
-        for name, mod in finder.modules.items():
-            if not name.startswith("fuselage"):
-                continue
-
-            # Use pkgutil to get the code - this is zipsafe so will work even if
-            # running from a py2exe type binary installation.
-            basename = os.path.basename(mod.__file__)
-            path_parts = out_parts = list(name.split("."))
-            if basename == "__init__.py":
-                path_parts.append("__init__.py")
-            elif not "." in name:
-                path_parts = [name, name + ".py"]
-                out_parts = [name + ".py"]
-            else:
-                path_parts[-1] += ".py"
+    def embed_serialized_bundle(self, data, assets):
+        """Embed a bundle that was serialized with an ``AssetCollector``"""
+        for name, payload in assets.items():
+            self.add_asset(name, payload)
+        self.zipfile.writestr("resources.json", data)
 
-            code = pkgutil.get_data(path_parts[0], os.sep.join(path_parts[1:]))
-            self.zipfile.writestr(os.path.join(*out_parts), code)
+    def embed_fuselage_runtime(self, bundle: ResourceBundle = None):
+        """Embed the modules needed to run a payload. If ``bundle`` is given
+        only the resources and providers that it uses are embedded."""
+        runtime = get_runtime()
+        if bundle is not None:
+            runtime = prune_runtime(runtime, bundle)
 
-        self.zipfile.writestr("__init__.py", "")
-        self.zipfile.writestr("__main__.py", MAIN_PY)
+        for path, code in runtime:
+            self.zipfile.writestr(path, code)
+            if self.bytecode:
+                self.zipfile.writestr(path + "c", compile_bytecode(path, code))
 
     def close(self):
         self.zipfile.close()
 
+    def get_size_report(self):
+        """Return the number of files, total size and total compressed size
+        of the runtime, the bundle and its assets"""
+        report = {}
+        for info in self.zipfile.infolist():
+            if info.filename.startswith("assets/"):
+                part = "assets"
+            elif info.filename == "resources.json":
+                part = "bundle"
+            else:
+                part = "runtime"
+            totals = report.setdefault(part, {"files": 0, "size": 0, "compressed": 0})
+            totals["files"] += 1
+            totals["size"] += info.file_size
+            totals["compressed"] += info.compress_size
+        return report
 
-def build(bundle: ResourceBundle, name: str = "payload.pex") -> io.BytesIO:
-    buffer = io.BytesIO()
-    buffer.name = name
 
-    bu = Builder.write_to(buffer)
-    bu.embed_fuselage_runtime()
-    bu.embed_resource_bundle(bundle)
-    bu.close()
+def get_compression(payload):
+    """Choose how to compress an asset by compressing its start. Data that
+    is already compressed, like a tarball or an image, is stored rather than
+    deflated again for nothing."""
+    probe = payload[:PROBE_SIZE]
+    if len(zlib.compress(probe, 1)) > len(probe) * MIN_SAVING:
+        return zipfile.ZIP_STORED, None
+    if len(payload) > LARGE_ASSET:
+        return zipfile.ZIP_DEFLATED, 1
+    return zipfile.ZIP_DEFLATED, None
+
+
+class AssetCollector:
+
+    """Stands in for a ``Builder`` while a bundle is serialized, keeping the
+    assets it refers to so they can be embedded later."""
+
+    def __init__(self):
+        self.assets = {}
+
+    def add_resource_blob(self, payload):
+        name = hashlib.sha1(payload).hexdigest()
+        self.assets[name] = payload
+        return "bundle://" + name
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def find_runtime():
+    finder = modulefinder.ModuleFinder()
+
+    co = compile(MAIN_PY, "__main__.py", "exec")
+    m = finder.add_module("__main__")
+    m.__file__ = "__main__.py"
+    finder.scan_code(co, m)
+
+    runtime = []
+    for name, mod in sorted(finder.modules.items()):
+        if not name.startswith("fuselage"):
+            continue
+
+        # Use pkgutil to get the code - this is zipsafe so will work even if
+        # running from a py2exe type binary installation.
+        basename = os.path.basename(mod.__file__)
+        path_parts = out_parts = list(name.split("."))
+        if basename == "__init__.py":
+            path_parts.append("__init__.py")
+        elif not "." in name:
+            path_parts = [name, name + ".py"]
+            out_parts = [name + ".py"]
+        else:
+            path_parts[-1] += ".py"
+
+        code = pkgutil.get_data(path_parts[0], os.sep.join(path_parts[1:]))
+        runtime.append((os.path.join(*out_parts), code))
+
+    runtime.append(("__init__.py", b""))
+    runtime.append(("__main__.py", MAIN_PY.encode("utf-8")))
+    return runtime
+
+
+def get_runtime():
+    """Return the ``(path, code)`` pairs that make up the fuselage runtime in
+    a payload. They are only looked up once per process."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = find_runtime()
+        return _runtime
+
+
+def get_module_path(name):
+    return os.path.join(*name.split(".")) + ".py"
+
 
-    buffer.seek(0)
+def get_used_modules(bundle: ResourceBundle):
+    """Return the names of the modules that define the resources in
+    ``bundle``, and every provider that might be chosen for them."""
+    import fuselage.providers  # noqa
+
+    modules = {}
+    for resource in bundle.resources:
+        kls = type(resource)
+        modules.setdefault(kls.__module__, set()).add(kls.__name__)
+        for policy in kls.policies.values():
+            for provider in policy.providers:
+                modules.setdefault(provider.__module__, set())
+    return modules
+
+
+def prune_runtime(runtime, bundle: ResourceBundle):
+    """Drop the resource and provider modules that ``bundle`` doesn't use
+    from ``runtime``. The ``__init__`` modules that import all of them are
+    replaced with a registry that only imports what is left."""
+    used = get_used_modules(bundle)
+    resources = sorted(m for m in used if m.startswith("fuselage.resources."))
+    providers = sorted(m for m in used if m.startswith("fuselage.providers."))
+    classes = sorted(c for m in resources for c in used[m])
+
+    resources_init = "".join(
+        "from .{} import {}\n".format(m.rpartition(".")[2], ", ".join(sorted(used[m])))
+        for m in resources
+    )
+    resources_init += "\n__all__ = {!r}\n".format(classes)
+
+    providers_init = "".join(
+        "from . import {}\n".format(m.rpartition(".")[2]) for m in providers
+    )
+
+    fuselage_init = "from .bundle import ResourceBundle\n"
+    if classes:
+        fuselage_init += "from .resources import {}\n".format(", ".join(classes))
+    fuselage_init += "\n__all__ = {!r}\n".format(["ResourceBundle"] + classes)
+
+    registry = {
+        os.path.join("fuselage", "__init__.py"): fuselage_init,
+        os.path.join("fuselage", "resources", "__init__.py"): resources_init,
+        os.path.join("fuselage", "providers", "__init__.py"): providers_init,
+    }
+    optional = (
+        os.path.join("fuselage", "resources", ""),
+        os.path.join("fuselage", "providers", ""),
+    )
+    keep = {get_module_path(m) for m in used}
+
+    pruned = []
+    for path, code in runtime:
+        if path in registry:
+            code = registry[path].encode("utf-8")
+        elif path.startswith(optional) and path not in keep:
+            continue
+        pruned.append((path, code))
+    return pruned
+
+
+@functools.lru_cache(maxsize=None)
+def compile_bytecode(path, code):
+    """Compile a module of the runtime to the contents of a ``.pyc`` for this
+    interpreter. zipimport prefers a ``.pyc`` next to the ``.py`` in the zip,
+    as long as its magic number matches the interpreter running the payload.
+    A different interpreter ignores it and compiles the source instead.
+
+    The ``.pyc`` is hash based and unchecked: the source next to it in the
+    zip can't change, so there is no need to hash it again at import time."""
+    flags = 0b01
+    data = bytearray(importlib.util.MAGIC_NUMBER)
+    data.extend(flags.to_bytes(4, "little"))
+    data.extend(importlib.util.source_hash(code))
+    data.extend(marshal.dumps(compile(code, path, "exec", dont_inherit=True)))
+    return bytes(data)
+
+
+def get_runtime_digest(bytecode=False):
+    digest = hashlib.sha1()
+    if bytecode:
+        digest.update(importlib.util.MAGIC_NUMBER)
+    for path, code in get_runtime():
+        digest.update(path.encode("utf-8") + b"\0")
+        digest.update(hashlib.sha1(code).digest())
+    return digest.hexdigest()
+
+
+class PayloadCache:
+
+    """
+    A directory of built payloads, named by a digest of the fuselage runtime
+    and the serialized bundle. The serialized bundle names its assets by
+    digest, so two builds with the same key produce equivalent payloads.
+
+    When the payloads add up to more than ``max_size`` bytes the least
+    recently used ones are removed.
+    """
+
+    def __init__(self, path=None, max_size=256 * 1024 * 1024):
+        if path is None:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+                "~/.cache"
+            )
+            path = os.path.join(cache_home, "fuselage", "payloads")
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def get_key(self, data, bytecode=False, prune=False, assets=True):
+        digest = hashlib.sha1(get_runtime_digest(bytecode).encode("ascii"))
+        if prune:
+            digest.update(b"prune\0")
+        if not assets:
+            digest.update(b"noassets\0")
+        digest.update(data.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key + ".pex")
+
+    def get(self, key):
+        """Return the payload stored under ``key``, or None"""
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as fp:
+                payload = fp.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # The mtime records when the payload was last used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return payload
+
+    def put(self, key, payload):
+        os.makedirs(self.path, exist_ok=True)
+        path = self._get_path(key)
+        tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex[:8])
+        with open(tmp, "wb") as fp:
+            fp.write(payload)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.path):
+                if entry.name.endswith(".pex"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+
+            total = sum(size for mtime, size, path in entries)
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def build(
+    bundle: ResourceBundle,
+    name: str = "payload.pex",
+    cache: PayloadCache = None,
+    bytecode: bool = False,
+    prune: bool = False,
+) -> io.BytesIO:
+    """Build a payload that applies ``bundle`` when it is run. With
+    ``bytecode`` the runtime is also embedded precompiled for this version of
+    python, which saves compiling it every time the payload starts on a
+    target running the same version. With ``prune`` only the resources and
+    providers used by ``bundle`` are embedded."""
+    collector = AssetCollector()
+    data = bundle.dumps(collector)
+    return _build(bundle, data, collector.assets, name, cache, bytecode, prune)
+
+
+def build_delta(
+    bundle: ResourceBundle,
+    name: str = "payload.pex",
+    cache: PayloadCache = None,
+    bytecode: bool = False,
+    prune: bool = False,
+):
+    """Like ``build``, but the payload doesn't embed any assets. Returns the
+    payload and a dictionary of the assets it needs, by digest. They must be
+    copied to the asset store on the target before the payload is run."""
+    collector = AssetCollector()
+    data = bundle.dumps(collector)
+    payload = _build(bundle, data, None, name, cache, bytecode, prune)
+    return payload, collector.assets
+
+
+def _build(bundle, data, assets, name, cache, bytecode, prune):
+    payload = None
+    if cache:
+        key = cache.get_key(data, bytecode, prune, assets is not None)
+        payload = cache.get(key)
+
+    if payload is None:
+        buffer = io.BytesIO()
+        bu = Builder.write_to(buffer, bytecode=bytecode)
+        bu.embed_fuselage_runtime(bundle if prune else None)
+        bu.embed_serialized_bundle(data, assets or {})
+        bu.close()
+        for part, totals in sorted(bu.get_size_report().items()):
+            logger.debug(
+                "Payload %s: %d files, %d bytes, %d bytes compressed",
+                part,
+                totals["files"],
+                totals["size"],
+                totals["compressed"],
+            )
+        payload = buffer.getvalue()
+        if cache:
+            cache.put(key, payload)
+
+    buffer = io.BytesIO(payload)
+    buffer.name = name
     return buffer
@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+from concurrent import futures
 import json
 import logging
 
-from fuselage import error, log
+from fuselage import error, graph, jsonstream, log
 from fuselage.resource import Resource, ResourceType
 
 logger = logging.getLogger(__name__)
@@ -48,14 +50,22 @@ class ResourceBundle:
     def clear(self):
         self.resources = []
         self._index_by_id = {}
+        self._index_by_name = {}
+        self._index_by_type = {}
 
     def get_resource_by_name(self, target):
-        for res in self.resources:
-            if res.id == target:
-                return res
-        else:
+        """Return the first resource with the id ``target``, whatever its
+        type"""
+        try:
+            return self._index_by_name[target]
+        except KeyError:
             raise KeyError("No such resource by name '%s'" % target)
 
+    def get_resources_by_type(self, typename):
+        """Return the resources of type ``typename``, in the order they were
+        added"""
+        return list(self._index_by_type.get(typename, ()))
+
     def dump(self, builder, fp):
         obj = self._serialize_bundle(builder)
         json.dump(obj, fp)
@@ -73,8 +83,30 @@ class ResourceBundle:
         return obj
 
     def load(self, fp):
-        obj = json.load(fp)
-        return self._load_bundle(obj)
+        """Load a bundle from a text file object. Resources are created as
+        they are read, rather than after the whole file has been parsed."""
+        stream = jsonstream.JSONStream(fp)
+        header = {}
+        pending = None
+
+        for key in stream.iter_object("Bundle is not a dictionary"):
+            if key != "resources" or stream.peek() != "[":
+                header[key] = stream.value()
+                continue
+
+            header[key] = []
+            items = stream.iter_array("Bundle's resource list is not a list")
+            if "version" in header:
+                self._check_header(header)
+                for resource in items:
+                    self._load_resource(resource)
+            else:
+                # The version decides whether the resources can be loaded
+                pending = list(items)
+
+        self._check_header(header)
+        for resource in pending or ():
+            self._load_resource(resource)
 
     def loads(self, s):
         obj = json.loads(s)
@@ -84,6 +116,12 @@ class ResourceBundle:
         if not isinstance(obj, dict):
             raise error.ParseError("Bundle is not a dictionary")
 
+        self._check_header(obj)
+
+        for resource in obj["resources"]:
+            self._load_resource(resource)
+
+    def _check_header(self, obj):
         if "version" not in obj:
             raise error.ParseError("Bundle version is invalid")
 
@@ -96,22 +134,20 @@ class ResourceBundle:
         if not isinstance(obj["resources"], list):
             raise error.ParseError("Bundle's resource list is not a list")
 
-        for resource in obj["resources"]:
-            if not isinstance(resource, dict):
-                raise error.ParseError("Not a valid resource definition")
+    def _load_resource(self, resource):
+        if not isinstance(resource, dict):
+            raise error.ParseError("Not a valid resource definition")
 
-            if len(resource) != 1:
-                raise error.ParseError(
-                    "Wrong number of keys in outer resource definition"
-                )
+        if len(resource) != 1:
+            raise error.ParseError("Wrong number of keys in outer resource definition")
 
-            typename = list(resource.keys())[0]
-            instances = resource[typename]
-            if isinstance(instances, dict):
-                instances = [instances]
+        typename = list(resource.keys())[0]
+        instances = resource[typename]
+        if isinstance(instances, dict):
+            instances = [instances]
 
-            for instance in instances:
-                self.create(typename, **instance)
+        for instance in instances:
+            self.create(typename, **instance)
 
     def create(self, typename, **kwargs):
         try:
@@ -136,6 +172,8 @@ class ResourceBundle:
         resource.bind(self)
         self.resources.append(resource)
         self._index_by_id[resource.typed_id] = resource
+        self._index_by_name.setdefault(resource.id, resource)
+        self._index_by_type.setdefault(resource.__resource_name__, []).append(resource)
         return resource
 
     def extend(self, iterator):
@@ -157,30 +195,105 @@ class ResourceBundle:
     def apply(self, runner):
         """Apply the resources to the system, using the provided context and
         overall configuration."""
+        self._snapshot_hashes()
+
+        if getattr(runner, "jobs", 1) > 1:
+            something_changed = self._apply_parallel(runner, runner.jobs)
+        else:
+            something_changed = False
+            for i in range(len(self.resources)):
+                if self._apply_resource(runner, i):
+                    something_changed = True
+
+        if not something_changed:
+            raise error.NothingChanged()
+
+    def _snapshot_hashes(self):
         for resource in self.resources:
             if hasattr(resource, "_original_hash"):
                 resource._original_hash = resource.hash()
 
-        something_changed = False
-        mylen = len(self.resources)
-        for i, resource in enumerate(self.resources, start=1):
-            resource_log = log.LoggerAdapter(
-                logger, {"fuselage.resource": resource.typed_id}
-            )
-
-            resource_log.debug(
-                "Started applying '%r' (%d of %d)" % (resource, i, mylen),
-                extra={"fuselage.type": "resource-start"},
-            )
-            try:
-                if resource.apply(runner):
-                    resource_log.debug(f"'{resource!r}' made changes")
-                    something_changed = True
-            finally:
-                resource_log.debug(
-                    f"Finished applying '{resource!r}'",
-                    extra={"fuselage.type": "resource-finish"},
-                )
+    def _get_resource_log(self, i):
+        resource = self.resources[i]
+        resource_log = log.LoggerAdapter(
+            logger, {"fuselage.resource": resource.typed_id}
+        )
+        resource_log.debug(
+            "Started applying '%r' (%d of %d)" % (resource, i + 1, len(self)),
+            extra={"fuselage.type": "resource-start"},
+        )
+        return resource_log
+
+    def _finish_resource(self, resource_log, i, changed):
+        resource = self.resources[i]
+        if changed:
+            resource_log.debug(f"'{resource!r}' made changes")
+        resource_log.debug(
+            f"Finished applying '{resource!r}'",
+            extra={"fuselage.type": "resource-finish"},
+        )
+        return bool(changed)
+
+    def _apply_resource(self, runner, i):
+        resource_log = self._get_resource_log(i)
+        changed = False
+        try:
+            changed = self.resources[i].apply(runner)
+        finally:
+            self._finish_resource(resource_log, i, changed)
+        return bool(changed)
+
+    async def _apply_resource_async(self, runner, i):
+        resource_log = self._get_resource_log(i)
+        changed = False
+        try:
+            changed = await self.resources[i].apply_async(runner)
+        finally:
+            self._finish_resource(resource_log, i, changed)
+        return bool(changed)
+
+    def _apply_parallel(self, runner, jobs):
+        """Apply resources on a pool of ``jobs`` threads, in the order given
+        by ``graph.Schedule``."""
+        schedule = graph.Schedule(graph.DependencyGraph(self.resources), jobs)
+        running = {}
+
+        with futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            while True:
+                for i in schedule.start():
+                    running[pool.submit(self._apply_resource, runner, i)] = i
+
+                if not running:
+                    break
+
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in sorted(done, key=running.get):
+                    schedule.finish(running.pop(future), future)
+
+        return schedule.result()
+
+    async def apply_async(self, runner):
+        """Apply the resources from a coroutine. Up to ``runner.jobs``
+        resources are applied at once, in the same order as ``apply`` with
+        more than one job. Each resource runs in its own task, so resources
+        with a native ``apply_async`` don't need a thread each."""
+        self._snapshot_hashes()
+
+        jobs = getattr(runner, "jobs", 1)
+        schedule = graph.Schedule(graph.DependencyGraph(self.resources), jobs)
+        running = {}
 
-        if not something_changed:
+        while True:
+            for i in schedule.start():
+                task = asyncio.ensure_future(self._apply_resource_async(runner, i))
+                running[task] = i
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=running.get):
+                schedule.finish(running.pop(task), task)
+
+        if not schedule.result():
             raise error.NothingChanged()
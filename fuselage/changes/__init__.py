@@ -15,7 +15,7 @@
 from .attributes import AttributeChanger
 from .directory import EnsureDirectory
 from .execute import ShellCommand
-from .file import EnsureContents, EnsureFile
+from .file import EnsureContents, EnsureFile, StreamedContents
 
 __all__ = [
     "AttributeChanger",
@@ -23,4 +23,5 @@ __all__ = [
     "EnsureDirectory",
     "EnsureFile",
     "ShellCommand",
+    "StreamedContents",
 ]
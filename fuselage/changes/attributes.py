@@ -17,7 +17,7 @@ import stat
 from fuselage import error, platform
 from fuselage.changes import base
 
-from .execute import ShellCommand
+from . import native
 
 
 class AttributeChanger(base.Change):
@@ -57,7 +57,7 @@ class AttributeChanger(base.Change):
                 owner = None
 
             if not owner or owner.pw_uid != uid:
-                context.change(ShellCommand(["chown", self.user, self.filename]))
+                context.change(native.chown(self.filename, self.user))
                 self.changed = True
 
         if self.group is not None:
@@ -70,20 +70,20 @@ class AttributeChanger(base.Change):
                 group = None
 
             if not group or group.gr_gid != gid:
-                context.change(ShellCommand(["chgrp", self.group, self.filename]))
+                context.change(native.chgrp(self.filename, self.group))
                 self.changed = True
 
         if self.mode is not None and mode is not None:
             if mode != self.mode:
-                context.change(ShellCommand(["chmod", "%o" % self.mode, self.filename]))
+                context.change(native.chmod(self.filename, self.mode))
 
                 # Clear the user and group bits
                 # We don't need to set them as chmod will *set* this bits with an octal
                 # but won't clear them without a symbolic mode
                 if mode & stat.S_ISGID and not self.mode & stat.S_ISGID:
-                    context.change(ShellCommand(["chmod", "g-s", self.filename]))
+                    context.change(native.clear_setgid(self.filename))
                 if mode & stat.S_ISUID and not self.mode & stat.S_ISUID:
-                    context.change(ShellCommand(["chmod", "u-s", self.filename]))
+                    context.change(native.clear_setuid(self.filename))
 
                 self.changed = True
 
@@ -16,8 +16,8 @@
 from fuselage import platform
 from fuselage.changes import base
 
+from . import native
 from .attributes import AttributeChanger
-from .execute import ShellCommand
 
 
 class EnsureDirectory(base.Change):
@@ -31,11 +31,7 @@ class EnsureDirectory(base.Change):
     def apply(self, context):
         self.changed = False
         if not platform.exists(self.path):
-            command = ["/bin/mkdir"]
-            if self.recursive:
-                command.append("-p")
-            command.append(self.path)
-            context.change(ShellCommand(command))
+            context.change(native.mkdir(self.path, parents=self.recursive))
             self.changed = True
 
         ac = context.change(
@@ -19,6 +19,28 @@ from fuselage import error, platform
 from fuselage.changes import base
 from fuselage.utils import force_str
 
+# Running any of these discards the snapshot of installed packages that the
+# package providers share during a run
+PACKAGE_MANAGERS = ("apt", "apt-get", "aptitude", "dnf", "dpkg", "rpm", "yum")
+
+# Commands that change the passwd, group or shadow databases. Package
+# managers are included because packages often create system users.
+IDENTITY_COMMANDS = PACKAGE_MANAGERS + (
+    "addgroup",
+    "adduser",
+    "chpasswd",
+    "delgroup",
+    "deluser",
+    "gpasswd",
+    "groupadd",
+    "groupdel",
+    "groupmod",
+    "passwd",
+    "useradd",
+    "userdel",
+    "usermod",
+)
+
 
 class ShellCommand(base.Change):
 
@@ -98,7 +120,22 @@ class ShellCommand(base.Change):
             if platform.exists(os.path.join(path, command[0])):
                 return True
 
-    def apply(self, ctx):
+    def runs_any(self, names):
+        for arg in self.command:
+            for word in force_str(arg).split():
+                if os.path.basename(word) in names:
+                    return True
+        return False
+
+    def runs_package_manager(self):
+        return self.runs_any(PACKAGE_MANAGERS)
+
+    def changes_identities(self):
+        return self.runs_any(IDENTITY_COMMANDS)
+
+    def prepare(self, ctx):
+        """Log the command and check that it can run. Returns False if it
+        shouldn't actually be run, because this is a simulation."""
         command, logas = self.command, self.logas
 
         ctx.changelog.critical("# " + " ".join([force_str(val) for val in logas]))
@@ -128,15 +165,43 @@ class ShellCommand(base.Change):
             self.returncode = 0
             self.stdout = ""
             self.stderr = ""
-            return
+            return False
+
+        return True
+
+    def get_call_options(self, ctx):
+        return {
+            "command": self.command,
+            "user": self.user,
+            "group": self.group,
+            "umask": self.umask,
+            "env": self.env,
+            "cwd": self.cwd,
+            "expected": self.expected,
+            "logger": ctx.changelog,
+        }
+
+    def finish(self, ctx):
+        if self.runs_package_manager():
+            ctx.runner.shared.pop("packages", None)
+        if self.changes_identities():
+            platform.invalidate_identities()
 
-        self.stdout, self.stderr = platform.check_call(
-            command=command,
-            user=self.user,
-            group=self.group,
-            umask=self.umask,
-            env=self.env,
-            cwd=self.cwd,
-            expected=self.expected,
-            logger=ctx.changelog,
-        )
+    def apply(self, ctx):
+        if not self.prepare(ctx):
+            return
+        try:
+            self.stdout, self.stderr = platform.check_call(**self.get_call_options(ctx))
+        finally:
+            self.finish(ctx)
+
+    async def apply_async(self, ctx):
+        """Like ``apply``, but awaits the command on the running event loop"""
+        if not self.prepare(ctx):
+            return
+        try:
+            self.stdout, self.stderr = await platform.async_check_call(
+                **self.get_call_options(ctx)
+            )
+        finally:
+            self.finish(ctx)
@@ -12,34 +12,50 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import difflib
-import string
+import hashlib
+import logging
 
-from fuselage import platform
+from fuselage import diff, fingerprint, log, platform
 from fuselage.changes import base
-from fuselage.utils import force_str
 
 from .attributes import AttributeChanger
 from .execute import ShellCommand
 
 # FIXME: Set mode of file before writing to it
 
-PRINTABLE = string.printable.encode("utf-8")
 
+class StreamedContents:
 
-def binary_buffers(*buffers):
-    """Check all of the passed buffers to see if any of them are binary. If
-    any of them are binary this will return True."""
+    """File contents that are too large to hold in memory. ``opener`` is
+    called whenever the contents need to be read and must return a new binary
+    file object each time."""
 
-    def is_printable(value):
-        return len(buff) == sum(1 for c in buff if c in PRINTABLE)
+    def __init__(self, opener, size):
+        self.opener = opener
+        self.size = size
 
-    for buff in buffers:
-        if not buff:
-            continue
-        if not is_printable(buff):
-            return True
-    return False
+    def open(self):
+        return self.opener()
+
+    def iter_chunks(self, fp):
+        return iter(lambda: fp.read(platform.CHUNK_SIZE), b"")
+
+    def get_digest(self):
+        sha = hashlib.sha1()
+        with self.open() as fp:
+            for chunk in self.iter_chunks(fp):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def matches(self, path):
+        """Compare the contents with the file at ``path`` a chunk at a time"""
+        if platform.stat(path).st_size != self.size:
+            return False
+        with self.open() as fp, platform.get_stream(path) as current:
+            for chunk in self.iter_chunks(fp):
+                if current.read(len(chunk)) != chunk:
+                    return False
+        return True
 
 
 class EnsureContents(base.Change):
@@ -48,28 +64,51 @@ class EnsureContents(base.Change):
     catered for. Additionally the minimum changes required to the contents are
     applied, and logs of the changes made are recorded."""
 
-    def __init__(self, filename, contents, sensitive=False):
+    def __init__(self, filename, contents, sensitive=False, digest=None, current=None):
         self.filename = filename
-        self.current = b""
+        # The existing contents, if the caller has already read them
+        self.current = current
         self.contents = contents
         self.changed = False
         self.sensitive = sensitive
+        self.digest = digest
+
+    @property
+    def streamed(self):
+        return isinstance(self.contents, StreamedContents)
+
+    def get_digest(self):
+        if self.digest is None:
+            if self.streamed:
+                self.digest = self.contents.get_digest()
+            else:
+                self.digest = fingerprint.digest(self.contents)
+        return self.digest
+
+    def get_fingerprints(self, context):
+        return getattr(context.runner, "fingerprints", None)
+
+    def describe(self, previous, replacement):
+        if self.sensitive:
+            return "No diff; sensitive file contents"
+        if self.streamed:
+            return "No diff; file too large"
+        return diff.describe(previous, replacement)
 
     def diff(self, context, note, previous, replacement):
         extra = {}
-        if self.sensitive:
-            extra["fuselage.diff"] = "No diff; sensitive file contents"
-        elif not binary_buffers(previous, replacement):
-            previous = force_str(previous)
-            replacement = force_str(replacement)
-            diff = "".join(
-                difflib.unified_diff(previous.splitlines(1), replacement.splitlines(1))
-            )
-            extra["fuselage.diff"] = diff
-        else:
-            extra["fuselage.diff"] = "No diff; binary files"
+        # Diffing can be slow, so don't bother if it won't be logged
+        if log.is_enabled_for(context.changelog, logging.CRITICAL):
+            extra["fuselage.diff"] = self.describe(previous, replacement)
         context.changelog.critical(note, extra=extra)
 
+    def put(self):
+        if self.streamed:
+            with self.contents.open() as fp:
+                platform.put(self.filename, fp)
+        else:
+            platform.put(self.filename, self.contents)
+
     def empty_file(self, context):
         """Write an empty file if none exists"""
         if not platform.exists(self.filename):
@@ -79,20 +118,39 @@ class EnsureContents(base.Change):
 
     def overwrite_existing_file(self, context):
         """Change the content of an existing file"""
-        self.current = platform.get(self.filename)
-        if self.current != self.contents:
+        fingerprints = self.get_fingerprints(context)
+        if fingerprints and fingerprints.matches(self.filename, self.get_digest()):
+            context.logger.debug(
+                "Not changing content of file %r (fingerprint matches)" % self.filename
+            )
+            return
+
+        if self.streamed:
+            unchanged = self.contents.matches(self.filename)
+        else:
+            if self.current is None:
+                self.current = platform.get(self.filename)
+            unchanged = self.current == self.contents
+
+        if not unchanged:
             self.diff(context, "Changing existing file", self.current, self.contents)
             if not context.simulate:
-                platform.put(self.filename, self.contents)
+                self.put()
             self.changed = True
         else:
             context.logger.debug("Not changing content of file %r" % self.filename)
 
+        if fingerprints and not context.simulate:
+            fingerprints.record(self.filename, self.get_digest())
+
     def write_new_file(self, context):
         """Write contents to a new file."""
         self.diff(context, "Writing new file", b"", self.contents)
         if not context.simulate:
-            platform.put(self.filename, self.contents)
+            self.put()
+            fingerprints = self.get_fingerprints(context)
+            if fingerprints:
+                fingerprints.record(self.filename, self.get_digest())
         self.changed = True
 
     def write_file(self, context):
@@ -111,7 +169,9 @@ class EnsureContents(base.Change):
 
 
 class EnsureFile(base.Change):
-    def __init__(self, filename, contents, user, group, mode, sensitive=False):
+    def __init__(
+        self, filename, contents, user, group, mode, sensitive=False, digest=None
+    ):
         self.filename = filename
         self.contents = contents
         self.user = user
@@ -119,10 +179,13 @@ class EnsureFile(base.Change):
         self.mode = mode
         self.changed = False
         self.sensitive = sensitive
+        self.digest = digest
 
     def apply(self, context):
         """Apply the changes necessary to the file contents."""
-        fc = EnsureContents(self.filename, self.contents, sensitive=self.sensitive)
+        fc = EnsureContents(
+            self.filename, self.contents, sensitive=self.sensitive, digest=self.digest
+        )
         context.change(fc)
 
         ac = AttributeChanger(self.filename, self.user, self.group, self.mode)
@@ -0,0 +1,136 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import stat
+
+from fuselage import error, platform
+from fuselage.utils import force_str
+
+from .execute import ShellCommand
+
+
+class NativeCommand(ShellCommand):
+
+    """A filesystem change that is logged as the shell command it replaces.
+
+    When the runner has native changes enabled ``function`` is called in
+    process instead of forking the command, otherwise the command is run as
+    before. Either way the changelog sees the same line, so audit logs don't
+    depend on how a change was made."""
+
+    def __init__(self, command, function, *args):
+        super().__init__(command)
+        self.function = function
+        self.args = args
+
+    def apply(self, ctx):
+        if not getattr(ctx.runner, "native", False):
+            return super().apply(ctx)
+
+        ctx.changelog.critical("# " + " ".join(force_str(val) for val in self.logas))
+
+        self.returncode = 0
+        self.stdout = ""
+        self.stderr = ""
+
+        if ctx.simulate:
+            return
+
+        try:
+            self.function(*self.args)
+        except OSError as e:
+            self.returncode = e.errno
+            self.stderr = str(e)
+            raise error.SystemError(e.errno, self.stdout, self.stderr)
+
+
+def _get_uid(user):
+    if user.isdigit():
+        return int(user)
+    return platform.getpwnam(user).pw_uid
+
+
+def _get_gid(group):
+    if group.isdigit():
+        return int(group)
+    return platform.getgrnam(group).gr_gid
+
+
+def _chown(path, user, group, follow_symlinks):
+    uid = _get_uid(user) if user else -1
+    gid = _get_gid(group) if group else -1
+    platform.chown(path, uid, gid, follow_symlinks=follow_symlinks)
+
+
+def _clear_mode_bits(path, bits):
+    mode = stat.S_IMODE(platform.stat(path).st_mode)
+    platform.chmod(path, mode & ~bits)
+
+
+def _remove(path):
+    if platform.isdir(path) and not platform.islink(path):
+        platform.rmtree(path)
+    elif platform.lexists(path):
+        platform.unlink(path)
+
+
+def chown(path, user, follow_symlinks=True):
+    if follow_symlinks:
+        return NativeCommand(["chown", user, path], _chown, path, user, None, True)
+    return NativeCommand(
+        ["/bin/chown", "-h", user, path], _chown, path, user, None, False
+    )
+
+
+def chgrp(path, group, follow_symlinks=True):
+    if follow_symlinks:
+        return NativeCommand(["chgrp", group, path], _chown, path, None, group, True)
+    return NativeCommand(
+        ["/bin/chgrp", "-h", group, path], _chown, path, None, group, False
+    )
+
+
+def chmod(path, mode):
+    return NativeCommand(["chmod", "%o" % mode, path], platform.chmod, path, mode)
+
+
+def clear_setgid(path):
+    return NativeCommand(["chmod", "g-s", path], _clear_mode_bits, path, stat.S_ISGID)
+
+
+def clear_setuid(path):
+    return NativeCommand(["chmod", "u-s", path], _clear_mode_bits, path, stat.S_ISUID)
+
+
+def mkdir(path, parents=False):
+    if parents:
+        return NativeCommand(["/bin/mkdir", "-p", path], platform.makedirs, path)
+    return NativeCommand(["/bin/mkdir", path], platform.mkdir, path)
+
+
+def rmdir(path):
+    return NativeCommand(["/bin/rmdir", path], platform.rmdir, path)
+
+
+def remove(path, command=None):
+    command = list(command or ["/bin/rm"])
+    return NativeCommand(command + [path], platform.unlink, path)
+
+
+def remove_recursive(path):
+    return NativeCommand(["/bin/rm", "-rf", path], _remove, path)
+
+
+def symlink(to, path):
+    return NativeCommand(["/bin/ln", "-s", to, path], platform.symlink, to, path)
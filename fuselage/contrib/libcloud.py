@@ -23,8 +23,9 @@ from fuselage.bundle import ResourceBundle
 
 
 class FuselageDeployment(deployment.Deployment):
-    def __init__(self, bundle=None, resources=None):
+    def __init__(self, bundle=None, resources=None, cache=None):
         self.bundle = bundle
+        self.cache = cache
 
         if not self.bundle:
             self.bundle = ResourceBundle()
@@ -36,7 +37,7 @@ class FuselageDeployment(deployment.Deployment):
         random_string = binascii.hexlify(os.urandom(4)).decode("ascii")
         name = "fuselage_%s" % (random_string)
 
-        bu = builder.build(self.bundle)
+        bu = builder.build(self.bundle, cache=self.cache)
 
         file_path = client.put(path=name, chmod=0o755, contents=bu.getvalue())
         self.stdout, self.stderr, self.exit_status = client.run(file_path)
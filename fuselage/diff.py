@@ -0,0 +1,74 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import difflib
+import itertools
+
+from fuselage.utils import force_bytes
+
+# Only this much of a buffer is inspected when deciding if it is binary
+SNIFF_SIZE = 8192
+
+# Files bigger than this aren't diffed at all
+MAX_DIFF_SIZE = 512 * 1024
+
+# Diffs longer than this are truncated
+MAX_DIFF_LINES = 1000
+
+
+def is_binary(contents):
+    """Guess whether ``contents`` is binary by looking for NUL bytes or
+    invalid UTF-8 near the start of it."""
+    prefix = force_bytes(contents)[:SNIFF_SIZE]
+    if b"\0" in prefix:
+        return True
+    try:
+        prefix.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # The prefix may have cut a multibyte character in half
+        return e.reason != "unexpected end of data"
+    return False
+
+
+def binary_buffers(*buffers):
+    """Check all of the passed buffers to see if any of them are binary. If
+    any of them are binary this will return True."""
+    return any(is_binary(buff) for buff in buffers if buff)
+
+
+def unified_diff(previous, replacement, max_lines=MAX_DIFF_LINES):
+    """Return a unified diff between two buffers of text, truncated to
+    ``max_lines`` lines."""
+    previous = force_bytes(previous).decode("utf-8", "replace")
+    replacement = force_bytes(replacement).decode("utf-8", "replace")
+    lines = difflib.unified_diff(
+        previous.splitlines(True), replacement.splitlines(True)
+    )
+    diff = "".join(itertools.islice(lines, max_lines))
+    if next(lines, None) is not None:
+        if not diff.endswith("\n"):
+            diff += "\n"
+        diff += "... diff truncated after %d lines\n" % max_lines
+    return diff
+
+
+def describe(previous, replacement):
+    """Return the text to log for a change from ``previous`` to
+    ``replacement``: either a bounded diff or a note saying why there isn't
+    one."""
+    if max(len(previous), len(replacement)) > MAX_DIFF_SIZE:
+        return "No diff; file too large"
+    if binary_buffers(previous, replacement):
+        return "No diff; binary files"
+    return unified_diff(previous, replacement)
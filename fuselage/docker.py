@@ -36,6 +36,7 @@ class DockerBuilder:
         ports=None,
         cmd=None,
         maintainer=None,
+        cache=None,
     ):
         self.bundle = bundle
         self.from_image = from_image
@@ -45,6 +46,7 @@ class DockerBuilder:
         self.ports = ports or []
         self.cmd = cmd
         self.maintainer = maintainer
+        self.cache = cache
 
     def get_dockerfile(self):
         df = [
@@ -96,7 +98,7 @@ class DockerBuilder:
             ti.mode = mode
             tar.addfile(tarinfo=ti, fileobj=buf)
 
-        add("payload.pex", build(self.bundle), mode=0o755)
+        add("payload.pex", build(self.bundle, cache=self.cache), mode=0o755)
         add("Dockerfile", io.BytesIO(self.get_dockerfile()))
 
         tar.close()
@@ -14,6 +14,7 @@
 
 import json
 import os
+import threading
 
 from fuselage import error, platform
 from fuselage.utils import force_str
@@ -28,6 +29,13 @@ class EventState:
     doesn't rely on this to know if it's applied your changes. It relies on it
     on it to keep track of watch triggers.
 
+    The state file is a journal with one JSON document per line. A line can
+    be a snapshot of all the overrides (which is also the format of the whole
+    file written by older versions) or a ``["set", id]`` or ``["unset", id]``
+    record, so changing a trigger only appends a line. The journal is
+    rewritten as a single snapshot when it gets long, or if the last line
+    was torn by a crash.
+
     For example, if you make a change to a File, fuselage doesn't need this
     state data to make sure the file is updated. But if you have an Execute
     that watches the File then this state date will ensure the Execute is
@@ -38,38 +46,78 @@ class EventState:
     """ A mapping of resource ids to the overridden policy name for that
     resource, if there is one. """
 
+    compact_after = 1000
+    """ The number of journal lines after which the journal is rewritten as a
+    snapshot. """
+
     def __init__(self, save_file, simulate, load=False):
         self.save_file = save_file
         self.simulate = simulate
         self.loaded = not load
         self.overrides = {}
+        self.records = 0
+        self.terminated = True
         self.simulate = simulate
+        self.lock = threading.RLock()
 
         # FIXME
         self.resume = True
         self.no_resume = False
 
+    def replay(self, journal):
+        """Rebuild the overrides from the lines of a journal. Returns False if
+        the journal ended with a torn write."""
+        self.overrides = {}
+        self.records = 0
+        lines = journal.split("\n")
+        for i, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if i == len(lines) - 1:
+                    return False
+                raise
+            if isinstance(record, dict):
+                self.overrides = record
+            elif record[0] == "set":
+                self.overrides[record[1]] = "*"
+            elif record[0] == "unset":
+                self.overrides.pop(record[1], None)
+            self.records += 1
+        return True
+
     def load(self):
         if self.loaded:
             return
         if platform.exists(self.save_file):
-            self.overrides = json.loads(force_str(platform.get(self.save_file)))
+            journal = force_str(platform.get(self.save_file))
+            intact = self.replay(journal)
+            if not intact or self.records > self.compact_after:
+                self.compact()
+            else:
+                # Older versions didn't end the file with a newline
+                self.terminated = not journal or journal.endswith("\n")
         self.loaded = True
 
     def set_trigger(self, resource):
-        self.load()
-        self.overrides[resource.id] = "*"
-        self.save()
+        with self.lock:
+            self.load()
+            self.overrides[resource.id] = "*"
+            self.record("set", resource.id)
 
     def unset_trigger(self, resource):
-        self.load()
-        if resource.id in self.overrides:
-            del self.overrides[resource.id]
-            self.save()
+        with self.lock:
+            self.load()
+            if resource.id in self.overrides:
+                del self.overrides[resource.id]
+                self.record("unset", resource.id)
 
     def is_trigger_set(self, resource):
-        self.load()
-        return resource.id in self.overrides
+        with self.lock:
+            self.load()
+            return resource.id in self.overrides
 
     def open(self):
         if not self.simulate:
@@ -95,6 +143,26 @@ class EventState:
         if not self.simulate and platform.exists(self.save_file):
             platform.unlink(self.save_file)
 
+    def record(self, action, resource_id):
+        if self.simulate:
+            return
+        if self.records >= self.compact_after:
+            self.compact()
+            return
+        line = json.dumps([action, resource_id]) + "\n"
+        if not self.terminated:
+            line = "\n" + line
+        platform.append(self.save_file, line)
+        self.terminated = True
+        self.records += 1
+
+    def compact(self):
+        """Replace the journal with a snapshot of the current overrides"""
+        if self.simulate:
+            return
+        platform.put(self.save_file, json.dumps(self.overrides) + "\n")
+        self.terminated = True
+        self.records = 1
+
     def save(self):
-        if not self.simulate:
-            platform.put(self.save_file, json.dumps(self.overrides))
+        self.compact()
@@ -0,0 +1,89 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+
+from fuselage import platform
+from fuselage.utils import force_bytes, force_str
+
+
+def digest(contents):
+    """The digest used to identify file contents. This matches the names of
+    assets embedded in a bundle."""
+    return hashlib.sha1(force_bytes(contents)).hexdigest()
+
+
+class FingerprintCache:
+
+    """
+    Remembers the digest of files that fuselage has written or checked.
+
+    Each entry is keyed by path and records the inode, size and modification
+    time of the file when its digest was taken. If the file still has the
+    same stat fingerprint on a later run its contents can be confirmed
+    without reading it.
+
+    A file changed without touching its size or mtime (for example by a tool
+    that restores timestamps) won't be noticed, which is why this is opt-in.
+    """
+
+    def __init__(self, save_file, simulate):
+        self.save_file = save_file
+        self.simulate = simulate
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        if not platform.exists(self.save_file):
+            return
+        try:
+            self.entries = json.loads(force_str(platform.get(self.save_file)))
+        except ValueError:
+            # A corrupt cache only costs us some reads
+            self.entries = {}
+
+    def save(self):
+        if self.simulate or not self.dirty:
+            return
+        platform.put(self.save_file, json.dumps(self.entries))
+        self.dirty = False
+
+    def get_fingerprint(self, path):
+        st = platform.stat(path)
+        return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    def matches(self, path, expected):
+        """Returns True if the file at ``path`` is known to have the digest
+        ``expected``, based only on its stat fingerprint."""
+        entry = self.entries.get(path)
+        if not entry or entry["digest"] != expected:
+            return False
+        try:
+            return entry["stat"] == self.get_fingerprint(path)
+        except OSError:
+            return False
+
+    def record(self, path, digest):
+        try:
+            fingerprint = self.get_fingerprint(path)
+        except OSError:
+            self.forget(path)
+            return
+        self.entries[path] = {"stat": fingerprint, "digest": digest}
+        self.dirty = True
+
+    def forget(self, path):
+        if self.entries.pop(path, None) is not None:
+            self.dirty = True
@@ -0,0 +1,192 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import posixpath
+
+from fuselage.argument import FullPath
+
+# Resources whose side effects can't be inferred from their arguments. They
+# are applied after everything declared before them, and everything declared
+# after them waits for them.
+BARRIER_TYPES = ("Execute", "Mount", "Package", "Service", "Special")
+
+# Resources that all edit the same passwd and group databases.
+IDENTITY_TYPES = ("User", "Group")
+
+# Arguments that name a user or group which may be created by the bundle.
+USER_ARGUMENTS = ("owner", "user")
+GROUP_ARGUMENTS = ("group",)
+
+
+def get_paths(resource):
+    """Return the normalized filesystem paths that a resource touches"""
+    paths = []
+    for name, arg in resource.__args__.items():
+        if not isinstance(arg, FullPath):
+            continue
+        value = getattr(resource, name)
+        if value:
+            paths.append(posixpath.normpath(value))
+    return paths
+
+
+def iter_ancestors(path):
+    """Yield a path and each of its parents, ending at the root"""
+    while True:
+        yield path
+        parent = posixpath.dirname(path)
+        if parent == path:
+            return
+        path = parent
+
+
+class DependencyGraph:
+
+    """The ordering constraints between the resources of a bundle.
+
+    A resource depends on an earlier resource when:
+
+    * One of their paths contains the other (a File under a Directory).
+    * It watches it, or it is the implicit File for one of its ``changes``.
+    * It refers to a User or Group that the earlier resource manages.
+    * Either of them is a barrier, or both edit the user databases.
+
+    Resources with no path between them may be applied concurrently.
+    """
+
+    def __init__(self, resources):
+        self.resources = list(resources)
+        self.dependencies = [set() for r in self.resources]
+        self.dependents = [set() for r in self.resources]
+        self._build()
+
+    def _build(self):
+        index = {r: i for i, r in enumerate(self.resources)}
+        implicit = {}
+        by_path = {}
+        by_subtree = {}
+        identities = {}
+        since_barrier = []
+        last_barrier = None
+        last_identity = None
+
+        for i, resource in enumerate(self.resources):
+            deps = self.dependencies[i]
+            typename = resource.__resource_name__
+
+            if typename in BARRIER_TYPES:
+                deps.update(since_barrier)
+                if last_barrier is not None:
+                    deps.add(last_barrier)
+                last_barrier = i
+                since_barrier = []
+            else:
+                if last_barrier is not None:
+                    deps.add(last_barrier)
+                since_barrier.append(i)
+
+            if typename in IDENTITY_TYPES:
+                if last_identity is not None:
+                    deps.add(last_identity)
+                last_identity = i
+                identities[f"{typename}[{resource.id}]"] = i
+
+            for name in USER_ARGUMENTS:
+                self._depend_on_identity(deps, identities, resource, name, "User")
+            for name in GROUP_ARGUMENTS:
+                self._depend_on_identity(deps, identities, resource, name, "Group")
+
+            for path in get_paths(resource):
+                deps.update(by_subtree.get(path, ()))
+                for ancestor in iter_ancestors(path):
+                    deps.update(by_path.get(ancestor, ()))
+                    by_subtree.setdefault(ancestor, []).append(i)
+                by_path.setdefault(path, []).append(i)
+
+            # Watchers are always declared after the resource they watch
+            for observer in resource.observers:
+                if observer in index:
+                    self.dependencies[index[observer]].add(i)
+
+            for watched in resource.changes:
+                if watched in implicit:
+                    deps.add(implicit[watched])
+
+            if getattr(resource, "_implicit", False):
+                implicit[resource.name] = i
+
+            deps.discard(i)
+            for j in deps:
+                self.dependents[j].add(i)
+
+    def _depend_on_identity(self, deps, identities, resource, name, typename):
+        if name not in resource.__args__ or typename == resource.__resource_name__:
+            return
+        value = getattr(resource, name)
+        if value and f"{typename}[{value}]" in identities:
+            deps.add(identities[f"{typename}[{value}]"])
+
+
+class Schedule:
+
+    """The order in which the resources of a DependencyGraph are started when
+    up to ``jobs`` of them are applied at once.
+
+    A resource is ready once everything it depends on has finished, and ready
+    resources are started in the order they were declared. After a failure no
+    new resources are started, and the first error is raised by ``result``
+    once the running ones have finished."""
+
+    def __init__(self, dependencies, jobs):
+        self.dependencies = dependencies
+        self.jobs = max(jobs, 1)
+        self.waiting = [len(deps) for deps in dependencies.dependencies]
+        self.ready = [i for i, count in enumerate(self.waiting) if count == 0]
+        heapq.heapify(self.ready)
+        self.running = set()
+        self.changed = False
+        self.failure = None
+
+    def start(self):
+        """Return the resources that can be started now"""
+        started = []
+        while self.ready and self.failure is None and len(self.running) < self.jobs:
+            i = heapq.heappop(self.ready)
+            self.running.add(i)
+            started.append(i)
+        return started
+
+    def finish(self, i, future):
+        """Record the outcome of resource ``i`` from its completed future or
+        task"""
+        self.running.discard(i)
+        try:
+            if future.result():
+                self.changed = True
+        except Exception as e:
+            if self.failure is None:
+                self.failure = e
+            return
+
+        for j in self.dependencies.dependents[i]:
+            self.waiting[j] -= 1
+            if self.waiting[j] == 0:
+                heapq.heappush(self.ready, j)
+
+    def result(self):
+        """Return whether any resource made changes"""
+        if self.failure is not None:
+            raise self.failure
+        return self.changed
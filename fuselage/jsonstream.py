@@ -0,0 +1,122 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import re
+
+from fuselage import error
+
+# How much to read from the file at a time
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JSONStream:
+
+    """
+    Reads a JSON document from a text file one value at a time, so that the
+    items of a large array can be handled as they arrive rather than after
+    the whole document has been parsed.
+
+    Only as much of the file as the current value needs is kept in memory.
+    When a value is incomplete the amount read next is doubled, so a large
+    value is parsed a logarithmic number of times rather than once per
+    chunk.
+    """
+
+    def __init__(self, fp, chunk_size=None):
+        self.fp = fp
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        data = self.fp.read(size)
+        if not data:
+            self.eof = True
+            return
+        pos = self.pos
+        self.buffer = self.buffer[pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        """Return the next character that isn't whitespace, without consuming
+        it, or an empty string at the end of the file"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                return ""
+            self._fill(self.chunk_size)
+
+    def expect(self, char, message):
+        if self.peek() != char:
+            raise error.ParseError(message)
+        self.pos += 1
+
+    def accept(self, char):
+        """Consume ``char`` if it is next, and return whether it was"""
+        if self.peek() != char:
+            return False
+        self.pos += 1
+        return True
+
+    def value(self):
+        """Parse and return the next complete value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next
+                # chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return obj
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def iter_array(self, message):
+        """Yield each item of the array that comes next"""
+        self.expect("[", message)
+        if self.accept("]"):
+            return
+        while True:
+            yield self.value()
+            if self.accept("]"):
+                return
+            self.expect(",", message)
+
+    def iter_object(self, message):
+        """Yield the key of each member of the object that comes next. The
+        caller must consume the member's value before asking for the next
+        key."""
+        self.expect("{", message)
+        if self.accept("}"):
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise error.ParseError(message)
+            self.expect(":", message)
+            yield key
+            if self.accept("}"):
+                return
+            self.expect(",", message)
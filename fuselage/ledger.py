@@ -0,0 +1,128 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import stat
+import threading
+
+from fuselage import platform
+from fuselage.utils import force_bytes, force_str
+
+IDENTITY_FILES = ("/etc/passwd", "/etc/shadow", "/etc/group", "/etc/gshadow")
+
+
+def observe_path(path, follow_symlinks=True):
+    """A cheap fingerprint of whatever is at ``path``, or None if there is
+    nothing there. The size and mtime of directories are left out, as they
+    change whenever anything is added to them."""
+    try:
+        if follow_symlinks:
+            st = platform.stat(path)
+        else:
+            st = platform.lstat(path)
+    except OSError:
+        return None
+    observed = [st.st_mode, st.st_uid, st.st_gid, st.st_ino]
+    if not stat.S_ISDIR(st.st_mode):
+        observed.extend((st.st_size, st.st_mtime_ns))
+    return observed
+
+
+def observe_identities():
+    """A fingerprint of the user and group databases"""
+    return [observe_path(path) for path in IDENTITY_FILES]
+
+
+def read_file(path):
+    """The stripped contents of a small file, or None if it can't be read"""
+    try:
+        return force_str(platform.get(path)).strip()
+    except OSError:
+        return None
+
+
+def get_definition(resource, provider):
+    """A digest of everything the bundle says about a resource"""
+    definition = [type(provider).__name__, resource.serialize()]
+    encoded = json.dumps(definition, sort_keys=True, default=str)
+    return hashlib.sha1(force_bytes(encoded)).hexdigest()
+
+
+class Ledger:
+
+    """
+    Remembers the definition of each resource that was applied and a
+    fingerprint of the state it left behind, so an incremental run can skip
+    resources that haven't changed since.
+
+    The fingerprint comes from ``Provider.fingerprint``. Providers that can't
+    observe their state cheaply return None and are always applied.
+
+    Like the fingerprint cache, this trusts that anything that changes a
+    resource behind fuselage's back also changes its fingerprint, which is
+    why it is opt-in.
+    """
+
+    def __init__(self, save_file, simulate):
+        self.save_file = save_file
+        self.simulate = simulate
+        self.entries = {}
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.seen = set()
+        if not platform.exists(self.save_file):
+            return
+        try:
+            self.entries = json.loads(force_str(platform.get(self.save_file)))
+        except ValueError:
+            self.entries = {}
+
+    def save(self):
+        if self.simulate:
+            return
+        # Forget resources that are no longer in the bundle
+        entries = {k: v for k, v in self.entries.items() if k in self.seen}
+        platform.put(self.save_file, json.dumps(entries))
+
+    def is_current(self, resource, provider):
+        """Returns True if ``resource`` was applied by an earlier run and
+        neither its definition nor its fingerprint have changed since."""
+        with self.lock:
+            self.seen.add(resource.typed_id)
+            entry = self.entries.get(resource.typed_id)
+        if not entry or entry["definition"] != get_definition(resource, provider):
+            return False
+        fingerprint = provider.fingerprint()
+        if fingerprint is None:
+            return False
+        # Round trip so tuples compare equal to the lists that were loaded
+        return json.loads(json.dumps(fingerprint)) == entry["fingerprint"]
+
+    def record(self, resource, provider):
+        """Remember the state ``resource`` was left in by its provider"""
+        if self.simulate:
+            return
+        fingerprint = provider.fingerprint()
+        with self.lock:
+            self.seen.add(resource.typed_id)
+            if fingerprint is None:
+                self.entries.pop(resource.typed_id, None)
+                return
+            self.entries[resource.typed_id] = {
+                "definition": get_definition(resource, provider),
+                "fingerprint": fingerprint,
+            }
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 
+import contextvars
 import json
 import logging
 import logging.handlers
@@ -54,12 +55,27 @@ class ResourceFormatter(logging.Formatter):
 
 
 class ConsoleHandler(logging.StreamHandler):
+
+    """
+    Render log messages grouped under a header for the resource that emitted
+    them. The current resource is tracked per thread and per asyncio task, so
+    when resources are applied concurrently a new header is rendered whenever
+    the output switches from one resource to another.
+    """
+
     def __init__(self, stream=sys.stdout, level=logging.INFO):
         super().__init__(stream)
         self._level = level
-        self._resource = None
-        self._needs_footer = False
-        self._needs_header = False
+        self._current = contextvars.ContextVar("current", default=(None, None))
+        self._rendered = None
+
+    @property
+    def _resource(self):
+        return self._current.get()[0]
+
+    @property
+    def _token(self):
+        return self._current.get()[1]
 
     def format(self, record):
         prefix = "| " if self._resource else ""
@@ -85,30 +101,34 @@ class ConsoleHandler(logging.StreamHandler):
             "/{} {} {}\n".format("-" * minuses, header, "-" * (minuses + leftover))
         )
 
-        self._needs_header = False
-        self._needs_footer = True
+        self._rendered = self._token
 
     def _render_resource_footer(self):
         self.stream.write("\\{}\n\n".format("-" * 79))
-        self._needs_footer = False
+        self._rendered = None
 
     def handle(self, record):
         record_type = getattr(record, "fuselage.type", None)
         next_resource = getattr(record, "fuselage.resource", None)
 
-        if record_type == "resource-start":
-            self._resource = next_resource
-            self._needs_header = True
+        self.acquire()
+        try:
+            if record_type == "resource-start":
+                self._current.set((next_resource, object()))
 
-        if record.levelno >= self._level:
-            if self._resource and self._needs_header:
-                self._render_resource_header()
-            super().handle(record)
+            if record.levelno >= self._level:
+                if self._resource and self._rendered is not self._token:
+                    if self._rendered is not None:
+                        self._render_resource_footer()
+                    self._render_resource_header()
+                super().handle(record)
 
-        if record_type == "resource-finish":
-            if self._needs_footer:
-                self._render_resource_footer()
-            self._resource = None
+            if record_type == "resource-finish":
+                if self._resource and self._rendered is self._token:
+                    self._render_resource_footer()
+                self._current.set((None, None))
+        finally:
+            self.release()
 
 
 class JSONHandler(logging.StreamHandler):
@@ -136,6 +156,33 @@ class SysLogHandler(logging.handlers.SysLogHandler):
         return 1
 
 
+def is_enabled_for(logger, level):
+    """Returns True if a record logged at ``level`` to ``logger`` would be
+    emitted by at least one handler. This is used to skip building messages
+    that are expensive to render (like diffs) when nobody will see them."""
+    while isinstance(logger, logging.LoggerAdapter):
+        logger = logger.logger
+
+    if not logger.isEnabledFor(level):
+        return False
+
+    found = False
+    current = logger
+    while current:
+        for handler in current.handlers:
+            found = True
+            # ConsoleHandler filters on its own threshold
+            if level >= max(handler.level, getattr(handler, "_level", 0)):
+                return True
+        if not current.propagate:
+            break
+        current = current.parent
+
+    if not found and logging.lastResort:
+        return level >= logging.lastResort.level
+    return False
+
+
 def configure(verbosity=logging.INFO, json=False, force=False):
     root = logging.getLogger()
     root.setLevel(logging.DEBUG)
@@ -12,12 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import contextlib
 import errno
+import json
 import os
-import select
+import selectors
+import shutil
+import stat as stat_module
 import subprocess
 import sys
 import threading
+import uuid
 
 from fuselage import error
 from fuselage.utils import force_bytes, force_str
@@ -39,23 +45,60 @@ except ImportError:  # pragma: no cover
 platform = sys.platform
 pathsep = os.pathsep
 
+# How much of a file to hold in memory at once when copying it
+CHUNK_SIZE = 1024 * 1024
+
+# Before Python 3.9 a change of user, group or umask needs a preexec_fn, which
+# runs python code in the forked child. That isn't safe while other threads
+# are forking too, so with --jobs those spawns are made one at a time.
+_preexec_lock = threading.Lock()
+
+
+def _spawn_lock(kwargs):
+    if "preexec_fn" in kwargs:
+        return _preexec_lock
+    return contextlib.nullcontext()
+
+
+def _has_inheritable_fds():
+    """Return whether this process has inheritable descriptors other than
+    stdin, stdout and stderr, which a child would inherit unless
+    ``close_fds`` is set"""
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return True
+    for fd in map(int, fds):
+        if fd <= 2:
+            continue
+        try:
+            if os.get_inheritable(fd):
+                return True
+        except OSError:
+            # The descriptor listdir used, which is already closed
+            continue
+    return False
+
 
 class Handle:
 
     LF = force_bytes(os.linesep)
     CR = b"\r"
 
+    # How much to read from a pipe at a time
+    READ_SIZE = 64 * 1024
+
     def __init__(self, handle, callback=None):
         self.handle = handle
         self.callback = callback
         self._output = []
-        self._buffer = b""
+        self._buffer = bytearray()
 
     def fileno(self):
         return self.handle.fileno()
 
     def read(self):
-        data = os.read(self.fileno(), 1024)
+        data = os.read(self.fileno(), self.READ_SIZE)
         if not data:
             self.flush()
             self.handle.close()
@@ -68,23 +111,33 @@ class Handle:
     def flush(self):
         self.feed(b"")
         if self._buffer:
-            self.feed_line(self._buffer)
-            self._buffer = b""
+            self.feed_line(bytes(self._buffer))
+            self._buffer = bytearray()
 
     def feed(self, data):
-        data = self._buffer + data
-
-        while self.LF in data:
-            line, data = data.split(self.LF, 1)
-            self.feed_line(line)
+        buffer = self._buffer
+        # Whatever is left in the buffer has no LF or CR in it, so only the
+        # new data needs searching. This keeps long lines linear.
+        scan = max(len(buffer) - len(self.LF) + 1, 0)
+        buffer += data
+
+        start = 0
+        end = buffer.find(self.LF, scan)
+        while end != -1:
+            self.feed_line(bytes(buffer[start:end]))
+            start = end + len(self.LF)
+            end = buffer.find(self.LF, start)
 
         # Deal with \r
         # IGNORE THIS\rPRINT THIS\rTHIS IS HALF A LINE
-        line, _, self._buffer = data.rpartition(self.CR)
-        ignore, _, line = line.strip().rpartition(self.CR)
-        if line:
-            self.feed_line(line)
-
+        end = buffer.rfind(self.CR, max(start, scan))
+        if end != -1:
+            ignore, _, line = bytes(buffer[start:end]).strip().rpartition(self.CR)
+            if line:
+                self.feed_line(line)
+            start = end + len(self.CR)
+
+        del buffer[:start]
         return True
 
     def feed_line(self, line):
@@ -116,12 +169,59 @@ class Process(subprocess.Popen):
         self.umask = umask
 
         if platform != "win32":
-            kwargs["preexec_fn"] = self.preexec
+            self.set_launch_options(command, kwargs)
         if "stdout" not in kwargs:
             kwargs["stdout"] = subprocess.PIPE
         if "stderr" not in kwargs:
             kwargs["stderr"] = subprocess.PIPE
-        super().__init__(command, **kwargs)
+        with _spawn_lock(kwargs):
+            super().__init__(command, **kwargs)
+
+    @classmethod
+    def get_launch_options(
+        cls, command, user=None, uid=None, gid=None, group=None, umask=None, **kwargs
+    ):
+        """Return the Popen keyword arguments that would be used to launch
+        ``command``, for callers that start the process some other way."""
+        launcher = cls.__new__(cls)
+        launcher.uid = pwd.getpwnam(user).pw_uid if user and pwd else uid
+        launcher.gid = grp.getgrnam(group).gr_gid if group and grp else gid
+        launcher.umask = umask
+        if platform != "win32":
+            launcher.set_launch_options(command, kwargs)
+        return kwargs
+
+    def set_launch_options(self, command, kwargs):
+        """Avoid a preexec_fn where we can. Running python code in the child
+        forces a full fork of this process, whereas subprocess can otherwise
+        use vfork or posix_spawn."""
+        if sys.version_info < (3, 9):
+            if self.uid or self.gid or self.umask:
+                kwargs["preexec_fn"] = self.preexec
+            return
+
+        if self.gid and {self.gid} != {os.getgid(), os.getegid()}:
+            kwargs["group"] = self.gid
+        if self.uid and {self.uid} != {os.getuid(), os.geteuid()}:
+            kwargs["user"] = self.uid
+        if self.umask:
+            kwargs["umask"] = self.umask
+        if {"group", "user", "umask"} & set(kwargs) or kwargs.get("cwd"):
+            return
+
+        # posix_spawn is only used when the executable is a path and
+        # inherited file descriptors don't need closing. That is only safe
+        # while nothing in this process has made a descriptor inheritable.
+        if kwargs.get("pass_fds") or _has_inheritable_fds():
+            return
+        if kwargs.get("shell"):
+            kwargs.setdefault("close_fds", False)
+        elif isinstance(command, list) and "executable" not in kwargs:
+            path = kwargs.get("env", {}).get("PATH")
+            executable = shutil.which(command[0], path=path)
+            if executable:
+                kwargs["executable"] = executable
+                kwargs.setdefault("close_fds", False)
 
     def preexec(self):
         if self.gid:
@@ -166,35 +266,34 @@ class Process(subprocess.Popen):
         self.wait()
 
     def communicate_posix(self, stdout, stderr):
-        # Initial readlist is any handle that is valid
-        readlist = [h for h in (stdout, stderr) if h.isready()]
+        with selectors.DefaultSelector() as selector:
+            # Watch any handle that is valid
+            for handle in (stdout, stderr):
+                if handle.isready():
+                    selector.register(handle, selectors.EVENT_READ)
 
-        while readlist:
-            try:
+            while selector.get_map():
                 # Wait for data on stdout or stderr handles, but timeout after
                 # one second so that we can poll (below) and check the process
                 # hasn't disappeared.
-                rlist, wlist, xlist = select.select(readlist, [], [], 1)
-            except OSError as e:
-                if e.args[0] == errno.EINTR:
+                events = selector.select(timeout=1)
+
+                # Some processes hang if we don't specifically poll for them
+                # going away. We believe that under certain cases, child
+                # processes can reuse their parent's file descriptors, and in
+                # that case, the select loop will continue until the child
+                # process goes away, which is undesirable when starting a
+                # daemon process.
+                if not events:
+                    if self.poll() is not None:
+                        break
                     continue
-                raise
-
-            # Some processes hang if we don't specifically poll for them going
-            # away. We believe that under certain cases, child processes can
-            # reuse their parent's file descriptors, and in that case, the
-            # select loop will continue until the child process goes away, which
-            # is undesirable when starting a daemon process.
-            if not rlist and not wlist and not xlist:
-                if self.poll() is not None:
-                    break
-
-            # Read from all handles that select told us can be read from
-            # If they return false then we are at the end of the stream
-            # and stop reading from them
-            for r in rlist:
-                if not r.read():
-                    readlist.remove(r)
+
+                # Read from all handles that are ready. If they return false
+                # then we are at the end of the stream and stop watching them
+                for key, mask in events:
+                    if not key.fileobj.read():
+                        selector.unregister(key.fileobj)
 
     def communicate(self, input=None):
         stdout = Handle(self.stdout, self.callback)
@@ -218,14 +317,118 @@ class Process(subprocess.Popen):
         return stdout.output, stderr.output
 
 
-def check_call(command, *args, **kwargs):
-    logger = kwargs.pop("logger", None)
-    expected = kwargs.pop("expected", 0)
-    encoding = kwargs.pop("encoding", "UTF-8")
-    stdin = kwargs.pop("stdin", None)
-    kwargs["stdin"] = subprocess.PIPE if stdin else None
-    kwargs.setdefault("shell", not isinstance(command, list))
+# The source of the probe server. It runs in a small python process of its
+# own, reading one JSON request per line and answering each with the result.
+PROBE_SERVER = """
+import json, subprocess, sys
+for line in iter(sys.stdin.readline, ""):
+    request = json.loads(line)
+    try:
+        p = subprocess.run(
+            request["command"],
+            shell=request["shell"],
+            env=request["env"],
+            cwd=request["cwd"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as e:
+        response = {"errno": e.errno, "strerror": e.strerror}
+    else:
+        response = {
+            "returncode": p.returncode,
+            "stdout": p.stdout.decode("utf-8", "surrogateescape"),
+            "stderr": p.stderr.decode("utf-8", "surrogateescape"),
+        }
+    sys.stdout.write(json.dumps(response) + "\\n")
+    sys.stdout.flush()
+"""
+
+
+class ProbeServer:
+
+    """A long running helper process that runs read-only probe commands.
+
+    Forking the helper is much cheaper than forking a large fuselage process,
+    and the helper is only started once per run. Requests are sent one at a
+    time, so concurrent probes take turns."""
+
+    def __init__(self):
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", "-c", PROBE_SERVER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def stop(self):
+        if self.process:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def run(self, command, shell, env, cwd):
+        """Returns the exit code, stdout and stderr of ``command``"""
+        request = {"command": command, "shell": shell, "env": env, "cwd": cwd}
+        with self.lock:
+            self.process.stdin.write(force_bytes(json.dumps(request) + "\n"))
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        if not line:
+            raise error.SystemError(errno.EPIPE, "", "The probe server has exited")
+        response = json.loads(force_str(line))
+        if "errno" in response:
+            raise OSError(response["errno"], response["strerror"])
+        return (
+            response["returncode"],
+            self.get_output(response["stdout"]),
+            self.get_output(response["stderr"]),
+        )
+
+    def get_output(self, text):
+        # Split lines the same way as output read from a Process
+        handle = Handle(None)
+        handle.feed(text.encode("utf-8", "surrogateescape"))
+        handle.flush()
+        return handle.output
+
 
+_probe_server = None
+
+
+def start_probe_server():
+    global _probe_server
+    if _probe_server is None and platform != "win32":
+        _probe_server = ProbeServer()
+        _probe_server.start()
+
+
+def stop_probe_server():
+    global _probe_server
+    if _probe_server is not None:
+        _probe_server.stop()
+        _probe_server = None
+
+
+def _changes_identity(kwargs):
+    uid, gid = kwargs.get("uid"), kwargs.get("gid")
+    if kwargs.get("user") and pwd:
+        uid = pwd.getpwnam(kwargs["user"]).pw_uid
+    if kwargs.get("group") and grp:
+        gid = grp.getgrnam(kwargs["group"]).gr_gid
+    if uid and uid != os.getuid():
+        return True
+    if gid and gid != os.getgid():
+        return True
+    return bool(kwargs.get("umask"))
+
+
+def _get_env(kwargs):
     env = {}
     if platform == "posix":
         env.update(
@@ -234,22 +437,122 @@ def check_call(command, *args, **kwargs):
     if "SSH_AUTH_SOCK" in os.environ:
         env["SSH_AUTH_SOCK"] = os.environ["SSH_AUTH_SOCK"]
     env.update(kwargs.get("env", {}))
-    kwargs["env"] = env
+    return env
 
-    p = Process(command, *args, **kwargs)
-    if logger:
-        p.attach_callback(logger.info)
-    stdout, stderr = p.communicate(input=stdin)
-    p.wait()
+
+def _check_result(returncode, stdout, stderr, encoding, expected):
     if encoding and not isinstance(stdout, str):
         stdout = stdout.decode(encoding)
     if encoding and not isinstance(stderr, str):
         stderr = stderr.decode(encoding)
-    if expected is not None and p.returncode != expected:
-        raise error.SystemError(p.returncode, stdout, stderr)
+    if expected is not None and returncode != expected:
+        raise error.SystemError(returncode, stdout, stderr)
     return stdout, stderr
 
 
+def check_call(command, *args, **kwargs):
+    logger = kwargs.pop("logger", None)
+    expected = kwargs.pop("expected", 0)
+    encoding = kwargs.pop("encoding", "UTF-8")
+    stdin = kwargs.pop("stdin", None)
+    probe = kwargs.pop("probe", False)
+    kwargs["stdin"] = subprocess.PIPE if stdin else None
+    kwargs.setdefault("shell", not isinstance(command, list))
+    kwargs["env"] = env = _get_env(kwargs)
+
+    # Probes that don't need a different identity, input or live output can
+    # go via the probe server, if one is running
+    interactive = stdin or logger or args
+    if probe and _probe_server and not interactive and not _changes_identity(kwargs):
+        returncode, stdout, stderr = _probe_server.run(
+            command, kwargs["shell"], env, kwargs.get("cwd")
+        )
+    else:
+        p = Process(command, *args, **kwargs)
+        if logger:
+            p.attach_callback(logger.info)
+        stdout, stderr = p.communicate(input=stdin)
+        p.wait()
+        returncode = p.returncode
+
+    return _check_result(returncode, stdout, stderr, encoding, expected)
+
+
+async def _pump(stream, handle):
+    while True:
+        data = await stream.read(Handle.READ_SIZE)
+        if not data:
+            break
+        handle.feed(data)
+    handle.flush()
+
+
+async def _acquire_preexec_lock():
+    # The lock is held across an await, so another task on this loop may hold
+    # it. Wait for it on the default executor rather than blocking the loop.
+    acquire = asyncio.get_running_loop().run_in_executor(None, _preexec_lock.acquire)
+    try:
+        await asyncio.shield(acquire)
+    except asyncio.CancelledError:
+        # The executor still takes the lock, so give it straight back
+        acquire.add_done_callback(lambda f: _preexec_lock.release())
+        raise
+
+
+async def async_check_call(command, **kwargs):
+    """Like ``check_call``, but runs ``command`` as an asyncio subprocess.
+    Output is split into lines and passed to ``logger`` as it arrives, and
+    other tasks keep running while waiting for the command to finish."""
+    logger = kwargs.pop("logger", None)
+    expected = kwargs.pop("expected", 0)
+    encoding = kwargs.pop("encoding", "UTF-8")
+    stdin = kwargs.pop("stdin", None)
+    probe = kwargs.pop("probe", False)
+    shell = kwargs.pop("shell", not isinstance(command, list))
+    kwargs["env"] = env = _get_env(kwargs)
+
+    if probe and _probe_server and not stdin and not logger:
+        if not _changes_identity(kwargs):
+            loop = asyncio.get_running_loop()
+            returncode, stdout, stderr = await loop.run_in_executor(
+                None, _probe_server.run, command, shell, env, kwargs.get("cwd")
+            )
+            return _check_result(returncode, stdout, stderr, encoding, expected)
+
+    kwargs = Process.get_launch_options(command, shell=shell, **kwargs)
+    kwargs.pop("shell")
+    kwargs["stdin"] = subprocess.PIPE if stdin else None
+    kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    preexec = "preexec_fn" in kwargs
+    if preexec:
+        await _acquire_preexec_lock()
+    try:
+        if shell:
+            p = await asyncio.create_subprocess_shell(command, **kwargs)
+        else:
+            p = await asyncio.create_subprocess_exec(*command, **kwargs)
+    finally:
+        if preexec:
+            _preexec_lock.release()
+
+    callback = logger.info if logger else None
+    stdout = Handle(None, callback)
+    stderr = Handle(None, callback)
+
+    if stdin:
+        try:
+            p.stdin.write(force_bytes(stdin))
+            await p.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        p.stdin.close()
+
+    await asyncio.gather(_pump(p.stdout, stdout), _pump(p.stderr, stderr))
+    returncode = await p.wait()
+
+    return _check_result(returncode, stdout.output, stderr.output, encoding, expected)
+
+
 def exists(path):
     return os.path.exists(path)
 
@@ -286,13 +589,126 @@ def get(path):
     return open(path, "rb").read()
 
 
+def get_stream(path):
+    return open(path, "rb")
+
+
+def _write_all(fd, data):
+    # os.write can return before all of the data is written
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+# Errors creating, chowning or renaming a temporary file that mean put should
+# rewrite the file in place instead. For example a bind mounted file, such as
+# /etc/hosts in a container, can't be renamed over (EBUSY).
+IN_PLACE_ERRNOS = (errno.EBUSY, errno.EXDEV, errno.EPERM, errno.EACCES)
+
+
+def _write_contents(fd, contents):
+    if hasattr(contents, "read"):
+        for chunk in iter(lambda: contents.read(CHUNK_SIZE), b""):
+            _write_all(fd, chunk)
+    else:
+        _write_all(fd, force_bytes(contents))
+
+
+def _tell(contents):
+    """Where a file object to copy from starts, or None if it can't be read
+    again"""
+    seekable = getattr(contents, "seekable", None)
+    if seekable is None or not seekable():
+        return None
+    return contents.tell()
+
+
+def _create_temporary(path, chmod, st):
+    """Create a temporary file to replace ``path``, with the mode and
+    ownership of ``st`` if the file already exists"""
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, ".{}.{}.tmp".format(name, uuid.uuid4().hex[:8]))
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, chmod)
+    try:
+        if st is not None:
+            os.chmod(tmp, stat_module.S_IMODE(st.st_mode))
+            tmp_st = os.stat(tmp)
+            if (tmp_st.st_uid, tmp_st.st_gid) != (st.st_uid, st.st_gid):
+                os.chown(tmp, st.st_uid, st.st_gid)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp)
+        raise
+    return tmp, fd
+
+
+def _put_in_place(path, contents, chmod):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, chmod)
+    try:
+        _write_contents(fd, contents)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def put(path, contents, chmod=0o644):
-    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
-    if not sys.platform.startswith("win"):
-        flags = flags | os.O_SYNC
-    fd = os.open(path, flags, chmod)
+    """Replace the file at ``path`` with ``contents``, which can be text,
+    bytes or a binary file object to copy from in chunks.
+
+    The contents are written to a temporary file in the same directory,
+    synced to disk once and then renamed over ``path``, so the file is never
+    seen half written. An existing file keeps its mode and ownership, and a
+    symlink is followed rather than replaced.
+
+    The file is rewritten in place instead when it has other hard links,
+    which a rename would break, or when the temporary file can't be created,
+    given the file's ownership or renamed over it (see IN_PLACE_ERRNOS)."""
+    path = os.path.realpath(path)
+
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+
+    if st is not None and st.st_nlink > 1:
+        return _put_in_place(path, contents, chmod)
+
     try:
-        os.write(fd, force_bytes(contents))
+        tmp, fd = _create_temporary(path, chmod, st)
+    except OSError as e:
+        if e.errno not in IN_PLACE_ERRNOS:
+            raise
+        return _put_in_place(path, contents, chmod)
+
+    start = _tell(contents) if hasattr(contents, "read") else 0
+    try:
+        try:
+            _write_contents(fd, contents)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+    except BaseException as e:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        if not isinstance(e, OSError) or e.errno not in IN_PLACE_ERRNOS:
+            raise
+        # A file object can only be copied again if it can be rewound
+        if start is None:
+            raise
+        if hasattr(contents, "read"):
+            contents.seek(start)
+        _put_in_place(path, contents, chmod)
+
+
+def append(path, contents):
+    """Append ``contents`` to the file at ``path``, creating it if needed, and
+    sync it to disk before returning."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        _write_all(fd, force_bytes(contents))
+        os.fsync(fd)
     finally:
         os.close(fd)
 
@@ -305,6 +721,59 @@ def unlink(path):
     os.unlink(path)
 
 
+def mkdir(path):
+    os.mkdir(path)
+
+
+def rmdir(path):
+    os.rmdir(path)
+
+
+def rmtree(path):
+    shutil.rmtree(path)
+
+
+def symlink(to, path):
+    os.symlink(to, path)
+
+
+def chown(path, uid, gid, follow_symlinks=True):
+    os.chown(path, uid, gid, follow_symlinks=follow_symlinks)
+
+
+def chmod(path, mode):
+    os.chmod(path, mode)
+
+
+# Lookups in the passwd, group and shadow databases can be slow when they are
+# backed by a directory service, and the same names are looked up over and
+# over during a run. Results (including misses) are kept until something that
+# might have changed the databases calls invalidate_identities.
+_identity_lock = threading.Lock()
+_identities = {}
+
+
+def _cached_identity(lookup, *args):
+    key = (lookup.__name__,) + args
+    with _identity_lock:
+        if key not in _identities:
+            try:
+                _identities[key] = (lookup(*args), None)
+            except KeyError as e:
+                _identities[key] = (None, e.args)
+        value, missing = _identities[key]
+    if missing is not None:
+        raise KeyError(*missing)
+    return value
+
+
+def invalidate_identities():
+    """Forget cached passwd, group and shadow entries. Called after running
+    anything that might add, change or remove users or groups."""
+    with _identity_lock:
+        _identities.clear()
+
+
 def gr_supported():
     return grp is not None
 
@@ -320,13 +789,13 @@ def spwd_supported():
 if gr_supported():
 
     def getgrall():
-        return list(grp.getgrall())
+        return list(_cached_identity(grp.getgrall))
 
     def getgrnam(name):
-        return grp.getgrnam(name)
+        return _cached_identity(grp.getgrnam, name)
 
     def getgrgid(gid):
-        return grp.getgrgid(gid)
+        return _cached_identity(grp.getgrgid, gid)
 
 else:
     getgrall = None
@@ -337,13 +806,13 @@ else:
 if pwd_supported():
 
     def getpwall():
-        return list(pwd.getpwall())
+        return list(_cached_identity(pwd.getpwall))
 
     def getpwnam(name):
-        return pwd.getpwnam(name)
+        return _cached_identity(pwd.getpwnam, name)
 
     def getpwuid(uid):
-        return pwd.getpwuid(uid)
+        return _cached_identity(pwd.getpwuid, uid)
 
 else:
     getpwall = None
@@ -354,10 +823,10 @@ else:
 if spwd_supported():
 
     def getspall():
-        return list(spwd.getspall())
+        return list(_cached_identity(spwd.getspall))
 
     def getspnam(name):
-        return spwd.getspnam(name)
+        return _cached_identity(spwd.getspnam, name)
 
 else:
     getspall = None
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
 from fuselage import error
 
 
@@ -71,6 +73,11 @@ class Policy(metaclass=PolicyType):
         policy and overall context"""
         import fuselage.providers  # noqa
 
+        return provider_cache.get(self)
+
+    def resolve_provider(self):
+        """Like ``get_provider``, but always asks every provider rather than
+        using the cache"""
         valid = [p.isvalid(self, self.resource) for p in self.providers]
         if valid.count(True) > 1:
             raise error.TooManyProviders(
@@ -87,6 +94,85 @@ class NullPolicy(Policy):
     pass
 
 
+class ProviderCache:
+
+    """
+    Remembers which provider was chosen for a policy, so that resources that
+    only differ in arguments no provider's ``isvalid`` looks at don't ask
+    every provider again.
+
+    Entries are keyed by the policy class and the values of the arguments
+    its providers declare in ``isvalid_arguments``. If any of them might
+    look at anything else the policy isn't cached at all.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resolved = {}
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    def get_key(self, policy):
+        names = set()
+        for p in policy.providers:
+            if p.isvalid_arguments is None:
+                return None
+            names.update(p.isvalid_arguments)
+
+        values = tuple((n, getattr(policy.resource, n)) for n in sorted(names))
+        key = (type(policy), values)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, policy):
+        key = self.get_key(policy)
+        if key is None:
+            with self.lock:
+                self.uncached += 1
+            return policy.resolve_provider()
+
+        with self.lock:
+            provider = self.resolved.get(key)
+            if provider is not None:
+                self.hits += 1
+                return provider
+            self.misses += 1
+
+        # Failures aren't cached, so every resource that can't be resolved
+        # gets its own error
+        provider = policy.resolve_provider()
+        with self.lock:
+            self.resolved[key] = provider
+        return provider
+
+    def clear(self):
+        """Forget every resolution, for example because a new provider has
+        been registered"""
+        with self.lock:
+            self.resolved.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses + self.uncached
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncached": self.uncached,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = self.misses = self.uncached = 0
+
+
+provider_cache = ProviderCache()
+
+
 class ArgumentAssertion:
 
     """An assertion of the state of an argument"""
@@ -15,10 +15,18 @@
 """ Core classes for providers """
 
 from abc import ABCMeta, abstractmethod
+import asyncio
+import contextvars
+import functools
 import logging
+import threading
 
 from fuselage import log, policy
 
+# Guards building the batches for a run, which may be asked for by several
+# resources at once
+_batches_lock = threading.Lock()
+
 
 class ProviderType(ABCMeta):
 
@@ -26,8 +34,14 @@ class ProviderType(ABCMeta):
 
     def __new__(meta, class_name, bases, new_attrs):
         cls = super().__new__(meta, class_name, bases, new_attrs)
-        for p in getattr(cls, "policies", []):
+        if "isvalid" in new_attrs and "isvalid_arguments" not in new_attrs:
+            # A new isvalid that hasn't said what it looks at can't be cached
+            cls.isvalid_arguments = None
+        policies = getattr(cls, "policies", [])
+        for p in policies:
             p.providers.append(cls)
+        if policies:
+            policy.provider_cache.clear()
         return cls
 
 
@@ -38,6 +52,10 @@ class Provider(metaclass=ProviderType):
     # in your class, specify which policies you provide an implementation for
     # these policies should all be for the same resource
     policies = []
+    # the resource arguments that isvalid looks at, so the provider chosen for
+    # a resource can be reused for others that agree on them. None means
+    # isvalid might look at anything and the choice is never cached.
+    isvalid_arguments = ()
 
     def __init__(self, resource, runner):
         self.resource = resource
@@ -67,6 +85,9 @@ class Provider(metaclass=ProviderType):
     def change(self, change):
         return change.apply(self)
 
+    async def change_async(self, change):
+        return await change.apply_async(self)
+
     @classmethod
     def isvalid(self, policy, resource):
         """Returns True if this provider is valid for the specified resource,
@@ -76,6 +97,14 @@ class Provider(metaclass=ProviderType):
         only one of those providers may return True from this method."""
         return True
 
+    def fingerprint(self):
+        """Return a cheap, JSON serializable observation of the state this
+        provider manages, such as the stat of a file. An incremental run skips
+        a resource if neither its definition nor this fingerprint have
+        changed since it was last applied. Returns None by default, which
+        means the resource is always applied."""
+        return None
+
     @abstractmethod
     def apply(self, shell):
         """Execute this provider using the supplied shell object. This base
@@ -84,6 +113,101 @@ class Provider(metaclass=ProviderType):
         the Resource was already in the state the policy ensures)."""
         return False
 
+    async def apply_async(self):
+        """Apply this provider from a coroutine. Providers that only have a
+        synchronous ``apply`` are run on the event loop's default executor,
+        so they don't block other resources that are being applied. Providers
+        that can wait for their commands on the loop override this."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            None, functools.partial(context.run, self.apply)
+        )
+
+
+class AsyncProvider(Provider):
+
+    """A provider that is implemented as a coroutine. Subclasses implement
+    ``apply_async`` instead of ``apply``."""
+
+    def apply(self):
+        return asyncio.run(self.apply_async())
+
+    @abstractmethod
+    async def apply_async(self):
+        """Return True if the provider changed anything, or False if it did
+        not need to change anything."""
+        return False
+
+
+class Batch:
+
+    """
+    A group of resources that are changed together when the first of them is
+    applied, after which each resource reports whether it was changed.
+
+    The batches for a run are found in one pass over the bundle the first
+    time any of them is needed. Runs of consecutive resources for which
+    ``is_batchable`` is true are passed to ``split``, and each group it
+    returns with at least ``min_size`` resources becomes a batch.
+    Subclasses implement ``converge``, which returns a dictionary of
+    resource to changed flag.
+    """
+
+    # the key the batches are kept under in runner.shared
+    key = None
+    min_size = 2
+
+    def __init__(self, resources):
+        self.resources = resources
+        self.changed = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_batchable(resource):
+        return False
+
+    @classmethod
+    def split(cls, run):
+        return [run]
+
+    @classmethod
+    def find_batches(cls, bundle):
+        batches = {}
+        run = []
+        for resource in list(bundle) + [None]:
+            if resource is not None and cls.is_batchable(resource):
+                run.append(resource)
+                continue
+            for group in cls.split(run):
+                if len(group) >= cls.min_size:
+                    batch = cls(group)
+                    batches.update(dict.fromkeys(group, batch))
+            run = []
+        return batches
+
+    @classmethod
+    def get(cls, provider):
+        """Return the batch that the provider's resource belongs to, or None
+        if it isn't part of one."""
+        shared = provider.runner.shared
+        with _batches_lock:
+            if cls.key not in shared:
+                bundle = getattr(provider.runner.resources, "resources", [])
+                shared[cls.key] = cls.find_batches(bundle)
+        return shared[cls.key].get(provider.resource)
+
+    def apply(self, provider):
+        with self.lock:
+            if self.changed is None:
+                self.changed = self.converge(provider)
+            else:
+                provider.logger.debug("Resource was handled as part of a batch")
+        return self.changed[provider.resource]
+
+    def converge(self, provider):
+        raise NotImplementedError(self.converge)
+
 
 class NullProvider(Provider):
     policies = [policy.NullPolicy]
@@ -12,34 +12,331 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error, platform, provider, resources
+import time
+
+from fuselage import error, ledger, platform, provider, resources
 from fuselage.changes import ShellCommand
 
 
 def is_installed(resource):
     # work out if the package is already installed
-    command = ["dpkg-query", "-W", "-f='${Status}'", resource.name]
+    try:
+        stdout, stderr = platform.check_call(get_status_command(resource), probe=True)
+    except error.SystemError as exc:
+        return check_status_error(resource, exc)
+    return check_status(stdout)
+
 
+async def is_installed_async(resource):
+    """Like ``is_installed``, but awaits dpkg-query on the event loop"""
     try:
-        stdout, stderr = platform.check_call(command)
+        stdout, stderr = await platform.async_check_call(
+            get_status_command(resource), probe=True
+        )
     except error.SystemError as exc:
-        if exc.returncode == 1:
+        return check_status_error(resource, exc)
+    return check_status(stdout)
+
+
+def get_status_command(resource):
+    return ["dpkg-query", "-W", "-f='${Status}'", resource.name]
+
+
+def check_status_error(resource, exc):
+    if exc.returncode == 1:
+        return False
+    # if the return code is anything but zero or one, we have a problem
+    raise error.PackageError(
+        f"{resource} search failed with return code {exc.returncode}"
+    )
+
+
+def check_status(stdout):
+    # if the return code is 0, dpkg is aware of the package
+    return "install ok installed" in stdout
+
+
+ENV = {
+    "DEBIAN_FRONTEND": "noninteractive",
+}
+
+# Rewritten by dpkg whenever a package is installed or removed
+DPKG_STATUS = "/var/lib/dpkg/status"
+
+
+class DpkgDatabase:
+
+    """A snapshot of the packages that dpkg reports as installed. It is taken
+    with a single dpkg-query and shared by every Package resource in a run,
+    and is discarded whenever a package manager is run."""
+
+    COMMAND = ["dpkg-query", "-W", "-f=${Package} ${Status}\\n"]
+
+    def __init__(self, listing):
+        self.installed = set()
+        for line in listing.splitlines():
+            package, _, status = line.partition(" ")
+            if status.strip() == "install ok installed":
+                self.installed.add(package)
+
+        # Architecture qualified names, which dpkg is asked about one by one
+        self.qualified = {}
+
+    @classmethod
+    def get(cls, runner):
+        if not isinstance(runner.shared.get("packages"), cls):
+            try:
+                stdout, stderr = platform.check_call(cls.COMMAND, probe=True)
+            except error.SystemError as exc:
+                raise cls.listing_failed(exc)
+            runner.shared["packages"] = cls(stdout)
+        return runner.shared["packages"]
+
+    @classmethod
+    async def get_async(cls, runner):
+        """Like ``get``, but awaits dpkg-query on the event loop"""
+        if not isinstance(runner.shared.get("packages"), cls):
+            try:
+                stdout, stderr = await platform.async_check_call(
+                    cls.COMMAND, probe=True
+                )
+            except error.SystemError as exc:
+                raise cls.listing_failed(exc)
+            runner.shared["packages"] = cls(stdout)
+        return runner.shared["packages"]
+
+    @staticmethod
+    def listing_failed(exc):
+        return error.PackageError(
+            "Listing packages failed with return code %d" % exc.returncode
+        )
+
+    def is_installed(self, resource):
+        # The snapshot only has bare package names, so ask dpkg directly
+        # about architecture qualified names
+        if ":" not in resource.name:
+            return resource.name in self.installed
+        if resource.name not in self.qualified:
+            self.qualified[resource.name] = is_installed(resource)
+        return self.qualified[resource.name]
+
+    async def prefetch_async(self, packages):
+        """Ask dpkg about any architecture qualified names among
+        ``packages`` from the event loop, so that ``is_installed`` can answer
+        for all of them without blocking"""
+        for resource in packages:
+            if ":" in resource.name and resource.name not in self.qualified:
+                self.qualified[resource.name] = await is_installed_async(resource)
+
+    def is_converged(self, packages):
+        """Return whether every one of ``packages`` is already installed or
+        removed, as its policy asks"""
+        for resource in packages:
+            install = isinstance(
+                resource.policy, resources.package.PackageInstallPolicy
+            )
+            if self.is_installed(resource) != install:
+                return False
+        return True
+
+
+class AptIndex:
+
+    """The local apt package index. It is refreshed with apt-get update at
+    most once per run, however many Package resources ask for it.
+
+    By default it is only refreshed when apt-get install fails because a
+    package can't be found. Packages that set ``index_max_age`` refresh it
+    before installing if it is older than that, or if it doesn't know about
+    one of the packages being installed."""
+
+    STAMPS = ("/var/lib/apt/lists", "/var/lib/apt/periodic/update-success-stamp")
+
+    def __init__(self):
+        self.updated = False
+
+    @classmethod
+    def get(cls, runner):
+        return runner.shared.setdefault("apt-index", cls())
+
+    def get_age(self):
+        mtimes = [platform.stat(p).st_mtime for p in self.STAMPS if platform.exists(p)]
+        if not mtimes:
+            return None
+        return time.time() - max(mtimes)
+
+    def get_missing(self, names):
+        """Return the names that have no installation candidate in the
+        index, using a single apt-cache policy for all of them."""
+        try:
+            stdout, stderr = platform.check_call(
+                ["apt-cache", "policy"] + names, probe=True
+            )
+        except error.SystemError as exc:
+            raise error.PackageError(
+                "Querying the package index failed with return code %d" % exc.returncode
+            )
+
+        found = set()
+        package = None
+        for line in stdout.splitlines():
+            if line.endswith(":") and not line.startswith(" "):
+                package = line[:-1]
+            elif line.strip().startswith("Candidate:") and "(none)" not in line:
+                found.add(package)
+
+        return [name for name in names if name not in found]
+
+    def update(self, provider):
+        """Run apt-get update, unless it has already run. Returns False if
+        the index had already been updated during this run."""
+        if self.updated:
             return False
-        # if the return code is anything but zero or one, we have a problem
+        self.updated = True
+        provider.change(ShellCommand(["apt-get", "update", "-q", "-y"], env=ENV))
+        return True
+
+    def refresh(self, provider, names, max_age):
+        if self.updated:
+            return
+
+        age = self.get_age()
+        if age is None or age > max_age:
+            provider.logger.debug("Package index is out of date")
+            self.update(provider)
+            return
+
+        missing = self.get_missing(names)
+        if missing:
+            provider.logger.debug("Package index doesn't have %s" % ", ".join(missing))
+            self.update(provider)
+
+
+def install(provider, packages):
+    target = ", ".join(repr(r) for r in packages)
+    names = [r.name for r in packages]
+    index = AptIndex.get(provider.runner)
+
+    max_ages = [r.index_max_age for r in packages if r.index_max_age is not None]
+    if max_ages:
+        try:
+            index.refresh(provider, names, min(max_ages))
+        except error.SystemError as exc:
+            raise error.PackageError(
+                "Updating the package index for %s failed with return code %d"
+                % (target, exc.returncode)
+            )
+
+    command = [
+        "apt-get",
+        "install",
+        "-q",
+        "-y",
+        "--force-yes",
+        "-o",
+        "DPkg::Options::=--force-confdef",
+    ]
+    command.extend(names)
+
+    try:
+        provider.change(ShellCommand(command, env=ENV))
+    except error.SystemError as exc:
+        if exc.returncode == 100 and not index.updated:
+            try:
+                index.update(provider)
+                provider.change(ShellCommand(command, env=ENV))
+            except error.SystemError as exc:
+                raise error.PackageError(
+                    "%s with what looked like a recoverable error, but it wasn't (return code %d)"
+                    % (target, exc.returncode)
+                )
+        else:
+            raise error.PackageError(
+                "%s failed with return code %d" % (target, exc.returncode)
+            )
+
+
+def uninstall(provider, names, purge, target):
+    command = ["apt-get", "remove", "-q", "-y"]
+    if purge:
+        command.append("--purge")
+    command.extend(names)
+
+    try:
+        provider.change(ShellCommand(command, env=ENV))
+    except error.SystemError as exc:
         raise error.PackageError(
-            f"{resource} search failed with return code {exc.returncode}"
+            "%s failed to uninstall with return code %d" % (target, exc.returncode)
         )
 
-    # if the return code is 0, dpkg is aware of the package
-    if "install ok installed" in stdout:
-        return True
 
-    return False
+class AptBatch(provider.Batch):
+
+    """A run of consecutive apt Package resources. They are changed with a
+    single apt-get transaction when the first of them is applied, and each
+    resource then reports whether it was changed by the batch.
+
+    Resources that watch other resources are never batched, as they may not
+    be applied at all."""
+
+    key = "apt-batches"
+
+    @staticmethod
+    def is_batchable(resource):
+        if resource.__resource_name__ != "Package" or resource.watches:
+            return False
+        return resource.policy.get_provider() in (AptInstall, AptUninstall)
+
+    def converge(self, provider):
+        database = DpkgDatabase.get(provider.runner)
+
+        to_install = []
+        to_remove = {False: [], True: []}
+        for resource in self.resources:
+            installed = database.is_installed(resource)
+            if isinstance(resource.policy, resources.package.PackageInstallPolicy):
+                if not installed:
+                    to_install.append(resource)
+            elif installed:
+                to_remove[bool(resource.purge)].append(resource)
+
+        if to_install:
+            install(provider, to_install)
+
+        for purge, removals in to_remove.items():
+            if removals:
+                uninstall(
+                    provider,
+                    [r.name for r in removals],
+                    purge,
+                    ", ".join(repr(r) for r in removals),
+                )
+
+        changed = set(to_install + to_remove[False] + to_remove[True])
+        return {resource: resource in changed for resource in self.resources}
 
 
-class AptInstall(provider.Provider):
+class _AptMixin:
+    async def apply_async(self):
+        """Check the package against the snapshot from the event loop. Only
+        if something needs installing or removing is ``apply`` run on the
+        default executor, as apt-get runs for the whole transaction."""
+        database = await DpkgDatabase.get_async(self.runner)
+        batch = AptBatch.get(self)
+        packages = batch.resources if batch else [self.resource]
+        await database.prefetch_async(packages)
+
+        if database.is_converged(packages) or (batch and batch.changed is not None):
+            # There is nothing left to run, so this won't block the loop
+            return self.apply()
+
+        return await super().apply_async()
+
+
+class AptInstall(_AptMixin, provider.Provider):
 
     policies = (resources.package.PackageInstallPolicy,)
+    isvalid_arguments = ("backend",)
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -47,53 +344,29 @@ class AptInstall(provider.Provider):
             return False
         return True
 
+    def fingerprint(self):
+        return ledger.observe_path(DPKG_STATUS)
+
     def apply(self):
-        if is_installed(self.resource):
+        batch = AptBatch.get(self)
+        if batch:
+            return batch.apply(self)
+
+        if DpkgDatabase.get(self.runner).is_installed(self.resource):
             self.logger.debug("Package already installed; nothing to do.")
             return False
 
-        env = {
-            "DEBIAN_FRONTEND": "noninteractive",
-        }
-
         # the search returned 1, package is not installed, continue and install
         # it
-        command = [
-            "apt-get",
-            "install",
-            "-q",
-            "-y",
-            "--force-yes",
-            "-o",
-            "DPkg::Options::=--force-confdef",
-            self.resource.name,
-        ]
-
-        try:
-            self.change(ShellCommand(command, env=env))
-        except error.SystemError as exc:
-            if exc.returncode == 100:
-                try:
-                    self.change(
-                        ShellCommand(["apt-get", "update", "-q", "-y"], env=env)
-                    )
-                    self.change(ShellCommand(command, env=env))
-                except error.SystemError as exc:
-                    raise error.PackageError(
-                        "%s with what looked like a recoverable error, but it wasn't (return code %d)"
-                        % (self.resource, exc.returncode)
-                    )
-            else:
-                raise error.PackageError(
-                    "%s failed with return code %d" % (self.resource, exc.returncode)
-                )
+        install(self, [self.resource])
 
         return True
 
 
-class AptUninstall(provider.Provider):
+class AptUninstall(_AptMixin, provider.Provider):
 
     policies = (resources.package.PackageUninstallPolicy,)
+    isvalid_arguments = ("backend",)
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -101,29 +374,21 @@ class AptUninstall(provider.Provider):
             return False
         return True
 
+    def fingerprint(self):
+        return ledger.observe_path(DPKG_STATUS)
+
     def apply(self):
-        if not is_installed(self.resource):
+        batch = AptBatch.get(self)
+        if batch:
+            return batch.apply(self)
+
+        if not DpkgDatabase.get(self.runner).is_installed(self.resource):
             self.logger.debug(
                 "Package '%s' is already uninstalled, not removing."
                 % self.resource.name
             )
             return False
 
-        env = {
-            "DEBIAN_FRONTEND": "noninteractive",
-        }
-
-        command = ["apt-get", "remove", "-q", "-y"]
-        if self.resource.purge:
-            command.append("--purge")
-        command.append(self.resource.name)
-
-        try:
-            self.change(ShellCommand(command, env=env))
-        except error.SystemError as exc:
-            raise error.PackageError(
-                "%s failed to uninstall with return code %d"
-                % (self.resource, exc.returncode)
-            )
+        uninstall(self, [self.resource.name], self.resource.purge, self.resource)
 
         return True
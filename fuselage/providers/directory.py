@@ -14,8 +14,8 @@
 
 import os
 
-from fuselage import error, platform, provider, resources
-from fuselage.changes import EnsureDirectory, ShellCommand
+from fuselage import error, ledger, platform, provider, resources
+from fuselage.changes import EnsureDirectory, native
 
 
 def dirname(p):
@@ -30,6 +30,9 @@ class Directory(provider.Provider):
 
     policies = (resources.directory.DirectoryAppliedPolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_path(self.resource.name)
+
     def check_path(self, directory):
         if platform.isdir(directory):
             return
@@ -69,6 +72,9 @@ class RemoveDirectory(provider.Provider):
 
     policies = (resources.directory.DirectoryRemovedPolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_path(self.resource.name, follow_symlinks=False)
+
     def apply(self):
         name = self.resource.name
 
@@ -77,7 +83,7 @@ class RemoveDirectory(provider.Provider):
                 f"{self!r}: {name} exists and is not a directory"
             )
         if platform.exists(name):
-            self.change(ShellCommand(["/bin/rmdir", self.resource.name]))
+            self.change(native.rmdir(self.resource.name))
             changed = True
         else:
             changed = False
@@ -88,6 +94,9 @@ class RemoveDirectoryRecursive(provider.Provider):
 
     policies = (resources.directory.DirectoryRemovedRecursivePolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_path(self.resource.name, follow_symlinks=False)
+
     def apply(self):
         name = self.resource.name
 
@@ -96,7 +105,7 @@ class RemoveDirectoryRecursive(provider.Provider):
                 f"{self!r}: {name} exists and is not a directory"
             )
         if platform.exists(name):
-            self.change(ShellCommand(["/bin/rm", "-rf", self.resource.name]))
+            self.change(native.remove_recursive(self.resource.name))
             changed = True
         else:
             changed = False
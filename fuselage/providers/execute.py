@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error, platform, provider, resources
+from fuselage import error, ledger, platform, provider, resources
 from fuselage.changes import ShellCommand
 
 
@@ -20,13 +20,26 @@ class Execute(provider.Provider):
 
     policies = (resources.execute.ExecutePolicy,)
 
+    def fingerprint(self):
+        # Without a creates or touch file that exists there is nothing to
+        # show that the command doesn't need running again
+        guards = [p for p in (self.resource.creates, self.resource.touch) if p]
+        observed = [ledger.observe_path(path) for path in guards]
+        if not guards or None in observed:
+            return None
+        return observed
+
+    def get_unless_options(self):
+        return {
+            "command": self.resource.unless,
+            "user": self.resource.user,
+            "cwd": self.resource.cwd,
+            "probe": True,
+        }
+
     def check_unless(self):
         try:
-            platform.check_call(
-                command=self.resource.unless,
-                user=self.resource.user,
-                cwd=self.resource.cwd,
-            )
+            platform.check_call(**self.get_unless_options())
 
         except error.InvalidUser as exc:
             self.raise_or_log(exc)
@@ -39,40 +52,89 @@ class Execute(provider.Provider):
 
         return False
 
-    def apply(self):
+    async def check_unless_async(self):
+        try:
+            await platform.async_check_call(**self.get_unless_options())
+
+        except error.InvalidUser as exc:
+            self.raise_or_log(exc)
+
+        except error.InvalidGroup as exc:
+            self.raise_or_log(exc)
+
+        except error.SystemError:
+            return True
+
+        return False
+
+    def is_guarded(self):
+        """Return True if a creates or touch file shows that the command has
+        already been run"""
         creates = self.resource.creates
         if creates and platform.exists(creates):
             self.logger.debug(f"{self.resource.creates!r} exists, not executing")
-            return False
+            return True
 
         touch = self.resource.touch
         if touch and platform.exists(touch):
             self.logger.debug(f"{self.resource.touch!r} exists, not executing")
-            return False
+            return True
 
-        if self.resource.unless and not self.check_unless():
-            self.logger.debug(f"{self.resource.unless!r} passes, not executing")
-            return False
+        return False
 
+    def get_changes(self):
         if self.resource.command:
             commands = [self.resource.command]
         else:
             commands = self.resource.commands
 
         for command in commands:
-            self.change(
-                ShellCommand(
-                    command=command,
-                    cwd=self.resource.cwd or None,
-                    env=self.resource.env or None,
-                    user=self.resource.user or None,
-                    group=self.resource.group or None,
-                    umask=self.resource.umask,
-                    expected=self.resource.returncode,
-                )
+            yield ShellCommand(
+                command=command,
+                cwd=self.resource.cwd or None,
+                env=self.resource.env or None,
+                user=self.resource.user or None,
+                group=self.resource.group or None,
+                umask=self.resource.umask,
+                expected=self.resource.returncode,
             )
 
+    def apply(self):
+        if self.is_guarded():
+            return False
+
+        if self.resource.unless and not self.check_unless():
+            self.logger.debug(f"{self.resource.unless!r} passes, not executing")
+            return False
+
+        for change in self.get_changes():
+            self.change(change)
+
+        # We can't tell what an arbitrary command did to the user databases
+        platform.invalidate_identities()
+
         if self.resource.touch:
             self.change(ShellCommand(["touch", self.resource.touch]))
 
         return True
+
+    async def apply_async(self):
+        """Like ``apply``, but the unless probe and the commands are awaited
+        on the event loop rather than holding a thread each"""
+        if self.is_guarded():
+            return False
+
+        if self.resource.unless and not await self.check_unless_async():
+            self.logger.debug(f"{self.resource.unless!r} passes, not executing")
+            return False
+
+        for change in self.get_changes():
+            await self.change_async(change)
+
+        # We can't tell what an arbitrary command did to the user databases
+        platform.invalidate_identities()
+
+        if self.resource.touch:
+            await self.change_async(ShellCommand(["touch", self.resource.touch]))
+
+        return True
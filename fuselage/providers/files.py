@@ -12,12 +12,69 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import os
+import pkgutil
+import zipfile
 
-from fuselage import error, platform, provider, resources
-from fuselage.changes import EnsureFile, ShellCommand
+from fuselage import error, ledger, platform, provider, resources
+from fuselage.changes import EnsureFile, StreamedContents, native
 from fuselage.utils import force_bytes
 
+# Files larger than this are streamed to disk in chunks instead of being read
+# into memory. Smaller files are still read whole so their changes can be
+# diffed.
+STREAM_THRESHOLD = 1024 * 1024
+
+
+def get_asset(name, asset_store=None):
+    """Return the contents of an asset embedded in the bundle. A payload
+    built without its assets finds them in ``asset_store`` instead."""
+    loader = pkgutil.get_loader("fuselage")
+    member = "assets/" + name
+    archive = getattr(loader, "archive", None)
+    if archive:
+        with zipfile.ZipFile(archive) as zf:
+            try:
+                size = zf.getinfo(member).file_size
+            except KeyError:
+                return _get_stored_asset(name, asset_store)
+        if size > STREAM_THRESHOLD:
+            return StreamedContents(lambda: _open_member(archive, member), size)
+    try:
+        return loader.get_data(member)
+    except FileNotFoundError:
+        return _get_stored_asset(name, asset_store)
+
+
+def _get_stored_asset(name, asset_store):
+    """Return an asset that the payload was built without"""
+    if not asset_store:
+        raise error.MissingAsset("Asset '%s' is not in the payload" % name)
+    try:
+        return get_source(os.path.join(asset_store, name))
+    except FileNotFoundError:
+        raise error.MissingAsset(
+            "Asset '%s' is not in the payload or the asset store '%s'"
+            % (name, asset_store)
+        )
+
+
+@contextlib.contextmanager
+def _open_member(archive, member):
+    """Open a member of a zip archive, closing the archive along with it"""
+    with zipfile.ZipFile(archive) as zf, zf.open(member) as fp:
+        yield fp
+
+
+def get_source(path):
+    """Return the contents of a local file"""
+    size = os.path.getsize(path)
+    if size > STREAM_THRESHOLD:
+        return StreamedContents(lambda: open(path, "rb"), size)
+    with open(path, "rb") as fp:
+        return fp.read()
+
 
 class File(provider.Provider):
 
@@ -42,20 +99,28 @@ class File(provider.Provider):
                     "Path '%s' is not a directory" % path
                 )
 
+    def fingerprint(self):
+        source = self.resource.source
+        if source and not source.startswith("bundle://"):
+            return [
+                ledger.observe_path(self.resource.name),
+                ledger.observe_path(source),
+            ]
+        return [ledger.observe_path(self.resource.name)]
+
     def apply(self):
         name = self.resource.name
 
         self.check_path(os.path.dirname(name))
 
+        digest = None
         if self.resource.source:
             if self.resource.source.startswith("bundle://"):
-                import pkgutil
-
-                loader = pkgutil.get_loader("fuselage")
-                contents = loader.get_data("assets/" + self.resource.source[9:])
+                # Embedded assets are named after the digest of their contents
+                digest = self.resource.source[9:]
+                contents = get_asset(digest, self.runner.asset_store)
             else:
-                with open(self.resource.source, "rb") as fp:
-                    contents = fp.read()
+                contents = get_source(self.resource.source)
         elif self.resource.contents is not None:
             contents = force_bytes(self.resource.contents)
         else:
@@ -68,6 +133,7 @@ class File(provider.Provider):
             self.resource.group,
             self.resource.mode,
             sensitive=self.resource.sensitive,
+            digest=digest,
         )
         self.change(fc)
 
@@ -82,12 +148,15 @@ class RemoveFile(provider.Provider):
             return ["cmd.exe", "/C", "DEL", "/Q", "/F"]
         return ["rm"]
 
+    def fingerprint(self):
+        return ledger.observe_path(self.resource.name, follow_symlinks=False)
+
     def apply(self):
         name = self.resource.name
         if platform.exists(name):
             if not platform.isfile(name):
                 raise error.InvalidProvider("%s exists and is not a file" % name)
-            self.change(ShellCommand(self.get_delete_command() + [self.resource.name]))
+            self.change(native.remove(name, self.get_delete_command()))
             changed = True
         else:
             self.logger.debug("File %s missing already so not removed" % name)
@@ -16,7 +16,7 @@ import logging
 import os
 import re
 
-from fuselage import error, platform, provider, resources
+from fuselage import error, ledger, platform, provider, resources
 from fuselage.changes import EnsureDirectory, ShellCommand
 
 log = logging.getLogger(__name__)
@@ -25,8 +25,25 @@ log = logging.getLogger(__name__)
 class Git(provider.Provider):
 
     policies = (resources.checkout.CheckoutSyncPolicy,)
+    isvalid_arguments = ("scm",)
 
     REMOTE_NAME = "origin"
+    REMOTE_RE = re.compile(REMOTE_NAME + r"\t(.*) \(.*\)\n")
+    LS_REMOTE_RE = re.compile("([0-9a-f]{40})\t(.*)\n")
+
+    def fingerprint(self):
+        # A branch can move upstream without anything changing locally
+        if not self.resource.revision and not self.resource.tag:
+            return None
+        git_dir = os.path.join(self.resource.name, ".git")
+        head = ledger.read_file(os.path.join(git_dir, "HEAD"))
+        if head is None:
+            return None
+        return [
+            head,
+            ledger.observe_path(os.path.join(git_dir, "config")),
+            ledger.observe_path(os.path.join(git_dir, "index")),
+        ]
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -50,6 +67,7 @@ class Git(provider.Provider):
                 self.get_git_command(action, *args),
                 user=self.resource.user,
                 cwd=self.resource.name,
+                probe=True,
             )
             returncode = 0
         except error.SystemError as e:
@@ -92,9 +110,8 @@ class Git(provider.Provider):
 
     def action_update_remote(self):
         # Determine if the remote repository has changed
-        remote_re = re.compile(self.REMOTE_NAME + r"\t(.*) \(.*\)\n")
         rv, stdout, stderr = self.info("remote", "-v")
-        remote = remote_re.search(stdout)
+        remote = self.REMOTE_RE.search(stdout)
         if remote:
             if not self.resource.repository == remote.group(1):
                 log.info("The remote repository has changed.")
@@ -129,12 +146,12 @@ class Git(provider.Provider):
                 command=["git", "ls-remote", self.resource.repository],
                 user=self.resource.user,
                 cwd="/tmp",
+                probe=True,
             )
         except error.SystemError:
             raise error.CheckoutError("Could not query the remote repository")
 
-        r = re.compile("([0-9a-f]{40})\t(.*)\n")
-        refs_to_shas = {b: a for (a, b) in r.findall(stdout)}
+        refs_to_shas = {b: a for (a, b) in self.LS_REMOTE_RE.findall(stdout)}
 
         # Revision takes precedent over branch
 
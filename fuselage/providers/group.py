@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error, platform, provider, resources
+from fuselage import error, ledger, platform, provider, resources
 from fuselage.changes import ShellCommand
 
 
@@ -20,6 +20,9 @@ class Group(provider.Provider):
 
     policies = (resources.group.GroupApplyPolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_identities()
+
     def get_group_info(self):
         fields = (
             "name",
@@ -75,6 +78,9 @@ class GroupRemove(provider.Provider):
 
     policies = (resources.group.GroupRemovePolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_identities()
+
     def apply(self):
         try:
             platform.getgrnam(self.resource.name)
@@ -12,58 +12,103 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
-
-from fuselage import error, platform, provider, resources
+from fuselage import error, ledger, platform, provider, resources
 from fuselage.changes import EnsureContents
-from fuselage.utils import force_bytes, force_str
+from fuselage.utils import compile_pattern, force_bytes, force_str
 
 
-class _LineMixin:
-    def apply(self):
-        if not platform.exists(self.resource.name):
-            self.raise_or_log(
-                error.PathComponentMissing("File '%s' is missing" % self.resource.name)
+class LineBatch(provider.Batch):
+
+    """The Line resources in a run of consecutive Line resources that edit
+    the same file. When the first of them is applied the file is read once,
+    edited by each of them in turn and written back once, and each resource
+    then reports whether its own edit changed the file.
+
+    Resources that watch other resources are never batched, as they may not
+    be applied at all."""
+
+    key = "line-batches"
+    min_size = 1
+
+    @staticmethod
+    def is_batchable(resource):
+        return resource.__resource_name__ == "Line" and not resource.watches
+
+    @classmethod
+    def split(cls, run):
+        by_name = {}
+        for resource in run:
+            by_name.setdefault(resource.name, []).append(resource)
+        return list(by_name.values())
+
+    def converge(self, provider):
+        name = provider.resource.name
+        if not platform.exists(name):
+            provider.raise_or_log(
+                error.PathComponentMissing("File '%s' is missing" % name)
             )
-            return
+            return dict.fromkeys(self.resources)
 
-        lines = force_str(platform.get(self.resource.name)).splitlines()
-        contents = self.resource.linesep.join(line for line in self.filter_lines(lines))
+        current = platform.get(name)
+        contents = force_str(current)
+        edited = set()
+        for resource in self.resources:
+            replacement = resource.policy.get_provider().edit(resource, contents)
+            if replacement != contents:
+                edited.add(resource)
+            contents = replacement
 
         fc = EnsureContents(
-            self.resource.name,
+            name,
             force_bytes(contents),
-            sensitive=self.resource.sensitive,
+            sensitive=any(r.sensitive for r in self.resources),
+            current=current,
         )
-        self.change(fc)
+        provider.change(fc)
+
+        return {r: fc.changed and r in edited for r in self.resources}
+
+
+class _LineMixin:
+    def fingerprint(self):
+        return ledger.observe_path(self.resource.name)
+
+    def apply(self):
+        batch = LineBatch.get(self) or LineBatch([self.resource])
+        return batch.apply(self)
 
-        return fc.changed
+    @classmethod
+    def edit(cls, resource, contents):
+        lines = contents.splitlines()
+        return resource.linesep.join(line for line in cls.filter_lines(resource, lines))
 
 
 class LineApply(_LineMixin, provider.Provider):
 
     policies = (resources.line.LineApplyPolicy,)
 
-    def filter_lines(self, lines):
-        regexp = re.compile(self.resource.match)
+    @staticmethod
+    def filter_lines(resource, lines):
+        regexp = compile_pattern(resource.match)
         matched = False
         for line in lines:
             if not matched and regexp.search(line):
-                yield self.resource.line
+                yield resource.line
                 matched = True
             else:
                 yield line
 
         if not matched:
-            yield self.resource.line
+            yield resource.line
 
 
 class LineRemove(_LineMixin, provider.Provider):
 
     policies = (resources.line.LineRemovePolicy,)
 
-    def filter_lines(self, lines):
-        regexp = re.compile(self.resource.match)
+    @staticmethod
+    def filter_lines(resource, lines):
+        regexp = compile_pattern(resource.match)
         for line in lines:
             if not regexp.search(line):
                 yield line
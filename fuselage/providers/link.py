@@ -14,14 +14,25 @@
 
 import stat
 
-from fuselage import error, platform, provider, resources
-from fuselage.changes import ShellCommand
+from fuselage import error, ledger, platform, provider, resources
+from fuselage.changes import native
 
 
 class Link(provider.Provider):
 
     policies = (resources.link.LinkAppliedPolicy,)
 
+    def fingerprint(self):
+        try:
+            to = platform.readlink(self.resource.name)
+        except OSError:
+            to = None
+        return [
+            ledger.observe_path(self.resource.name, follow_symlinks=False),
+            to,
+            ledger.observe_path(self.resource.to),
+        ]
+
     def _get_owner(self):
         """Return the uid for the resource owner, or None if no owner is
         specified."""
@@ -75,11 +86,9 @@ class Link(provider.Provider):
 
         if not isalink or linkto != to:
             if platform.lexists(name):
-                self.change(ShellCommand(["/bin/rm", "-rf", self.resource.name]))
+                self.change(native.remove_recursive(self.resource.name))
 
-            self.change(
-                ShellCommand(["/bin/ln", "-s", self.resource.to, self.resource.name])
-            )
+            self.change(native.symlink(self.resource.to, self.resource.name))
             changed = True
 
         try:
@@ -97,16 +106,16 @@ class Link(provider.Provider):
 
         if owner and owner != uid:
             self.change(
-                ShellCommand(
-                    ["/bin/chown", "-h", self.resource.owner, self.resource.name]
+                native.chown(
+                    self.resource.name, self.resource.owner, follow_symlinks=False
                 )
             )
             changed = True
 
         if group and group != gid:
             self.change(
-                ShellCommand(
-                    ["/bin/chgrp", "-h", self.resource.group, self.resource.name]
+                native.chgrp(
+                    self.resource.name, self.resource.group, follow_symlinks=False
                 )
             )
             changed = True
@@ -118,6 +127,9 @@ class RemoveLink(provider.Provider):
 
     policies = (resources.link.LinkRemovedPolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_path(self.resource.name, follow_symlinks=False)
+
     def apply(self):
         name = self.resource.name
 
@@ -126,6 +138,6 @@ class RemoveLink(provider.Provider):
                 raise error.InvalidProvider(
                     f"{self!r}: {name} exists and is not a link"
                 )
-            self.change(ShellCommand(["/bin/rm", self.resource.name]))
+            self.change(native.remove(self.resource.name))
             return True
         return False
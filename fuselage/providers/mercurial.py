@@ -110,6 +110,7 @@ def _inject_credentials(url, username=None, password=None):
 class Mercurial(provider.Provider):
 
     policies = (resources.checkout.CheckoutSyncPolicy,)
+    isvalid_arguments = ("scm",)
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -129,6 +130,7 @@ class Mercurial(provider.Provider):
             command=self.get_hg_command(action, *args),
             user=self.resource.user,
             cwd=self.resource.name,
+            probe=True,
         )
 
     def should_update(self, *args):
@@ -19,6 +19,7 @@ from fuselage.changes import ShellCommand
 class Mounted(provider.Provider):
 
     policies = (resources.checkout.CheckoutSyncPolicy,)
+    isvalid_arguments = ("scm",)
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -27,7 +27,7 @@ class _ServiceMixin:
                 "Running %r to determine if already running" % self.resource.running
             )
             try:
-                platform.check_call(self.resource.running)
+                platform.check_call(self.resource.running, probe=True)
             except error.SystemError as e:
                 self.logger.debug(
                     "Got exit code %d. Assuming not running." % (e.returncode,)
@@ -63,7 +63,7 @@ class _ServiceMixin:
         #     return "running"
 
         try:
-            platform.check_call(["kill", "-0", str(pid)])
+            platform.check_call(["kill", "-0", str(pid)], probe=True)
             self.logger.debug("Service is running.")
             return "running"
         except error.SystemError:
@@ -21,6 +21,7 @@ from fuselage.changes import EnsureDirectory, ShellCommand
 class Svn(provider.Provider):
 
     policies = (resources.checkout.CheckoutSyncPolicy,)
+    isvalid_arguments = ("scm",)
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -126,7 +127,7 @@ class Svn(provider.Provider):
 
     def info(self, uri):
         command = self.get_svn_args("info", uri)
-        stdout, stderr = platform.check_call(command)
+        stdout, stderr = platform.check_call(command, probe=True)
         return dict(x.split(": ") for x in stdout.split("\n") if x)
 
     def svn(self, action, *args, **kwargs):
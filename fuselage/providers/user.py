@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error, platform, provider, resources
+from fuselage import error, ledger, platform, provider, resources
 from fuselage.changes import ShellCommand
 
 
@@ -20,6 +20,9 @@ class User(provider.Provider):
 
     policies = (resources.user.UserApplyPolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_identities()
+
     def get_user_info(self):
         fields = ("name", "passwd", "uid", "gid", "gecos", "dir", "shell")
 
@@ -155,6 +158,9 @@ class UserRemove(provider.Provider):
 
     policies = (resources.user.UserRemovePolicy,)
 
+    def fingerprint(self):
+        return ledger.observe_identities()
+
     def apply(self):
         try:
             platform.getpwnam(self.resource.name.encode("utf-8"))
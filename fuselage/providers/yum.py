@@ -12,28 +12,113 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error, platform, provider, resources
+from fuselage import error, ledger, platform, provider, resources
 from fuselage.changes import ShellCommand
 
+# The rpm database, in its sqlite and older Berkeley DB forms
+RPMDB_FILES = ("/var/lib/rpm/rpmdb.sqlite", "/var/lib/rpm/Packages")
+
 
 def is_installed(resource):
-    command = ["rpm", "-q", resource.name]
     try:
-        stdout, stderr = platform.check_call(command)
+        platform.check_call(["rpm", "-q", resource.name], probe=True)
     except error.SystemError as exc:
-        if exc.returncode == 1:
-            return False
+        return check_query_error(resource, exc)
+    return True
 
-        raise error.PackageError(
-            f"{resource} search failed with return code {exc.returncode}"
-        )
 
+async def is_installed_async(resource):
+    """Like ``is_installed``, but awaits rpm on the event loop"""
+    try:
+        await platform.async_check_call(["rpm", "-q", resource.name], probe=True)
+    except error.SystemError as exc:
+        return check_query_error(resource, exc)
     return True
 
 
+def check_query_error(resource, exc):
+    if exc.returncode == 1:
+        return False
+
+    raise error.PackageError(
+        f"{resource} search failed with return code {exc.returncode}"
+    )
+
+
+class RpmDatabase:
+
+    """A snapshot of the packages that rpm reports as installed. It is taken
+    with a single rpm query and shared by every Package resource in a run,
+    and is discarded whenever a package manager is run."""
+
+    COMMAND = ["rpm", "-qa", "--qf", "%{NAME}\\n%{NAME}.%{ARCH}\\n"]
+
+    def __init__(self, listing):
+        self.installed = set(listing.split())
+
+        # Qualified names, which rpm is asked about one by one
+        self.qualified = {}
+
+    @classmethod
+    def get(cls, runner):
+        if not isinstance(runner.shared.get("packages"), cls):
+            try:
+                stdout, stderr = platform.check_call(cls.COMMAND, probe=True)
+            except error.SystemError as exc:
+                raise cls.listing_failed(exc)
+            runner.shared["packages"] = cls(stdout)
+        return runner.shared["packages"]
+
+    @classmethod
+    async def get_async(cls, runner):
+        """Like ``get``, but awaits rpm on the event loop"""
+        if not isinstance(runner.shared.get("packages"), cls):
+            try:
+                stdout, stderr = await platform.async_check_call(
+                    cls.COMMAND, probe=True
+                )
+            except error.SystemError as exc:
+                raise cls.listing_failed(exc)
+            runner.shared["packages"] = cls(stdout)
+        return runner.shared["packages"]
+
+    @staticmethod
+    def listing_failed(exc):
+        return error.PackageError(
+            "Listing packages failed with return code %d" % exc.returncode
+        )
+
+    def needs_query(self, name):
+        # rpm also accepts names qualified with a version, release or epoch,
+        # which the snapshot can't answer. Those can only be installed if the
+        # name before one of their dashes is, so only they need asking about.
+        if name in self.installed:
+            return False
+        for i, c in enumerate(name):
+            if c == "-" and name[:i] in self.installed:
+                return True
+        return False
+
+    def is_installed(self, resource):
+        name = resource.name
+        if not self.needs_query(name):
+            return name in self.installed
+        if name not in self.qualified:
+            self.qualified[name] = is_installed(resource)
+        return self.qualified[name]
+
+    async def is_installed_async(self, resource):
+        """Like ``is_installed``, but awaits any query on the event loop"""
+        name = resource.name
+        if self.needs_query(name) and name not in self.qualified:
+            self.qualified[name] = await is_installed_async(resource)
+        return self.is_installed(resource)
+
+
 class YumInstall(provider.Provider):
 
     policies = (resources.package.PackageInstallPolicy,)
+    isvalid_arguments = ("backend",)
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -41,25 +126,46 @@ class YumInstall(provider.Provider):
             return True
         return False
 
+    def fingerprint(self):
+        return [ledger.observe_path(path) for path in RPMDB_FILES]
+
     def apply(self):
-        if is_installed(self.resource):
+        if RpmDatabase.get(self.runner).is_installed(self.resource):
             return False
 
-        command = ["yum", "install", "-y", self.resource.name]
+        try:
+            self.change(ShellCommand(self.get_command()))
+        except error.SystemError as exc:
+            raise self.failed(exc)
+
+        return True
+
+    async def apply_async(self):
+        """Like ``apply``, but rpm and yum are awaited on the event loop"""
+        database = await RpmDatabase.get_async(self.runner)
+        if await database.is_installed_async(self.resource):
+            return False
 
         try:
-            self.change(ShellCommand(command))
+            await self.change_async(ShellCommand(self.get_command()))
         except error.SystemError as exc:
-            raise error.PackageError(
-                "%s failed with return code %d" % (self.resource, exc.returncode)
-            )
+            raise self.failed(exc)
 
         return True
 
+    def get_command(self):
+        return ["yum", "install", "-y", self.resource.name]
+
+    def failed(self, exc):
+        return error.PackageError(
+            "%s failed with return code %d" % (self.resource, exc.returncode)
+        )
+
 
 class YumUninstall(provider.Provider):
 
     policies = (resources.package.PackageUninstallPolicy,)
+    isvalid_arguments = ("backend",)
 
     @classmethod
     def isvalid(self, policy, resource):
@@ -67,18 +173,38 @@ class YumUninstall(provider.Provider):
             return True
         return False
 
+    def fingerprint(self):
+        return [ledger.observe_path(path) for path in RPMDB_FILES]
+
     def apply(self):
-        if not is_installed(self.resource):
+        if not RpmDatabase.get(self.runner).is_installed(self.resource):
             return False
 
-        command = ["yum", "remove", "-y", self.resource.name]
+        try:
+            self.change(ShellCommand(self.get_command()))
+        except error.SystemError as exc:
+            raise self.failed(exc)
+
+        return True
+
+    async def apply_async(self):
+        """Like ``apply``, but rpm and yum are awaited on the event loop"""
+        database = await RpmDatabase.get_async(self.runner)
+        if not await database.is_installed_async(self.resource):
+            return False
 
         try:
-            self.change(ShellCommand(command))
+            await self.change_async(ShellCommand(self.get_command()))
         except error.SystemError as exc:
-            raise error.PackageError(
-                "%s failed to uninstall with return code %d"
-                % (self.resource, exc.returncode)
-            )
+            raise self.failed(exc)
 
         return True
+
+    def get_command(self):
+        return ["yum", "remove", "-y", self.resource.name]
+
+    def failed(self, exc):
+        return error.PackageError(
+            "%s failed to uninstall with return code %d"
+            % (self.resource, exc.returncode)
+        )
@@ -36,6 +36,25 @@ class ResourceType(type):
 
     def __new__(meta, class_name, bases, new_attrs):
         new_attrs.setdefault("__resource_name__", class_name)
+
+        arguments = {k: v for k, v in new_attrs.items() if isinstance(v, Argument)}
+
+        # A class that declares __slots__, as the built-in resources do, also
+        # gets a slot for each argument it defines, and has no instance
+        # __dict__. Other classes get a __dict__ from Python as usual and keep
+        # their arguments in it, so they can still be combined with multiple
+        # inheritance and given extra attributes.
+        if "__slots__" in new_attrs:
+            slotted = set()
+            for b in bases:
+                for klass in b.__mro__:
+                    slotted.update(klass.__dict__.get("__slots__", ()))
+            slots = tuple(new_attrs["__slots__"])
+            for value in arguments.values():
+                if value.arg_id not in slotted and value.arg_id not in slots:
+                    slots += (value.arg_id,)
+            new_attrs["__slots__"] = slots
+
         cls = type.__new__(meta, class_name, bases, new_attrs)
 
         cls.__args__ = {}
@@ -54,9 +73,13 @@ class ResourceType(type):
             else:
                 meta.resources[cls.__resource_name__] = cls
 
-        for key, value in new_attrs.items():
-            if isinstance(value, Argument):
-                cls.__args__[key] = value
+        cls.__args__.update(arguments)
+
+        # Each class numbers all of its arguments, including inherited ones,
+        # in its own presence bitmap
+        cls.__masks__ = {}
+        for value in cls.__args__.values():
+            cls.__masks__.setdefault(value, 1 << len(cls.__masks__))
 
         return cls
 
@@ -138,9 +161,13 @@ class Resource(metaclass=ResourceType):
                   on: File[/var/local/sites/foobar/apache/apache.cfg]
     """
 
+    __slots__ = ("_present", "observers")
+
     def __init__(self, **kwargs):
         """Takes a reference to a Yay AST node"""
-        self.observers = list()
+        self._present = 0
+        # Most resources are never observed, so they share an empty tuple
+        self.observers = ()
 
         for key, value in kwargs.items():
             if key not in self.__args__:
@@ -175,11 +202,13 @@ class Resource(metaclass=ResourceType):
 
     def register_observer(self, when, resource, policy):
         logger.debug(f"{self!r} is being observed by {resource!r} for {when}")
+        if not self.observers:
+            self.observers = []
         self.observers.append(resource)
 
-    def apply(self, runner):
-        """Apply the provider for the selected policy, and then fire any
-        events that are being observed."""
+    def get_provider(self, runner):
+        """Return the provider that should apply this resource, or None if it
+        doesn't need applying."""
 
         adapter = log.LoggerAdapter(logger, {"fuselage.resource": self.id})
 
@@ -187,15 +216,42 @@ class Resource(metaclass=ResourceType):
             adapter.debug(
                 "Skipping resource apply as subscribed to triggers that are not set"
             )
-            return False
+            return None
 
         provider = self.policy.get_provider()(self, runner)
-        changed = provider.apply()
+
+        ledger = getattr(runner, "ledger", None)
+        if ledger and not self.watches and ledger.is_current(self, provider):
+            adapter.debug("Skipping resource apply as unchanged since the last run")
+            return None
+
+        return provider
+
+    def applied(self, runner, provider, changed):
+        """Record that ``provider`` has applied this resource"""
         runner.state.unset_trigger(self)
+        ledger = getattr(runner, "ledger", None)
+        if ledger:
+            ledger.record(self, provider)
         if changed:
             self.fire_event(runner)
         return changed
 
+    def apply(self, runner):
+        """Apply the provider for the selected policy, and then fire any
+        events that are being observed."""
+        provider = self.get_provider(runner)
+        if provider is None:
+            return False
+        return self.applied(runner, provider, provider.apply())
+
+    async def apply_async(self, runner):
+        """Like ``apply``, but awaits the provider's ``apply_async``"""
+        provider = self.get_provider(runner)
+        if provider is None:
+            return False
+        return self.applied(runner, provider, await provider.apply_async())
+
     def fire_event(self, context):
         """Apply the appropriate policies on the resources that are observing
         this resource for the firing of a policy."""
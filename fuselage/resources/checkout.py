@@ -30,6 +30,8 @@ class Checkout(Resource):
     commands (such as `svn switch`) to take the resource to the desired state.
     """
 
+    __slots__ = ()
+
     name = FullPath()
     """ The full path to the working copy on disk. """
 
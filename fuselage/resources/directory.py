@@ -35,6 +35,8 @@ class Directory(Resource):
 
     """
 
+    __slots__ = ()
+
     name = FullPath()
     """ The full path to the directory on disk """
 
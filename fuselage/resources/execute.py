@@ -44,6 +44,8 @@ class Execute(Resource):
 
     """
 
+    __slots__ = ()
+
     @property
     def implicit_id(self):
         implicit_id = super().implicit_id
@@ -78,6 +78,9 @@ class File(Resource):
 
     sensitive = Boolean(default=False)
 
+    # Set by the bundle on the Files it creates for watched paths
+    __slots__ = ("_implicit", "_original_hash")
+
     def hash(self):
         from fuselage import platform
 
@@ -29,6 +29,8 @@ class Group(Resource):
             system: true
     """
 
+    __slots__ = ()
+
     name = String()
     """ The name of the unix group. """
 
@@ -18,7 +18,7 @@ and the contents of the files themselves. """
 
 import os
 
-from fuselage.argument import Boolean, FullPath, String
+from fuselage.argument import Boolean, FullPath, Regex, String
 from fuselage.policy import Policy, Present
 from fuselage.resource import Resource
 from fuselage.utils import force_str, simple_str
@@ -38,6 +38,8 @@ class Line(Resource):
         )
     """
 
+    __slots__ = ()
+
     @property
     def implicit_id(self):
         return force_str(self.name) + ":" + simple_str(self.match)
@@ -48,7 +50,7 @@ class Line(Resource):
     line = String(default="")
     """ The text to insert at the point the expression matches (otherwise at the end of the file). """
 
-    match = String(default="")
+    match = Regex(default="")
     """ The python regular expression to match the line to be updated. """
 
     linesep = String(default=os.linesep)
@@ -36,6 +36,8 @@ class Link(Resource):
 
     """
 
+    __slots__ = ()
+
     name = FullPath()
     """The name of the file this resource represents."""
 
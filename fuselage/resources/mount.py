@@ -21,6 +21,8 @@ from fuselage.resource import Resource
 
 class Mount(Resource):
 
+    __slots__ = ()
+
     name = FullPath()
     """The name of the file this resource represents."""
 
@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage.argument import Boolean, String
+from fuselage.argument import Boolean, Integer, String
 from fuselage.policy import Absent, Policy, Present
 from fuselage.resource import Resource
 
@@ -30,6 +30,8 @@ class Package(Resource):
 
     """
 
+    __slots__ = ()
+
     name = String()
     """ The name of the package. This can be a single package or a list can be
     supplied. """
@@ -42,6 +44,13 @@ class Package(Resource):
     purge = Boolean(default=False)
     """ When removing a package, whether to purge it or not. """
 
+    index_max_age = Integer()
+    """ The maximum age, in seconds, of the package index before a package is
+    installed. If the index is older than this, or doesn't know about the
+    package, it is refreshed first. The index is refreshed at most once per
+    run. When not set the index is only refreshed if installing fails. Only
+    the Apt provider supports this. """
+
     backend = String()
     """ On a normal system, this does not need to be set. Set to 'apt' to force
     the use of apt-get, and 'yum' to force the use of yum. """
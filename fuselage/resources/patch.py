@@ -32,6 +32,8 @@ class Patch(Resource):
 
     """
 
+    __slots__ = ()
+
     name = FullPath()
     """The full path to the file this resource represents."""
 
@@ -21,6 +21,8 @@ class Service(Resource):
 
     """This represents service startup and shutdown via an init daemon."""
 
+    __slots__ = ()
+
     name = String()
     """ A unique name representing an initd service.
 
@@ -23,6 +23,8 @@ class Special(Resource):
 
     """A special file, as created by mknod."""
 
+    __slots__ = ()
+
     name = FullPath()
     """ The full path to the special file on disk. """
 
@@ -34,6 +34,8 @@ class User(Resource):
 
     """
 
+    __slots__ = ()
+
     name = String()
     """ The username this resource represents. """
 
@@ -12,13 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import io
 import logging
 import optparse
 import os
 import pkgutil
 import sys
+import zipfile
 
-from fuselage import bundle, error, event, log, platform
+from fuselage import bundle, error, event, fingerprint, ledger, log, platform, policy
 from fuselage.error import NothingChanged
 from fuselage.utils import force_str
 
@@ -38,10 +41,19 @@ class Runner:
         simulate=False,
         verbosity=logging.INFO,
         state_path=None,
+        jobs=1,
+        fingerprints=False,
+        native=False,
+        incremental=False,
+        fork_server=False,
+        asset_store=None,
     ):
         if resume and no_resume:
             raise error.ParseError("'resume' and 'no_resume' cannot both be True")
 
+        if jobs < 1:
+            raise error.ParseError("'jobs' must be at least 1")
+
         if state_path is not None:
             self.state_path = state_path
 
@@ -51,12 +63,43 @@ class Runner:
         self.no_changes_ok = no_changes_ok
         self.simulate = simulate
         self.verbosity = verbosity
+        self.jobs = jobs
+
+        self.native = native
+        """ Make filesystem changes with system calls instead of running
+        chown, chmod, mkdir, rm and ln. """
+
+        self.fork_server = fork_server
+        """ Run read-only probe commands through a helper process that is
+        started once per run. """
+
+        self.asset_store = asset_store or os.path.join(self.state_path, "assets")
+        """ A directory of assets named by their digest, for payloads that
+        were built without them. """
+
+        self.shared = {}
+        """ Scratch space for providers that keep state across all of the
+        resources of a run, keyed by provider. """
 
         self.state = event.EventState(
             save_file=os.path.join(self.state_path, "events.saved"),
             simulate=self.simulate,
         )
 
+        self.fingerprints = None
+        if fingerprints:
+            self.fingerprints = fingerprint.FingerprintCache(
+                save_file=os.path.join(self.state_path, "fingerprints.json"),
+                simulate=self.simulate,
+            )
+
+        self.ledger = None
+        if incremental:
+            self.ledger = ledger.Ledger(
+                save_file=os.path.join(self.state_path, "ledger.json"),
+                simulate=self.simulate,
+            )
+
     @classmethod
     def get_resources(cls):
         return bundle.ResourceBundle()
@@ -71,6 +114,12 @@ class Runner:
         p.add_option("--no-changes-ok", action="store_true", default=False)
         p.add_option("-v", "--verbose", action="count", default=0)
         p.add_option("-q", "--quiet", action="count", default=0)
+        p.add_option("-j", "--jobs", type="int", default=1)
+        p.add_option("--fingerprints", action="store_true", default=False)
+        p.add_option("--native", action="store_true", default=False)
+        p.add_option("--incremental", action="store_true", default=False)
+        p.add_option("--fork-server", action="store_true", default=False)
+        p.add_option("--asset-store", default=None)
         opts, args = p.parse_args(argv)
 
         return cls(
@@ -81,9 +130,15 @@ class Runner:
             simulate=opts.simulate,
             verbosity=logging.INFO - (10 * (opts.verbose - opts.quiet)),
             state_path=opts.state,
+            jobs=opts.jobs,
+            fingerprints=opts.fingerprints,
+            native=opts.native,
+            incremental=opts.incremental,
+            fork_server=opts.fork_server,
+            asset_store=opts.asset_store,
         )
 
-    def run(self):
+    def _start(self):
         log.configure(verbosity=self.verbosity, force=True)
 
         logger.debug("Runner started")
@@ -94,13 +149,48 @@ class Runner:
             platform.makedirs(self.state_path)
 
         self.state.open()
+        self.shared.clear()
+        platform.invalidate_identities()
+
+        if self.fingerprints:
+            self.fingerprints.load()
+        if self.ledger:
+            self.ledger.load()
+        if self.fork_server:
+            platform.start_probe_server()
+
+    def _stop(self):
+        stats = policy.provider_cache.stats()
+        logger.debug(
+            "Provider cache: %d hits, %d misses, %d uncached (%.0f%% hit rate)"
+            % (
+                stats["hits"],
+                stats["misses"],
+                stats["uncached"],
+                stats["hit_rate"] * 100,
+            )
+        )
+        if self.fingerprints:
+            self.fingerprints.save()
+        if self.fork_server:
+            platform.stop_probe_server()
 
+    def run(self):
+        self._start()
         try:
             changed = self.resources.apply(self)
         except NothingChanged:
+            # Every resource is still in its recorded state
+            if self.ledger:
+                self.ledger.save()
             if not self.no_changes_ok:
                 raise
             changed = []
+        else:
+            if self.ledger:
+                self.ledger.save()
+        finally:
+            self._stop()
 
         # FIXME: Do we get here if no change has occured??
         self.state.success()
@@ -108,14 +198,57 @@ class Runner:
         return changed
 
 
+class AsyncRunner(Runner):
+
+    """A runner that applies its resources from an asyncio event loop. Up to
+    ``jobs`` resources are in flight at once, and providers with a native
+    ``apply_async`` share the loop instead of each holding a thread."""
+
+    def run(self):
+        return asyncio.run(self.run_async())
+
+    async def run_async(self):
+        self._start()
+        try:
+            changed = await self.resources.apply_async(self)
+        except NothingChanged:
+            if self.ledger:
+                self.ledger.save()
+            if not self.no_changes_ok:
+                raise
+            changed = []
+        else:
+            if self.ledger:
+                self.ledger.save()
+        finally:
+            self._stop()
+
+        self.state.success()
+
+        return changed
+
+
 class BundledRunner(Runner):
     @classmethod
     def get_resources(self):
         loader = pkgutil.get_loader("fuselage")
+        b = bundle.ResourceBundle()
+
+        archive = getattr(loader, "archive", None)
+        if archive:
+            # Stream the resources straight out of the payload
+            with zipfile.ZipFile(archive) as zf:
+                try:
+                    fp = zf.open("resources.json")
+                except KeyError:
+                    raise error.ParseError("Bundle is missing resources.json")
+                with fp:
+                    b.load(io.TextIOWrapper(fp, encoding="utf-8"))
+            return b
+
         try:
             resources_json = loader.get_data("resources.json").decode("ascii")
         except OSError:
             raise error.ParseError("Bundle is missing resources.json")
-        b = bundle.ResourceBundle()
         b.loads(force_str(resources_json))
         return b
@@ -1,51 +1,142 @@
+from concurrent import futures
+import io
 import os
-import time
-from typing import Optional
+import posixpath
+import shlex
+import stat
+import sys
+import threading
+from typing import Callable, Dict, Iterable, Optional, Union
 
 import paramiko
 
-from .builder import build
+from .builder import PayloadCache, build, build_delta
 from .bundle import ResourceBundle
+from .error import NothingChanged
 
+# How much to read from a channel at a time
+CHUNK_SIZE = 32 * 1024
+
+# Exit codes from a payload that mean it succeeded
+SUCCESS_CODES = (0, NothingChanged.returncode)
 
-def iter_chunks(channel: paramiko.Channel):
-    while not channel.exit_status_ready():
-        while channel.recv_ready():
-            yield channel.recv(1024)
-        time.sleep(0.1)
 
-    while channel.recv_ready():
-        yield channel.recv(1024)
+def iter_chunks(channel: paramiko.Channel):
+    # recv blocks until there is data, and returns nothing once the remote
+    # end has closed the channel, so there is no need to poll
+    while True:
+        chunk = channel.recv(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
 
 
 def iter_lines(channel: paramiko.Channel):
     buffer = bytearray()
     for chunk in iter_chunks(channel):
+        # Only the new chunk can contain a newline
         buffer.extend(chunk)
+        end = buffer.find(b"\n", len(buffer) - len(chunk))
 
-        while b"\n" in buffer:
-            line, buffer = buffer.split(b"\n", 1)
-            yield line.decode("utf-8")
+        start = 0
+        while end != -1:
+            yield buffer[start:end].decode("utf-8", "replace")
+            start = end + 1
+            end = buffer.find(b"\n", start)
+        del buffer[:start]
 
+    if buffer:
+        yield buffer.decode("utf-8", "replace")
 
-def execute_via_ssh(
+
+class TransportPool:
+
+    """
+    Keeps one connected transport, and one SFTP client, per host so that
+    repeated deployments don't have to reconnect.
+
+    ``connect`` is called with a host and must return a connected
+    ``paramiko.Transport``::
+
+        def connect(host):
+            transport = paramiko.Transport((host, 22))
+            transport.connect(username="ubuntu", pkey=key)
+            return transport
+
+        with TransportPool(connect) as pool:
+            deploy(pool, hosts, bundle)
+    """
+
+    def __init__(self, connect: Callable[[str], paramiko.Transport]):
+        self.connect = connect
+        self._lock = threading.Lock()
+        self._transports = {}
+        self._sftp = {}
+
+    def get(self, host: str) -> paramiko.Transport:
+        with self._lock:
+            transport = self._transports.get(host)
+        if transport is not None and transport.is_active():
+            return transport
+
+        self.discard(host)
+        transport = self.connect(host)
+        with self._lock:
+            self._transports[host] = transport
+        return transport
+
+    def get_sftp(self, host: str) -> paramiko.SFTPClient:
+        transport = self.get(host)
+        with self._lock:
+            sftp = self._sftp.get(host)
+        if sftp is None:
+            sftp = transport.open_sftp_client()
+            with self._lock:
+                self._sftp[host] = sftp
+        return sftp
+
+    def discard(self, host: str):
+        """Close and forget the connection to ``host``, for example after it
+        has failed."""
+        with self._lock:
+            transport = self._transports.pop(host, None)
+            sftp = self._sftp.pop(host, None)
+        if sftp is not None:
+            sftp.close()
+        if transport is not None:
+            transport.close()
+
+    def close(self):
+        with self._lock:
+            hosts = list(self._transports)
+        for host in hosts:
+            self.discard(host)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_payload(
     transport: paramiko.Transport,
-    bundle: ResourceBundle,
+    sftp: paramiko.SFTPClient,
+    payload: bytes,
     dry_run: bool = False,
     username: Optional[str] = "root",
     sudo_password: Optional[str] = None,
-):
-    """
-    transport = paramiko.Transport(("localhost", 22))
-    transport.connect(
-        username="ubuntu",
-        password="password55",
-    )
-    execute(transport, bundle, "root", "mysudopassword")
-    """
-    payload = build(bundle)
+    output: Callable[[str], None] = print,
+    assets: Optional[Dict[str, bytes]] = None,
+    asset_store: Optional[str] = None,
+) -> int:
+    """Upload an already built ``payload`` with ``sftp``, run it over
+    ``transport`` and return its exit status. Each line of output is passed
+    to ``output``.
 
-    sftp = transport.open_sftp_client()
+    If ``asset_store`` is given, any of ``assets`` that aren't already in
+    that directory on the target are uploaded to it first, and the payload
+    is told to look for its assets there."""
     sftp.chdir(".")
 
     path = os.path.join(sftp.getcwd(), ".payload.pex")
@@ -55,6 +146,13 @@ def execute_via_ssh(
     if dry_run:
         command_parts.append("--simulate")
 
+    sudo = bool(username and username != transport.get_username())
+
+    if asset_store:
+        asset_store = posixpath.join(sftp.getcwd(), asset_store)
+        upload_assets(sftp, assets or {}, asset_store, shared=sudo)
+        command_parts.extend(("--asset-store", shlex.quote(asset_store)))
+
     command = " ".join(command_parts)
 
     channel = transport.open_session()
@@ -62,36 +160,221 @@ def execute_via_ssh(
     channel.set_combine_stderr(1)
 
     try:
-        sftp.putfo(payload, path)
+        sftp.putfo(io.BytesIO(payload), path)
         sftp.chmod(path, 0o755)
 
-        try:
-            if username and username != transport.get_username():
-                command = f"sudo -u {username} {command}"
-                channel.exec_command(command)
+        if sudo:
+            command = f"sudo -u {username} {command}"
+            channel.exec_command(command)
 
-                if sudo_password:
-                    first_line = channel.recv(1024)
+            if sudo_password:
+                first_line = channel.recv(1024)
 
-                    if b"[sudo]" not in first_line and not first_line.startswith(
-                        b"Password:"
-                    ):
-                        raise RuntimeError(f"Expected sudo, got {first_line!r}")
+                if b"[sudo]" not in first_line and not first_line.startswith(
+                    b"Password:"
+                ):
+                    raise RuntimeError(f"Expected sudo, got {first_line!r}")
 
-                    channel.sendall((sudo_password + "\n").encode("utf-8"))
-            else:
-                channel.exec_command(path)
+                channel.sendall((sudo_password + "\n").encode("utf-8"))
+        else:
+            channel.exec_command(command)
 
-            channel.shutdown_write()
+        channel.shutdown_write()
 
-            try:
-                for line in iter_lines(channel):
-                    print(line)
+        try:
+            for line in iter_lines(channel):
+                output(line)
 
-                return channel.recv_exit_status()
-            finally:
-                channel.close()
+            return channel.recv_exit_status()
         finally:
-            sftp.remove(path)
+            channel.close()
+    finally:
+        sftp.remove(path)
+
+
+def makedirs(sftp: paramiko.SFTPClient, path: str, mode: int = 0o700):
+    try:
+        sftp.stat(path)
+    except FileNotFoundError:
+        makedirs(sftp, posixpath.dirname(path), mode)
+        sftp.mkdir(path, mode)
+
+
+def upload_assets(
+    sftp: paramiko.SFTPClient,
+    assets: Dict[str, bytes],
+    store: str,
+    shared: bool = False,
+):
+    """Copy the ``assets`` that ``store`` doesn't already have into it. Each
+    is uploaded to a temporary name first, so a store never contains a
+    partial asset.
+
+    The store is private to the login user, unless it is ``shared`` with a
+    payload run as another user through sudo. Then the store and its assets
+    are made readable by everyone, like the payload itself."""
+    dir_mode, file_mode = (0o755, 0o644) if shared else (0o700, 0o600)
+
+    makedirs(sftp, store, dir_mode)
+    if ~stat.S_IMODE(sftp.stat(store).st_mode) & dir_mode:
+        sftp.chmod(store, dir_mode)
+
+    present = {}
+    for attrs in sftp.listdir_attr(store):
+        present[attrs.filename] = stat.S_IMODE(attrs.st_mode)
+
+    for digest, contents in assets.items():
+        path = posixpath.join(store, digest)
+        if digest in present:
+            if ~present[digest] & file_mode:
+                sftp.chmod(path, file_mode)
+            continue
+        tmp = posixpath.join(store, "." + digest + ".tmp")
+        sftp.putfo(io.BytesIO(contents), tmp)
+        sftp.chmod(tmp, file_mode)
+        sftp.posix_rename(tmp, path)
+
+
+def build_payload(bundle, asset_store=None, **options):
+    """Build the payload for ``bundle``, and the assets to upload separately
+    if there is an ``asset_store``."""
+    if asset_store:
+        payload, assets = build_delta(bundle, **options)
+        return payload.getvalue(), assets
+    return build(bundle, **options).getvalue(), None
+
+
+def execute_via_ssh(
+    transport: paramiko.Transport,
+    bundle: ResourceBundle,
+    dry_run: bool = False,
+    username: Optional[str] = "root",
+    sudo_password: Optional[str] = None,
+    cache: Optional[PayloadCache] = None,
+    bytecode: bool = False,
+    prune: bool = False,
+    asset_store: Optional[str] = None,
+):
+    """
+    transport = paramiko.Transport(("localhost", 22))
+    transport.connect(
+        username="ubuntu",
+        password="password55",
+    )
+    execute(transport, bundle, "root", "mysudopassword")
+
+    With ``asset_store``, a directory on the target (relative to the home
+    directory, unless absolute), only the assets missing from it are
+    uploaded rather than a payload containing all of them.
+    """
+    payload, assets = build_payload(
+        bundle, asset_store, cache=cache, bytecode=bytecode, prune=prune
+    )
+
+    sftp = transport.open_sftp_client()
+    try:
+        return run_payload(
+            transport,
+            sftp,
+            payload,
+            dry_run=dry_run,
+            username=username,
+            sudo_password=sudo_password,
+            assets=assets,
+            asset_store=asset_store,
+        )
     finally:
         sftp.close()
+
+
+class PrefixedOutput:
+
+    """Writes whole lines of output from several hosts to ``stream``, each
+    prefixed with the host it came from."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def __call__(self, host: str, line: str):
+        with self._lock:
+            self.stream.write(f"{host}: {line}\n")
+            self.stream.flush()
+
+
+def deploy(
+    pool: TransportPool,
+    hosts: Iterable[str],
+    bundle: ResourceBundle,
+    parallelism: int = 10,
+    max_failures: int = 0,
+    dry_run: bool = False,
+    username: Optional[str] = "root",
+    sudo_password: Optional[str] = None,
+    output: Optional[Callable[[str, str], None]] = None,
+    cache: Optional[PayloadCache] = None,
+    bytecode: bool = False,
+    prune: bool = False,
+    asset_store: Optional[str] = None,
+) -> Dict[str, Union[int, Exception]]:
+    """
+    Apply ``bundle`` to every host in ``hosts``, on up to ``parallelism``
+    hosts at once. The payload is built once and connections come from
+    ``pool``.
+
+    A host fails if it can't be reached or its payload exits with an error.
+    Once more than ``max_failures`` hosts have failed no more are started,
+    although the ones already running are allowed to finish.
+
+    Returns the exit status, or the exception raised, for each host that was
+    started. Hosts that were never started are left out.
+    """
+    payload, assets = build_payload(
+        bundle, asset_store, cache=cache, bytecode=bytecode, prune=prune
+    )
+    output = output or PrefixedOutput()
+
+    def apply(host):
+        try:
+            return run_payload(
+                pool.get(host),
+                pool.get_sftp(host),
+                payload,
+                dry_run=dry_run,
+                username=username,
+                sudo_password=sudo_password,
+                output=lambda line: output(host, line),
+                assets=assets,
+                asset_store=asset_store,
+            )
+        except Exception:
+            pool.discard(host)
+            raise
+
+    hosts = iter(hosts)
+    results = {}
+    failures = 0
+    running = {}
+
+    with futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+        while True:
+            while failures <= max_failures and len(running) < parallelism:
+                host = next(hosts, None)
+                if host is None:
+                    break
+                running[executor.submit(apply, host)] = host
+
+            if not running:
+                break
+
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                host = running.pop(future)
+                try:
+                    results[host] = future.result()
+                except Exception as e:
+                    results[host] = e
+                if results[host] not in SUCCESS_CODES:
+                    failures += 1
+
+    return results
@@ -15,6 +15,9 @@
 import re
 import unicodedata
 
+# Every pattern compiled by compile_pattern, by its source
+_patterns = {}
+
 
 def force_str(s):
     if isinstance(s, str):
@@ -49,3 +52,14 @@ def simple_str(s):
     s = re.sub(r"[^\w\s-]", "", s)
     s = re.sub(r"[-\s]+", "-", s)
     return s
+
+
+def compile_pattern(pattern):
+    """Compile a regular expression, or return the one already compiled from
+    the same source. Unlike the cache in the ``re`` module this never throws
+    patterns away, so bundles with thousands of distinct patterns still only
+    compile each of them once."""
+    try:
+        return _patterns[pattern]
+    except KeyError:
+        return _patterns.setdefault(pattern, re.compile(pattern))
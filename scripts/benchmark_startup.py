@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+"""
+Compare how long an empty payload takes to start with and without embedded
+bytecode.
+
+Each payload is run with ``--help``, which imports the whole runtime and then
+exits, first under ``python -X importtime`` to total the time spent importing
+fuselage and then a number of times to time the whole process.
+
+    python scripts/benchmark_startup.py [-n RUNS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fuselage import builder, bundle
+
+
+def get_import_time(path):
+    """Return the microseconds spent importing fuselage modules, as reported
+    by ``-X importtime``"""
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", path, "--help"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    total = 0
+    for line in p.stderr.decode("utf-8").splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split(":", 1)[1].split("|")
+        if parts[2].strip().startswith("fuselage"):
+            try:
+                total += int(parts[0])
+            except ValueError:
+                continue
+    return total
+
+
+def get_wall_time(path, runs):
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, path, "--help"], stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for bytecode in (False, True):
+            path = os.path.join(tmp, "payload-%d.pex" % bytecode)
+            payload = builder.build(bundle.ResourceBundle(), bytecode=bytecode)
+            with open(path, "wb") as fp:
+                fp.write(payload.getvalue())
+
+            print(
+                "bytecode=%-5s size=%7d importtime=%6.1fms median=%6.1fms"
+                % (
+                    bytecode,
+                    os.path.getsize(path),
+                    get_import_time(path) / 1000,
+                    get_wall_time(path, args.runs) * 1000,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
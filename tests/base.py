@@ -57,6 +57,9 @@ class TestCaseWithBundle(unittest.TestCase):
 
 
 class TestCaseWithRealRunner(TestCaseWithBundle):
+
+    native = False
+
     def setUp(self):
         super().setUp()
         log.configure(verbosity=logging.DEBUG, force=True)
@@ -75,6 +78,7 @@ class TestCaseWithRealRunner(TestCaseWithBundle):
             self.bundle,
             simulate=simulate,
             state_path=os.path.join(os.getcwd(), ".fuselage-test-state"),
+            native=self.native,
         )
         return r.run()
 
@@ -153,6 +157,7 @@ class TestCaseWithRunner(TestCaseWithBundle):
             "lexists",
             "get",
             "put",
+            "append",
             "makedirs",
             "unlink",
             "exists",
@@ -14,7 +14,7 @@
 
 import unittest
 
-from fuselage import argument, error, resource
+from fuselage import argument, error, resource, resources, utils
 
 
 class TestArguments(unittest.TestCase):
@@ -74,8 +74,107 @@ class TestArguments(unittest.TestCase):
         # r.a = "off"
         # self.assertEqual(r.a, False)
 
+    def test_regex(self):
+        class R_test_regex(resource.Resource):
+            a = argument.Regex()
+
+        r = R_test_regex(id="test", a="^foo")
+        self.assertEqual(r.a, "^foo")
+        self.assertIs(utils.compile_pattern(r.a), utils.compile_pattern("^foo"))
+        self.assertRaises(error.ParseError, setattr, r, "a", "(")
+
     # def test_full_path(self):
     #    class R_test_full_path(resource.Resource):
     #        a = argument.FullPath()
     #    self.assertTrue(isinstance(R_test_full_path.a, argument.FullPath))
     #    self.assertRaises(error.ParseError, R_test_full_path, id="test", a="test")
+
+
+class TestArgumentStorage(unittest.TestCase):
+    def test_slots(self):
+        class R_test_storage(resource.Resource):
+            __slots__ = ()
+            a = argument.String()
+            b = argument.String(default="b")
+
+        r = R_test_storage(id="test", a="a")
+        self.assertIn(R_test_storage.a.arg_id, R_test_storage.__slots__)
+        self.assertTrue(R_test_storage.a.present(r))
+        self.assertFalse(R_test_storage.b.present(r))
+        self.assertEqual((r.a, r.b), ("a", "b"))
+
+        r.b = None
+        self.assertTrue(R_test_storage.b.present(r))
+        self.assertIsNone(r.b)
+        self.assertFalse(hasattr(r, "__dict__"))
+
+    def test_builtin_resources_have_no_dict(self):
+        builtin = [
+            cls
+            for cls in vars(resources).values()
+            if isinstance(cls, resource.ResourceType) and cls is not resource.Resource
+        ]
+        self.assertGreater(len(builtin), 10)
+        for cls in builtin:
+            self.assertNotIn("__dict__", dir(cls), cls.__name__)
+        f = resources.File(name="/tmp/test_builtin_resources_have_no_dict")
+        self.assertFalse(hasattr(f, "__dict__"))
+
+    def test_extra_attributes(self):
+        class R_test_storage_extra(resource.Resource):
+            a = argument.String()
+
+        r = R_test_storage_extra(id="test", a="a")
+        r.note = "note"
+        self.assertEqual((r.a, r.note), ("a", "note"))
+
+    def test_subclass(self):
+        class R_test_storage_base(resource.Resource):
+            __slots__ = ()
+            a = argument.String()
+
+        class R_test_storage_sub(R_test_storage_base):
+            b = argument.String()
+
+            def describe(self):
+                self.described = True
+                return self.a + self.b
+
+        r = R_test_storage_sub(id="test", a="a", b="b")
+        self.assertEqual(r.describe(), "ab")
+        self.assertEqual(
+            r.serialize(), {"R_test_storage_sub": {"id": "test", "a": "a", "b": "b"}}
+        )
+
+    def test_multiple_inheritance(self):
+        class R_test_storage_left(resource.Resource):
+            a = argument.String()
+
+        class R_test_storage_right(resource.Resource):
+            b = argument.String()
+
+        class R_test_storage_both(R_test_storage_left, R_test_storage_right):
+            c = argument.String()
+
+        masks = R_test_storage_both.__masks__
+        self.assertEqual(len(set(masks.values())), len(masks))
+
+        r = R_test_storage_both(id="test", b="b", c="c")
+        self.assertEqual((r.a, r.b, r.c), (None, "b", "c"))
+        self.assertFalse(R_test_storage_both.a.present(r))
+
+    def test_argument_shared_between_resources(self):
+        class R_test_storage_shared(resource.Resource):
+            __slots__ = ()
+            a = argument.String()
+            b = argument.String()
+
+        class R_test_storage_shared_again(resource.Resource):
+            __slots__ = ()
+            b = R_test_storage_shared.b
+
+        first = R_test_storage_shared(id="first", b="first")
+        again = R_test_storage_shared_again(id="again")
+        self.assertEqual((first.b, again.b), ("first", None))
+        again.b = "again"
+        self.assertEqual((first.b, again.b), ("first", "again"))
@@ -12,9 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import importlib.util
 import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 import zipfile
+import zipimport
 
 from fuselage import builder, bundle, resources
 
@@ -41,3 +49,161 @@ class TestBuilder(unittest.TestCase):
         z = zipfile.ZipFile(io.BytesIO(fp.getvalue()))
         # This will raise a KeyError if there is no resources.json..
         z.getinfo("resources.json")
+
+    def test_build_bytecode(self):
+        payload = builder.build(bundle.ResourceBundle(), bytecode=True)
+        z = zipfile.ZipFile(payload)
+        self.assertIn("fuselage/runner.py", z.namelist())
+        pyc = z.read("fuselage/runner.pyc")
+        self.assertEqual(pyc[:4], importlib.util.MAGIC_NUMBER)
+
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "payload.pex")
+            with open(path, "wb") as fp:
+                fp.write(payload.getvalue())
+            importer = zipimport.zipimporter(os.path.join(path, "fuselage", ""))
+            filename = importer.get_filename("fuselage.runner")
+            p = subprocess.run([sys.executable, path, "--help"], stdout=subprocess.PIPE)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(filename, os.path.join(path, "fuselage", "runner.pyc"))
+        self.assertEqual(p.returncode, 0)
+        self.assertIn(b"Usage", p.stdout)
+
+    def test_build_prune(self):
+        rb = bundle.ResourceBundle()
+        rb.add(resources.Execute(name="true", command="true"))
+        payload = builder.build(rb, prune=True)
+
+        z = zipfile.ZipFile(payload)
+        names = z.namelist()
+        self.assertIn("fuselage/resources/execute.py", names)
+        self.assertIn("fuselage/providers/execute.py", names)
+        self.assertNotIn("fuselage/resources/checkout.py", names)
+        self.assertNotIn("fuselage/providers/mercurial.py", names)
+        self.assertEqual(
+            z.read("fuselage/providers/__init__.py"), b"from . import execute\n"
+        )
+
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "payload.pex")
+            with open(path, "wb") as fp:
+                fp.write(payload.getvalue())
+            p = subprocess.run(
+                [sys.executable, path, "--simulate", "--state", tmp],
+                stdout=subprocess.PIPE,
+            )
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(p.returncode, 0)
+        self.assertIn(b"Execute[true]", p.stdout)
+
+    def test_used_modules_include_all_candidate_providers(self):
+        rb = bundle.ResourceBundle()
+        rb.add(resources.Package(name="curl"))
+        modules = builder.get_used_modules(rb)
+        self.assertEqual(modules["fuselage.resources.package"], {"Package"})
+        self.assertIn("fuselage.providers.apt", modules)
+        self.assertIn("fuselage.providers.yum", modules)
+
+    def test_assets_deduplicated(self):
+        fp = io.BytesIO()
+        b = builder.Builder.write_to(fp)
+        first = b.add_resource_blob(b"hello")
+        second = b.add_resource_blob(b"hello")
+        b.close()
+
+        self.assertEqual(first, second)
+        z = zipfile.ZipFile(io.BytesIO(fp.getvalue()))
+        self.assertEqual(len(z.namelist()), 1)
+
+    def test_asset_compression(self):
+        fp = io.BytesIO()
+        b = builder.Builder.write_to(fp)
+        text = b.add_resource_blob(b"hello world\n" * 1000)
+        random = b.add_resource_blob(os.urandom(10000))
+        b.close()
+
+        z = zipfile.ZipFile(io.BytesIO(fp.getvalue()))
+        info = z.getinfo(text.replace("bundle://", "assets/"))
+        self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+        info = z.getinfo(random.replace("bundle://", "assets/"))
+        self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+
+        report = b.get_size_report()
+        self.assertEqual(report["assets"]["files"], 2)
+        self.assertEqual(report["assets"]["size"], 22000)
+
+    def test_build_delta(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp, "source")
+            with open(source, "wb") as fp:
+                fp.write(b"hello from the store")
+
+            target = os.path.join(tmp, "target")
+            rb = bundle.ResourceBundle()
+            rb.add(resources.File(name=target, source=source))
+            payload, assets = builder.build_delta(rb)
+
+            z = zipfile.ZipFile(payload)
+            self.assertFalse([n for n in z.namelist() if n.startswith("assets/")])
+
+            store = os.path.join(tmp, "store")
+            os.mkdir(store)
+            for digest, contents in assets.items():
+                with open(os.path.join(store, digest), "wb") as fp:
+                    fp.write(contents)
+
+            path = os.path.join(tmp, "payload.pex")
+            with open(path, "wb") as fp:
+                fp.write(payload.getvalue())
+            p = subprocess.run(
+                [sys.executable, path, "--state", tmp, "--asset-store", store],
+                stdout=subprocess.PIPE,
+            )
+            self.assertEqual(p.returncode, 0, p.stdout)
+            with open(target, "rb") as fp:
+                self.assertEqual(fp.read(), b"hello from the store")
+        finally:
+            shutil.rmtree(tmp)
+
+
+class TestPayloadCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = builder.PayloadCache(self.tmp)
+        self.bundle = bundle.ResourceBundle()
+        self.bundle.add(resources.File(name="/tmp/foo", contents="hello"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_build_reuses_payload(self):
+        payload = builder.build(self.bundle, cache=self.cache).getvalue()
+        with mock.patch.object(builder.Builder, "write_to") as write_to:
+            cached = builder.build(self.bundle, cache=self.cache)
+        self.assertFalse(write_to.called)
+        self.assertEqual(cached.getvalue(), payload)
+        self.assertEqual(cached.name, "payload.pex")
+
+        z = zipfile.ZipFile(cached)
+        self.assertIn(b"hello", z.read("resources.json"))
+
+    def test_changed_bundle_rebuilt(self):
+        builder.build(self.bundle, cache=self.cache)
+        self.bundle.add(resources.File(name="/tmp/bar", contents="goodbye"))
+        builder.build(self.bundle, cache=self.cache)
+        self.assertEqual(len(os.listdir(self.tmp)), 2)
+
+    def test_least_recently_used_evicted(self):
+        self.cache.max_size = 10
+        self.cache.put("a", b"12345")
+        self.cache.put("b", b"12345")
+        os.utime(os.path.join(self.tmp, "a.pex"), ns=(0, 0))
+        self.assertEqual(self.cache.get("b"), b"12345")
+        self.cache.put("c", b"12345")
+        self.assertEqual(sorted(os.listdir(self.tmp)), ["b.pex", "c.pex"])
+        self.assertEqual(self.cache.get("a"), None)
@@ -12,10 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import io
+import json
 import unittest
+from unittest import mock
 
-from fuselage import bundle, error, resources
+from fuselage import bundle, error, jsonstream, resources
 
 
 class TestBundle(unittest.TestCase):
@@ -104,6 +107,55 @@ class TestBundle(unittest.TestCase):
         )
         self.assertEqual(self.bundle["File[/tmp]"].name, "/tmp")
 
+    def test_load__streamed(self):
+        resources = [{"File": {"name": "/tmp/%d" % i}} for i in range(1000)]
+        fp = io.StringIO(json.dumps({"version": 1, "resources": resources}))
+        with mock.patch.object(jsonstream, "CHUNK_SIZE", 100):
+            self.bundle.load(fp)
+        self.assertEqual(len(self.bundle), 1000)
+        self.assertEqual(self.bundle.resources[-1].name, "/tmp/999")
+
+    def test_load__resources_before_version(self):
+        self.bundle.load(
+            io.StringIO('{"resources": [{"File": {"name": "/tmp"}}], "version": 1}')
+        )
+        self.assertEqual(self.bundle["File[/tmp]"].name, "/tmp")
+
+    def test_load__version_too_new(self):
+        fp = io.StringIO('{"version": 2, "resources": [{"Fil": {}}]}')
+        self.assertRaises(error.ParseError, self.bundle.load, fp)
+
+    def test_load__not_dict(self):
+        fp = io.StringIO("[]")
+        self.assertRaises(error.ParseError, self.bundle.load, fp)
+
+    def test_load__resources_not_list(self):
+        fp = io.StringIO('{"version": 1, "resources": {}}')
+        self.assertRaises(error.ParseError, self.bundle.load, fp)
+
+    def test_load__invalid_regex(self):
+        fp = io.StringIO(
+            '{"version": 1, "resources": '
+            '[{"Line": {"name": "/tmp/a", "match": "(", "line": "a"}}]}'
+        )
+        self.assertRaises(error.ParseError, self.bundle.load, fp)
+
+    def test_get_resource_by_name(self):
+        self.bundle.add(resources.File(name="/tmp/foo"))
+        self.bundle.add(resources.Directory(name="/tmp/foo"))
+        self.assertIs(
+            self.bundle.get_resource_by_name("/tmp/foo"), self.bundle.resources[0]
+        )
+        self.assertRaises(KeyError, self.bundle.get_resource_by_name, "/tmp/bar")
+
+    def test_get_resources_by_type(self):
+        for i in range(3):
+            self.bundle.add(resources.File(name="/tmp/%d" % i))
+        self.bundle.add(resources.Directory(name="/tmp/dir"))
+        files = self.bundle.get_resources_by_type("File")
+        self.assertEqual([r.name for r in files], ["/tmp/0", "/tmp/1", "/tmp/2"])
+        self.assertEqual(self.bundle.get_resources_by_type("Link"), [])
+
     def test_loads(self):
         self.bundle.loads(
             """
@@ -171,3 +223,106 @@ class TestBundle(unittest.TestCase):
             self.bundle._load_bundle,
             {"version": 1, "resources": [{"Director": {"name": "/tmp/baz"}}]},
         )
+
+
+class TestBundleApply(unittest.TestCase):
+    def setUp(self):
+        self.bundle = bundle.ResourceBundle()
+        self.runner = mock.Mock()
+        self.runner.jobs = 4
+
+    def test_apply_parallel(self):
+        for i in range(10):
+            self.bundle.add(resources.File(name="/tmp/%d" % i, owner="root"))
+
+        with mock.patch.object(resources.File, "apply") as apply:
+            apply.return_value = True
+            self.bundle.apply(self.runner)
+
+        self.assertEqual(apply.call_count, 10)
+
+    def test_apply_parallel_respects_dependencies(self):
+        applied = []
+
+        def apply(resource, runner):
+            applied.append(resource.name)
+            return False
+
+        self.bundle.add(resources.Directory(name="/srv", owner="root"))
+        self.bundle.add(resources.Directory(name="/srv/www", owner="root"))
+        self.bundle.add(resources.File(name="/srv/www/index.html", owner="root"))
+
+        with mock.patch.object(resources.File, "apply", apply), mock.patch.object(
+            resources.Directory, "apply", apply
+        ):
+            self.assertRaises(error.NothingChanged, self.bundle.apply, self.runner)
+
+        self.assertEqual(applied, ["/srv", "/srv/www", "/srv/www/index.html"])
+
+    def test_apply_parallel_failure(self):
+        self.bundle.add(resources.Directory(name="/srv", owner="root"))
+        self.bundle.add(resources.File(name="/srv/index.html", owner="root"))
+
+        with mock.patch.object(resources.File, "apply") as file_apply:
+            with mock.patch.object(resources.Directory, "apply") as dir_apply:
+                dir_apply.side_effect = error.PathComponentMissing("/srv")
+                self.assertRaises(
+                    error.PathComponentMissing, self.bundle.apply, self.runner
+                )
+
+        self.assertEqual(file_apply.call_count, 0)
+
+
+class TestBundleApplyAsync(unittest.TestCase):
+    def setUp(self):
+        self.bundle = bundle.ResourceBundle()
+        self.runner = mock.Mock()
+        self.runner.jobs = 4
+
+    def test_apply_async(self):
+        for i in range(10):
+            self.bundle.add(resources.File(name="/tmp/%d" % i, owner="root"))
+
+        with mock.patch.object(resources.File, "apply_async") as apply:
+            apply.return_value = True
+            asyncio.run(self.bundle.apply_async(self.runner))
+
+        self.assertEqual(apply.call_count, 10)
+
+    def test_apply_async_respects_dependencies(self):
+        applied = []
+
+        async def apply(resource, runner):
+            await asyncio.sleep(0)
+            applied.append(resource.name)
+            return False
+
+        self.bundle.add(resources.Directory(name="/srv", owner="root"))
+        self.bundle.add(resources.Directory(name="/srv/www", owner="root"))
+        self.bundle.add(resources.File(name="/srv/www/index.html", owner="root"))
+
+        with mock.patch.object(resources.File, "apply_async", apply), mock.patch.object(
+            resources.Directory, "apply_async", apply
+        ):
+            self.assertRaises(
+                error.NothingChanged,
+                asyncio.run,
+                self.bundle.apply_async(self.runner),
+            )
+
+        self.assertEqual(applied, ["/srv", "/srv/www", "/srv/www/index.html"])
+
+    def test_apply_async_failure(self):
+        self.bundle.add(resources.Directory(name="/srv", owner="root"))
+        self.bundle.add(resources.File(name="/srv/index.html", owner="root"))
+
+        with mock.patch.object(resources.File, "apply_async") as file_apply:
+            with mock.patch.object(resources.Directory, "apply_async") as dir_apply:
+                dir_apply.side_effect = error.PathComponentMissing("/srv")
+                self.assertRaises(
+                    error.PathComponentMissing,
+                    asyncio.run,
+                    self.bundle.apply_async(self.runner),
+                )
+
+        self.assertEqual(file_apply.call_count, 0)
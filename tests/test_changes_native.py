@@ -0,0 +1,98 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import stat
+import tempfile
+from unittest import mock
+
+from fuselage import error, platform
+from fuselage.changes import native
+from fuselage.resources import Directory, File, Link
+
+from tests.base import TestCaseWithRealRunner
+
+
+class TestNativeCommand(TestCaseWithRealRunner):
+
+    native = True
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def get_context(self, simulate=False, native=True):
+        return mock.Mock(simulate=simulate, runner=mock.Mock(native=native))
+
+    def test_logs_command(self):
+        path = os.path.join(self.tmp, "dir")
+        ctx = self.get_context()
+        ctx.change = lambda change: change.apply(ctx)
+        ctx.change(native.mkdir(path, parents=True))
+        ctx.changelog.critical.assert_called_with("# /bin/mkdir -p " + path)
+        self.assertTrue(os.path.isdir(path))
+
+    def test_simulate(self):
+        path = os.path.join(self.tmp, "dir")
+        native.mkdir(path).apply(self.get_context(simulate=True))
+        self.assertFalse(os.path.exists(path))
+
+    def test_error(self):
+        path = os.path.join(self.tmp, "missing", "dir")
+        self.assertRaises(
+            error.SystemError, native.mkdir(path).apply, self.get_context()
+        )
+
+    def test_not_native(self):
+        ctx = self.get_context(native=False)
+        with mock.patch.object(platform, "check_call") as check_call:
+            check_call.return_value = ("", "")
+            native.rmdir(self.tmp).apply(ctx)
+        self.assertEqual(check_call.call_args[1]["command"], ["/bin/rmdir", self.tmp])
+        self.assertTrue(os.path.isdir(self.tmp))
+
+    def test_clear_setgid(self):
+        os.chmod(self.tmp, 0o2755)
+        native.clear_setgid(self.tmp).apply(self.get_context())
+        self.assertEqual(stat.S_IMODE(os.stat(self.tmp).st_mode), 0o755)
+
+    def test_directory(self):
+        path = os.path.join(self.tmp, "a", "b")
+        self.bundle.add(Directory(name=path, mode=0o700, parents=True))
+        self.check_apply()
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+
+    def test_file_mode(self):
+        path = os.path.join(self.tmp, "file")
+        self.bundle.add(File(name=path, contents="hello", mode=0o600))
+        self.check_apply()
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_link(self):
+        path = os.path.join(self.tmp, "link")
+        os.mkdir(path)
+        self.bundle.add(Link(name=path, to=self.tmp))
+        self.check_apply()
+        self.assertEqual(os.readlink(path), self.tmp)
+
+    def test_remove_directory_recursive(self):
+        path = os.path.join(self.tmp, "dir")
+        os.makedirs(os.path.join(path, "child"))
+        self.bundle.add(Directory(name=path, policy="remove-recursive"))
+        self.check_apply()
+        self.assertFalse(os.path.exists(path))
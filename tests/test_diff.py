@@ -0,0 +1,95 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import unittest
+from unittest import mock
+
+from fuselage import diff, log
+from fuselage.changes import EnsureContents
+
+
+class TestDiff(unittest.TestCase):
+    def test_text_is_not_binary(self):
+        self.assertFalse(diff.is_binary(b"hello\nworld\n"))
+
+    def test_utf8_is_not_binary(self):
+        self.assertFalse(diff.is_binary("café\n".encode("utf-8")))
+
+    def test_nul_is_binary(self):
+        self.assertTrue(diff.is_binary(b"hello\0world"))
+
+    def test_invalid_utf8_is_binary(self):
+        self.assertTrue(diff.is_binary(b"\xff\xfe\xfa hello"))
+
+    def test_only_prefix_is_sniffed(self):
+        with mock.patch.object(diff, "SNIFF_SIZE", 5):
+            self.assertFalse(diff.is_binary(b"hello\0world"))
+
+    def test_split_character_is_not_binary(self):
+        with mock.patch.object(diff, "SNIFF_SIZE", 5):
+            self.assertFalse(diff.is_binary("caféé".encode("utf-8")))
+
+    def test_binary_buffers(self):
+        self.assertFalse(diff.binary_buffers(b"", b"hello"))
+        self.assertTrue(diff.binary_buffers(b"hello", b"\0"))
+
+    def test_describe(self):
+        self.assertIn("+world", diff.describe(b"hello\n", b"hello\nworld\n"))
+
+    def test_describe_binary(self):
+        self.assertEqual(diff.describe(b"", b"\0"), "No diff; binary files")
+
+    def test_describe_too_large(self):
+        with mock.patch.object(diff, "MAX_DIFF_SIZE", 4):
+            self.assertEqual(diff.describe(b"", b"hello"), "No diff; file too large")
+
+    def test_truncated(self):
+        replacement = "".join("line %d\n" % i for i in range(100))
+        result = diff.unified_diff("", replacement, max_lines=10)
+        self.assertEqual(len(result.splitlines()), 11)
+        self.assertTrue(result.endswith("... diff truncated after 10 lines\n"))
+
+
+class TestIsEnabledFor(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("fuselage.tests.diff")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = log.ConsoleHandler(level=logging.INFO)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.propagate = True
+        self.logger.setLevel(logging.NOTSET)
+
+    def test_enabled(self):
+        self.assertTrue(log.is_enabled_for(self.logger, logging.CRITICAL))
+
+    def test_below_handler_threshold(self):
+        self.assertFalse(log.is_enabled_for(self.logger, logging.DEBUG))
+
+    def test_adapter(self):
+        adapter = log.LoggerAdapter(self.logger, {})
+        self.assertTrue(log.is_enabled_for(adapter, logging.INFO))
+
+    def test_diff_skipped(self):
+        changelog = mock.Mock()
+        fc = EnsureContents("/tmp/foo", b"hello")
+        with mock.patch.object(log, "is_enabled_for", return_value=False):
+            with mock.patch.object(fc, "describe") as describe:
+                fc.diff(mock.Mock(changelog=changelog), "Changed", b"", b"hello")
+        self.assertFalse(describe.called)
+        changelog.critical.assert_called_with("Changed", extra={})
@@ -12,7 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error, platform
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fuselage import error, event, platform
 from fuselage.resources import Directory, File
 
 from tests.base import TestCaseWithRunner
@@ -38,3 +44,63 @@ class TestEvent(TestCaseWithRunner):
         platform.check_call(["mkdir", "/frob"])
         self.check_apply()
         self.failUnlessExists("/frob/somedir/foo")
+
+
+class TestEventStateJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "events.saved")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def get_state(self):
+        state = event.EventState(self.path, simulate=False, load=True)
+        state.open()
+        state.load()
+        return state
+
+    def write(self, contents):
+        with open(self.path, "w") as fp:
+            fp.write(contents)
+
+    def read(self):
+        with open(self.path) as fp:
+            return fp.read()
+
+    def test_set_and_unset_append(self):
+        state = self.get_state()
+        state.set_trigger(mock.Mock(id="a"))
+        state.set_trigger(mock.Mock(id="b"))
+        state.unset_trigger(mock.Mock(id="a"))
+        self.assertEqual(self.read(), '["set", "a"]\n["set", "b"]\n["unset", "a"]\n')
+        self.assertEqual(self.get_state().overrides, {"b": "*"})
+
+    def test_legacy_state(self):
+        self.write('{"a": "*", "b": "*"}')
+        state = self.get_state()
+        self.assertTrue(state.is_trigger_set(mock.Mock(id="a")))
+        state.unset_trigger(mock.Mock(id="a"))
+        self.assertEqual(self.get_state().overrides, {"b": "*"})
+
+    def test_torn_write(self):
+        self.write('["set", "a"]\n["set", "b"]\n["se')
+        state = self.get_state()
+        self.assertEqual(state.overrides, {"a": "*", "b": "*"})
+        self.assertEqual(self.read(), '{"a": "*", "b": "*"}\n')
+
+    def test_compaction(self):
+        state = self.get_state()
+        state.compact_after = 3
+        for name in ("a", "b", "c", "d"):
+            state.set_trigger(mock.Mock(id=name))
+        state.unset_trigger(mock.Mock(id="a"))
+        self.assertEqual(
+            self.read(), '{"a": "*", "b": "*", "c": "*", "d": "*"}\n["unset", "a"]\n'
+        )
+        self.assertEqual(self.get_state().overrides, {"b": "*", "c": "*", "d": "*"})
+
+    def test_simulate(self):
+        state = event.EventState(self.path, simulate=True)
+        state.set_trigger(mock.Mock(id="a"))
+        self.assertFalse(os.path.exists(self.path))
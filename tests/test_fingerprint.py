@@ -0,0 +1,75 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fuselage import fingerprint
+from fuselage.changes import EnsureContents
+
+
+class TestFingerprintCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "file")
+        with open(self.path, "wb") as fp:
+            fp.write(b"hello")
+        self.cache = fingerprint.FingerprintCache(
+            os.path.join(self.tmp, "fingerprints.json"), simulate=False
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_digest_matches_asset_names(self):
+        self.assertEqual(
+            fingerprint.digest(b"hello"), "aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+        )
+
+    def test_unknown_file(self):
+        self.assertFalse(self.cache.matches(self.path, fingerprint.digest(b"hello")))
+
+    def test_record_and_match(self):
+        self.cache.record(self.path, fingerprint.digest(b"hello"))
+        self.assertTrue(self.cache.matches(self.path, fingerprint.digest(b"hello")))
+        self.assertFalse(self.cache.matches(self.path, fingerprint.digest(b"world")))
+
+    def test_modified_file(self):
+        self.cache.record(self.path, fingerprint.digest(b"hello"))
+        with open(self.path, "wb") as fp:
+            fp.write(b"hello world")
+        self.assertFalse(self.cache.matches(self.path, fingerprint.digest(b"hello")))
+
+    def test_save_and_load(self):
+        self.cache.record(self.path, fingerprint.digest(b"hello"))
+        self.cache.save()
+
+        cache = fingerprint.FingerprintCache(self.cache.save_file, simulate=False)
+        cache.load()
+        self.assertTrue(cache.matches(self.path, fingerprint.digest(b"hello")))
+
+    def test_ensure_contents_skips_read(self):
+        self.cache.record(self.path, fingerprint.digest(b"hello"))
+        context = mock.Mock(simulate=False)
+        context.runner.fingerprints = self.cache
+
+        with mock.patch("fuselage.platform.get") as get:
+            ec = EnsureContents(self.path, b"hello")
+            ec.apply(context)
+
+        self.assertEqual(get.call_count, 0)
+        self.assertFalse(ec.changed)
@@ -0,0 +1,123 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent import futures
+import unittest
+
+from fuselage import bundle, graph, resources
+
+
+class TestDependencyGraph(unittest.TestCase):
+    def setUp(self):
+        self.bundle = bundle.ResourceBundle()
+
+    def dependencies(self, resource):
+        g = graph.DependencyGraph(self.bundle.resources)
+        i = self.bundle.resources.index(resource)
+        return {self.bundle.resources[j] for j in g.dependencies[i]}
+
+    def test_independent_files(self):
+        self.bundle.add(resources.File(name="/tmp/a", owner="root"))
+        b = self.bundle.add(resources.File(name="/tmp/b", owner="root"))
+        self.assertEqual(self.dependencies(b), set())
+
+    def test_file_in_directory(self):
+        d = self.bundle.add(resources.Directory(name="/srv/www", owner="root"))
+        f = self.bundle.add(resources.File(name="/srv/www/index.html", owner="root"))
+        self.assertEqual(self.dependencies(f), {d})
+
+    def test_directory_after_contents(self):
+        f = self.bundle.add(resources.File(name="/srv/www/index.html", owner="root"))
+        d = self.bundle.add(
+            resources.Directory(name="/srv/www", policy="remove-recursive")
+        )
+        self.assertEqual(self.dependencies(d), {f})
+
+    def test_sibling_prefix_is_not_contained(self):
+        self.bundle.add(resources.Directory(name="/srv/www", owner="root"))
+        f = self.bundle.add(resources.File(name="/srv/www2", owner="root"))
+        self.assertEqual(self.dependencies(f), set())
+
+    def test_watches(self):
+        f = self.bundle.add(resources.File(name="/etc/a.conf", owner="root"))
+        e = self.bundle.add(
+            resources.Execute(command="/bin/true", watches=["File[/etc/a.conf]"])
+        )
+        self.assertIn(f, self.dependencies(e))
+
+    def test_owner(self):
+        u = self.bundle.add(resources.User(name="www"))
+        f = self.bundle.add(resources.File(name="/tmp/a", owner="www", group="root"))
+        self.assertEqual(self.dependencies(f), {u})
+
+    def test_users_and_groups_are_serialized(self):
+        g = self.bundle.add(resources.Group(name="admins"))
+        u = self.bundle.add(resources.User(name="fred"))
+        self.assertEqual(self.dependencies(u), {g})
+
+    def test_barrier(self):
+        a = self.bundle.add(resources.File(name="/tmp/a", owner="root"))
+        b = self.bundle.add(resources.File(name="/tmp/b", owner="root"))
+        p = self.bundle.add(resources.Package(name="hello"))
+        c = self.bundle.add(resources.File(name="/tmp/c", owner="root"))
+        self.assertEqual(self.dependencies(p), {a, b})
+        self.assertEqual(self.dependencies(c), {p})
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        self.bundle = bundle.ResourceBundle()
+
+    def schedule(self, jobs):
+        return graph.Schedule(graph.DependencyGraph(self.bundle.resources), jobs)
+
+    def done(self, result):
+        future = futures.Future()
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+        return future
+
+    def test_dependents_wait(self):
+        self.bundle.add(resources.Directory(name="/srv/www", owner="root"))
+        self.bundle.add(resources.File(name="/srv/www/index.html", owner="root"))
+        self.bundle.add(resources.File(name="/tmp/a", owner="root"))
+        schedule = self.schedule(jobs=4)
+        self.assertEqual(schedule.start(), [0, 2])
+        schedule.finish(0, self.done(True))
+        self.assertEqual(schedule.start(), [1])
+        schedule.finish(1, self.done(False))
+        schedule.finish(2, self.done(False))
+        self.assertEqual(schedule.start(), [])
+        self.assertTrue(schedule.result())
+
+    def test_jobs_limit(self):
+        for name in ("/tmp/a", "/tmp/b", "/tmp/c"):
+            self.bundle.add(resources.File(name=name, owner="root"))
+        schedule = self.schedule(jobs=2)
+        self.assertEqual(schedule.start(), [0, 1])
+        schedule.finish(1, self.done(False))
+        self.assertEqual(schedule.start(), [2])
+
+    def test_failure_stops_new_resources(self):
+        for name in ("/tmp/a", "/tmp/b", "/tmp/c"):
+            self.bundle.add(resources.File(name=name, owner="root"))
+        schedule = self.schedule(jobs=2)
+        schedule.start()
+        failure = RuntimeError("boom")
+        schedule.finish(0, self.done(failure))
+        self.assertEqual(schedule.start(), [])
+        schedule.finish(1, self.done(True))
+        self.assertRaises(RuntimeError, schedule.result)
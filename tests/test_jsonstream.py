@@ -0,0 +1,55 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import unittest
+
+from fuselage import error, jsonstream
+
+
+class TestJSONStream(unittest.TestCase):
+    def stream(self, text):
+        return jsonstream.JSONStream(io.StringIO(text), chunk_size=3)
+
+    def test_iter_array(self):
+        items = [{"a": [1, 2, "x" * 20]}, 12345, "s", None, []]
+        stream = self.stream(json.dumps(items, indent=2))
+        self.assertEqual(list(stream.iter_array("not a list")), items)
+        self.assertEqual(stream.peek(), "")
+
+    def test_number_split_across_chunks(self):
+        stream = self.stream("[1234567, 89]")
+        self.assertEqual(list(stream.iter_array("not a list")), [1234567, 89])
+
+    def test_iter_object(self):
+        stream = self.stream('{"a": 1, "b": [1, 2]}')
+        values = {key: stream.value() for key in stream.iter_object("not a dict")}
+        self.assertEqual(values, {"a": 1, "b": [1, 2]})
+
+    def test_empty(self):
+        self.assertEqual(list(self.stream(" [ ] ").iter_array("not a list")), [])
+        self.assertEqual(list(self.stream("{}").iter_object("not a dict")), [])
+
+    def test_not_an_array(self):
+        stream = self.stream('{"a": 1}')
+        self.assertRaises(error.ParseError, list, stream.iter_array("not a list"))
+
+    def test_missing_separator(self):
+        stream = self.stream("[1 2]")
+        self.assertRaises(error.ParseError, list, stream.iter_array("not a list"))
+
+    def test_truncated(self):
+        stream = self.stream('[{"a": 1')
+        self.assertRaises(ValueError, list, stream.iter_array("not a list"))
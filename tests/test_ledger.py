@@ -0,0 +1,87 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from fuselage import bundle, error, ledger, runner
+from fuselage.providers.execute import Execute as ExecuteProvider
+from fuselage.providers.files import File as FileProvider
+from fuselage.resources import Execute, File
+
+from tests.base import TestCaseWithRealRunner
+
+
+class TestLedger(TestCaseWithRealRunner):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "file")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def apply(self, simulate=False):
+        r = runner.Runner(
+            self.bundle,
+            simulate=simulate,
+            state_path=os.path.join(self.tmp, "state"),
+            incremental=True,
+        )
+        return r.run()
+
+    def test_unchanged_resource_skipped(self):
+        self.bundle.add(File(name=self.path, contents="hello"))
+        self.apply()
+        with mock.patch.object(FileProvider, "apply") as apply:
+            self.assertRaises(error.NothingChanged, self.apply)
+        self.assertFalse(apply.called)
+
+    def test_changed_file_applied(self):
+        self.bundle.add(File(name=self.path, contents="hello"))
+        self.apply()
+        with open(self.path, "w") as fp:
+            fp.write("goodbye, world")
+        self.apply()
+        with open(self.path) as fp:
+            self.assertEqual(fp.read(), "hello")
+
+    def test_changed_definition_applied(self):
+        self.bundle.add(File(name=self.path, contents="hello"))
+        self.apply()
+        self.bundle = bundle.ResourceBundle()
+        self.bundle.add(File(name=self.path, contents="goodbye"))
+        self.apply()
+        with open(self.path) as fp:
+            self.assertEqual(fp.read(), "goodbye")
+
+    def test_execute_without_guard_always_applied(self):
+        self.bundle.add(Execute(name="true", command="true"))
+        self.apply()
+        self.apply()
+
+    def test_execute_with_creates_skipped(self):
+        self.bundle.add(
+            Execute(name="touch", command="touch " + self.path, creates=self.path)
+        )
+        self.apply()
+        entries = ledger.Ledger(os.path.join(self.tmp, "state", "ledger.json"), False)
+        entries.load()
+        self.assertIn("Execute[touch]", entries.entries)
+
+        with mock.patch.object(ExecuteProvider, "apply") as apply:
+            self.assertRaises(error.NothingChanged, self.apply)
+        self.assertFalse(apply.called)
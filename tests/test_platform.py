@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import errno
+import io
 import os
 import shutil
 import sys
@@ -35,6 +38,81 @@ class TestPlatform(unittest.TestCase):
     def test_check_call_FAIL(self):
         self.assertRaises(error.SystemError, platform.check_call, ["false"])
 
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_process_without_preexec(self):
+        p = platform.Process(["true"], env={"PATH": "/usr/bin:/bin"})
+        p.wait()
+        self.assertEqual(p.returncode, 0)
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_launch_options_identity_change(self):
+        p = platform.Process.__new__(platform.Process)
+        p.uid, p.gid, p.umask = os.getuid() + 1, None, 0o22
+        kwargs = {}
+        p.set_launch_options(["true"], kwargs)
+        self.assertNotIn("close_fds", kwargs)
+        if sys.version_info >= (3, 9):
+            self.assertEqual(kwargs["user"], os.getuid() + 1)
+            self.assertEqual(kwargs["umask"], 0o22)
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_launch_options_spawnable(self):
+        p = platform.Process.__new__(platform.Process)
+        p.uid, p.gid, p.umask = None, None, None
+        kwargs = {"env": {"PATH": "/usr/bin:/bin"}}
+        p.set_launch_options(["true"], kwargs)
+        if sys.version_info >= (3, 9):
+            self.assertFalse(kwargs["close_fds"])
+            self.assertTrue(os.path.isabs(kwargs["executable"]))
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_launch_options_inheritable_fds(self):
+        p = platform.Process.__new__(platform.Process)
+        p.uid, p.gid, p.umask = None, None, None
+        kwargs = {"env": {"PATH": "/usr/bin:/bin"}}
+        r, w = os.pipe()
+        try:
+            os.set_inheritable(w, True)
+            p.set_launch_options(["true"], kwargs)
+        finally:
+            os.close(r)
+            os.close(w)
+        self.assertNotIn("close_fds", kwargs)
+
+    @skipIf(sys.version_info >= (3, 9), "preexec_fn is only used before 3.9")
+    def test_launch_options_preexec_only_when_needed(self):
+        p = platform.Process.__new__(platform.Process)
+        p.uid, p.gid, p.umask = None, None, None
+        kwargs = {}
+        p.set_launch_options(["true"], kwargs)
+        self.assertNotIn("preexec_fn", kwargs)
+        p.umask = 0o22
+        p.set_launch_options(["true"], kwargs)
+        self.assertEqual(kwargs["preexec_fn"], p.preexec)
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_probe_server(self):
+        platform.start_probe_server()
+        try:
+            stdout, stderr = platform.check_call(["echo", "hello"], probe=True)
+            self.assertEqual(stdout, "hello")
+            stdout, stderr = platform.check_call("pwd", cwd="/", probe=True)
+            self.assertEqual(stdout, "/")
+            self.assertRaises(
+                error.SystemError, platform.check_call, ["false"], probe=True
+            )
+            self.assertRaises(
+                OSError, platform.check_call, ["fuselage-missing"], probe=True
+            )
+        finally:
+            platform.stop_probe_server()
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_probe_not_used_for_logged_commands(self):
+        with mock.patch.object(platform, "_probe_server") as server:
+            platform.check_call(["true"], probe=True, logger=mock.Mock())
+        self.assertFalse(server.run.called)
+
     def test_exists_file(self):
         self.assertEqual(True, platform.exists(__file__))
 
@@ -118,6 +196,140 @@ class TestPlatform(unittest.TestCase):
         finally:
             platform.unlink(path)
 
+    def test_put_file_object(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_file_object")
+        try:
+            with mock.patch.object(platform, "CHUNK_SIZE", 4):
+                platform.put(path, io.BytesIO(b"HELLO WORLD"))
+            self.assertEqual(platform.get(path), b"HELLO WORLD")
+        finally:
+            shutil.rmtree(d)
+
+    def test_put_is_atomic(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_is_atomic")
+        try:
+            platform.put(path, "HELLO")
+            inode = os.stat(path).st_ino
+            platform.put(path, "GOODBYE")
+            self.assertNotEqual(os.stat(path).st_ino, inode)
+            self.assertEqual(os.listdir(d), ["test_put_is_atomic"])
+        finally:
+            shutil.rmtree(d)
+
+    def test_put_keeps_mode(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_keeps_mode")
+        try:
+            platform.put(path, "HELLO", chmod=0o600)
+            os.chmod(path, 0o640)
+            platform.put(path, "GOODBYE")
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+        finally:
+            shutil.rmtree(d)
+
+    def test_put_cleans_up_on_error(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_cleans_up_on_error")
+        try:
+            with mock.patch("os.replace", side_effect=OSError):
+                self.assertRaises(OSError, platform.put, path, "HELLO")
+            self.assertEqual(os.listdir(d), [])
+        finally:
+            shutil.rmtree(d)
+
+    def test_put_keeps_hard_links(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_keeps_hard_links")
+        try:
+            platform.put(path, "HELLO")
+            os.link(path, path + ".link")
+            inode = os.stat(path).st_ino
+            platform.put(path, "GOODBYE")
+            self.assertEqual(os.stat(path).st_ino, inode)
+            self.assertEqual(platform.get(path + ".link"), b"GOODBYE")
+        finally:
+            shutil.rmtree(d)
+
+    def test_put_in_place_when_busy(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_in_place_when_busy")
+        try:
+            platform.put(path, "HELLO")
+            inode = os.stat(path).st_ino
+            busy = OSError(errno.EBUSY, "Device or resource busy")
+            with mock.patch("os.replace", side_effect=busy):
+                platform.put(path, io.BytesIO(b"GOODBYE"))
+            self.assertEqual(platform.get(path), b"GOODBYE")
+            self.assertEqual(os.stat(path).st_ino, inode)
+            self.assertEqual(os.listdir(d), ["test_put_in_place_when_busy"])
+        finally:
+            shutil.rmtree(d)
+
+    @skipIf(
+        not hasattr(os, "getuid") or os.getuid() != 0,
+        "needs root to create a file owned by another user",
+    )
+    def test_put_in_place_when_chown_denied(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_in_place_when_chown_denied")
+        try:
+            platform.put(path, "HELLO")
+            os.chown(path, 1, 1)
+            inode = os.stat(path).st_ino
+            denied = PermissionError(errno.EPERM, "Operation not permitted")
+            with mock.patch("os.chown", side_effect=denied):
+                platform.put(path, "GOODBYE")
+            self.assertEqual(platform.get(path), b"GOODBYE")
+            st = os.stat(path)
+            self.assertEqual((st.st_ino, st.st_uid), (inode, 1))
+            self.assertEqual(os.listdir(d), ["test_put_in_place_when_chown_denied"])
+        finally:
+            shutil.rmtree(d)
+
+    def test_put_in_place_when_directory_not_writable(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_in_place_when_directory_not_writable")
+        real_open = os.open
+
+        def open_(p, *args):
+            if p.endswith(".tmp"):
+                raise PermissionError(errno.EACCES, "Permission denied")
+            return real_open(p, *args)
+
+        try:
+            platform.put(path, "HELLO")
+            with mock.patch("os.open", side_effect=open_):
+                platform.put(path, "GOODBYE")
+            self.assertEqual(platform.get(path), b"GOODBYE")
+        finally:
+            shutil.rmtree(d)
+
+    def test_put_unseekable_stream_not_retried(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_put_unseekable_stream_not_retried")
+        contents = io.BytesIO(b"GOODBYE")
+        contents.seekable = lambda: False
+        try:
+            platform.put(path, "HELLO")
+            busy = OSError(errno.EBUSY, "Device or resource busy")
+            with mock.patch("os.replace", side_effect=busy):
+                self.assertRaises(OSError, platform.put, path, contents)
+            self.assertEqual(platform.get(path), b"HELLO")
+        finally:
+            shutil.rmtree(d)
+
+    def test_append(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, "test_append")
+        try:
+            platform.append(path, "HELLO\n")
+            platform.append(path, "WORLD\n")
+            self.assertEqual(platform.get(path), b"HELLO\nWORLD\n")
+        finally:
+            shutil.rmtree(d)
+
     def test_makedirs(self):
         d1 = tempfile.mkdtemp()
         d2 = os.path.join(d1, "test_makedirs")
@@ -159,6 +371,32 @@ class TestPlatform(unittest.TestCase):
             u = platform.getpwuid(os.getuid())
             platform.getpwnam(u.pw_name)
 
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_getpwnam_cached(self):
+        platform.invalidate_identities()
+        with mock.patch("pwd.getpwnam") as getpwnam:
+            getpwnam.__name__ = "getpwnam"
+            getpwnam.return_value = "root-entry"
+            self.assertEqual(platform.getpwnam("root"), "root-entry")
+            self.assertEqual(platform.getpwnam("root"), "root-entry")
+            self.assertEqual(getpwnam.call_count, 1)
+
+            platform.invalidate_identities()
+            platform.getpwnam("root")
+            self.assertEqual(getpwnam.call_count, 2)
+        platform.invalidate_identities()
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_getgrnam_missing_cached(self):
+        platform.invalidate_identities()
+        with mock.patch("grp.getgrnam") as getgrnam:
+            getgrnam.__name__ = "getgrnam"
+            getgrnam.side_effect = KeyError("getgrnam(): name not found: 'nobody'")
+            self.assertRaises(KeyError, platform.getgrnam, "nobody")
+            self.assertRaises(KeyError, platform.getgrnam, "nobody")
+            self.assertEqual(getgrnam.call_count, 1)
+        platform.invalidate_identities()
+
     @skipIf(sys.platform.startswith("win"), "requires *nix")
     def test_getspall(self):
         if platform.spwd_supported():
@@ -176,6 +414,49 @@ class TestPlatform(unittest.TestCase):
     def test_getuid(self):
         self.assertEqual(platform.getuid(), os.getuid())
 
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_async_check_call(self):
+        stdout, stderr = asyncio.run(platform.async_check_call(["echo", "hello"]))
+        self.assertEqual(stdout, "hello")
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_async_check_call_FAIL(self):
+        call = platform.async_check_call("echo oops >&2; exit 3")
+        with self.assertRaises(error.SystemError) as cm:
+            asyncio.run(call)
+        self.assertEqual(cm.exception.returncode, 3)
+        self.assertEqual(cm.exception.stderr, "oops")
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_async_check_call_stdin_and_logger(self):
+        lines = []
+        stdout, stderr = asyncio.run(
+            platform.async_check_call(
+                ["cat"], stdin="foo\nbar\n", logger=mock.Mock(info=lines.append)
+            )
+        )
+        self.assertEqual(lines, ["foo", "bar"])
+        self.assertEqual(stdout, os.linesep.join(lines))
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_async_check_call_preexec_tasks(self):
+        # Before 3.9 a change of identity or umask spawns with a preexec_fn,
+        # under a lock that is held across an await
+        def get_launch_options(command, **kwargs):
+            kwargs["preexec_fn"] = lambda: None
+            return kwargs
+
+        async def main():
+            calls = [platform.async_check_call(["echo", str(i)]) for i in range(4)]
+            return await asyncio.wait_for(asyncio.gather(*calls), 30)
+
+        with mock.patch.object(
+            platform.Process, "get_launch_options", side_effect=get_launch_options
+        ):
+            results = asyncio.run(main())
+        self.assertEqual([out for out, err in results], ["0", "1", "2", "3"])
+        self.assertFalse(platform._preexec_lock.locked())
+
 
 class TestHandle(unittest.TestCase):
     def setUp(self):
@@ -200,3 +481,27 @@ class TestHandle(unittest.TestCase):
         self.stdout.feed(b"foo\rbaz")
         self.stdout.flush()
         self.assertEqual(self.stdout._output, ["foo", "baz"])
+
+    def test_split_across_feeds(self):
+        self.stdout.feed(b"fo")
+        self.stdout.feed(b"o\nba")
+        self.stdout.feed(b"r\n")
+        self.stdout.flush()
+        self.assertEqual(self.stdout._output, ["foo", "bar"])
+
+    def test_long_line(self):
+        for i in range(1000):
+            self.stdout.feed(b"x" * 100)
+        self.stdout.feed(b"\n")
+        self.stdout.flush()
+        self.assertEqual(self.stdout._output, ["x" * 100000])
+
+    @skipIf(sys.platform.startswith("win"), "requires *nix")
+    def test_streams_large_output(self):
+        lines = []
+        stdout, stderr = platform.check_call(
+            ["seq", "100000"], logger=mock.Mock(info=lines.append)
+        )
+        self.assertEqual(len(lines), 100000)
+        self.assertEqual(lines[-1], "100000")
+        self.assertEqual(stdout.splitlines(), lines)
@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import unittest
+from unittest import mock
 
-from fuselage import argument, error, policy, resource
+from fuselage import argument, error, policy, provider, resource
+from fuselage.resources import Checkout
 
 
 class DummyResource(resource.Resource):
@@ -43,6 +45,75 @@ class TestPolicy(unittest.TestCase):
         self.assertRaises(error.NoSuitableProviders, p.get_provider)
 
 
+class TestProviderCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = policy.ProviderCache()
+        patcher = mock.patch.object(policy, "provider_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, name, scm):
+        return Checkout(name=name, repository="/tmp/repo", scm=scm)
+
+    def test_resolved_once_per_scm(self):
+        checkouts = [self.checkout("/tmp/%d" % i, "git") for i in range(10)]
+        checkouts.append(self.checkout("/tmp/hg", "mercurial"))
+        self.cache.clear()
+        self.cache.reset_stats()
+
+        with mock.patch.object(
+            policy.Policy, "resolve_provider", autospec=True
+        ) as resolve:
+            resolve.side_effect = lambda p: p.resource.scm
+            for c in checkouts:
+                self.assertEqual(c.policy.get_provider(), c.scm)
+
+        self.assertEqual(resolve.call_count, 2)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (9, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 9 / 11)
+
+    def test_resolves_same_provider(self):
+        git = self.checkout("/tmp/git", "git")
+        svn = self.checkout("/tmp/svn", "svn")
+        self.assertEqual(git.policy.get_provider(), git.policy.resolve_provider())
+        self.assertEqual(svn.policy.get_provider(), svn.policy.resolve_provider())
+        self.assertNotEqual(git.policy.get_provider(), svn.policy.get_provider())
+
+    def test_failures_not_cached(self):
+        r = DummyResource(id="hello")
+        p = policy.Policy(r)
+        self.assertRaises(error.NoSuitableProviders, p.get_provider)
+        self.assertRaises(error.NoSuitableProviders, p.get_provider)
+        self.assertNotIn((policy.Policy, ()), self.cache.resolved)
+
+    def test_undeclared_isvalid_not_cached(self):
+        class Picky(provider.Provider):
+            @classmethod
+            def isvalid(cls, policy, resource):
+                return resource.arg1 == "picky"
+
+        self.assertIsNone(Picky.isvalid_arguments)
+
+        class PickyPolicy(policy.Policy):
+            pass
+
+        PickyPolicy.providers.append(Picky)
+        p = PickyPolicy(DummyResource(id="hello", arg1="picky"))
+        self.assertIsNone(self.cache.get_key(p))
+        self.assertEqual(p.get_provider(), Picky)
+        self.assertEqual(self.cache.stats()["uncached"], 1)
+
+    def test_registering_provider_clears_cache(self):
+        self.cache.resolved["sentinel"] = object()
+
+        class Extra(provider.Provider):
+            policies = (policy.NullPolicy,)
+
+        policy.NullPolicy.providers.remove(Extra)
+        self.assertEqual(self.cache.resolved, {})
+
+
 class TestPresent(unittest.TestCase):
     def test_is_not_present(self):
         r = DummyResource(id="hello")
@@ -12,8 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error
-from fuselage.resources import Package
+import asyncio
+import unittest
+from unittest import mock
+
+from fuselage import bundle, error
+from fuselage.changes import ShellCommand
+from fuselage.provider import Provider
+from fuselage.providers.apt import (
+    AptBatch,
+    AptIndex,
+    AptInstall,
+    AptUninstall,
+    DpkgDatabase,
+)
+from fuselage.resources import File, Package
 
 from tests.base import TestCaseWithRunner
 
@@ -51,3 +64,152 @@ class TestPackageRemoval(TestCaseWithRunner):
         self.bundle.add(Package(name="python", policy="uninstall"))
         self.check_apply()
         self.failIfExists("/usr/share/doc/python/copyright")
+
+
+class TestAptBatch(unittest.TestCase):
+    def setUp(self):
+        self.bundle = bundle.ResourceBundle()
+        self.bundle.add(Package(name="a"))
+        self.bundle.add(Package(name="b"))
+        self.bundle.add(Package(name="c", policy="uninstall"))
+        self.bundle.add(Package(name="d", policy="uninstall"))
+        self.runner = mock.Mock(resources=self.bundle, shared={})
+
+    def apply(self, stdout):
+        commands = []
+
+        def change(provider, change):
+            commands.append(change.command)
+
+        with mock.patch("fuselage.platform.check_call") as check_call:
+            check_call.return_value = (stdout, "")
+            with mock.patch.object(Provider, "change", change):
+                changed = [
+                    AptInstall(self.bundle["Package[a]"], self.runner).apply(),
+                    AptInstall(self.bundle["Package[b]"], self.runner).apply(),
+                    AptUninstall(self.bundle["Package[c]"], self.runner).apply(),
+                    AptUninstall(self.bundle["Package[d]"], self.runner).apply(),
+                ]
+
+        self.assertEqual(check_call.call_count, 1)
+        return changed, commands
+
+    def test_batch(self):
+        changed, commands = self.apply(
+            "a install ok installed\nc install ok installed\n"
+        )
+        self.assertEqual(changed, [False, True, True, False])
+        self.assertEqual(len(commands), 2)
+        self.assertEqual(commands[0][:2], ["apt-get", "install"])
+        self.assertEqual(commands[0][-1:], ["b"])
+        self.assertEqual(commands[1], ["apt-get", "remove", "-q", "-y", "c"])
+
+    def test_batch_nothing_to_do(self):
+        changed, commands = self.apply(
+            "a install ok installed\nb install ok installed\n"
+        )
+        self.assertEqual(changed, [False, False, False, False])
+        self.assertEqual(commands, [])
+
+    def test_batch_nothing_to_do_async(self):
+        async def apply_all():
+            return [
+                await AptInstall(self.bundle["Package[a]"], self.runner).apply_async(),
+                await AptInstall(self.bundle["Package[b]"], self.runner).apply_async(),
+                await AptUninstall(
+                    self.bundle["Package[c]"], self.runner
+                ).apply_async(),
+                await AptUninstall(
+                    self.bundle["Package[d]"], self.runner
+                ).apply_async(),
+            ]
+
+        with mock.patch("fuselage.platform.async_check_call") as async_check_call:
+            async_check_call.return_value = (
+                "a install ok installed\nb install ok installed\n",
+                "",
+            )
+            with mock.patch.object(
+                asyncio.BaseEventLoop, "run_in_executor"
+            ) as run_in_executor:
+                changed = asyncio.run(apply_all())
+
+        self.assertEqual(changed, [False, False, False, False])
+        self.assertEqual(async_check_call.call_count, 1)
+        self.assertEqual(run_in_executor.call_count, 0)
+
+    def test_batches_found_once(self):
+        self.bundle.add(File(name="/tmp/a"))
+        self.bundle.add(Package(name="e"))
+        with mock.patch.object(
+            AptBatch, "find_batches", wraps=AptBatch.find_batches
+        ) as find_batches:
+            batches = [
+                AptBatch.get(AptInstall(r, self.runner)) for r in self.bundle.resources
+            ]
+        self.assertEqual(find_batches.call_count, 1)
+        self.assertIsNotNone(batches[0])
+        self.assertEqual(batches[:4], [batches[0]] * 4)
+        self.assertEqual(batches[4:], [None, None])
+
+
+class TestDpkgDatabase(unittest.TestCase):
+    def setUp(self):
+        self.runner = mock.Mock(shared={})
+
+    @mock.patch("fuselage.platform.check_call")
+    def test_snapshot_is_shared(self, check_call):
+        check_call.return_value = (
+            "python install ok installed\nhello deinstall ok config-files\n",
+            "",
+        )
+        db = DpkgDatabase.get(self.runner)
+        self.assertIs(DpkgDatabase.get(self.runner), db)
+        self.assertEqual(check_call.call_count, 1)
+
+        self.assertTrue(db.is_installed(Package(name="python")))
+        self.assertFalse(db.is_installed(Package(name="hello")))
+        self.assertFalse(db.is_installed(Package(name="zzzz")))
+
+    def test_package_managers_invalidate(self):
+        self.assertTrue(
+            ShellCommand(["apt-get", "install", "hello"]).runs_package_manager()
+        )
+        self.assertTrue(
+            ShellCommand(["sh", "-c", "/usr/bin/dpkg -i x.deb"]).runs_package_manager()
+        )
+        self.assertFalse(
+            ShellCommand(["touch", "/etc/apt/sources.list"]).runs_package_manager()
+        )
+
+
+class TestAptIndex(unittest.TestCase):
+    def setUp(self):
+        self.runner = mock.Mock(shared={})
+        self.provider = AptInstall(Package(name="hello"), self.runner)
+
+    @mock.patch("fuselage.platform.check_call")
+    def test_get_missing(self, check_call):
+        check_call.return_value = (
+            "hello:\n  Installed: (none)\n  Candidate: 2.10-2\n"
+            "nope:\n  Installed: (none)\n  Candidate: (none)\n",
+            "",
+        )
+        index = AptIndex.get(self.runner)
+        self.assertEqual(index.get_missing(["hello", "nope", "zzzz"]), ["nope", "zzzz"])
+
+    def test_update_once_per_run(self):
+        with mock.patch.object(AptInstall, "change") as change:
+            index = AptIndex.get(self.runner)
+            self.assertTrue(index.update(self.provider))
+            self.assertFalse(AptIndex.get(self.runner).update(self.provider))
+        self.assertEqual(change.call_count, 1)
+
+    @mock.patch("fuselage.platform.exists", return_value=True)
+    @mock.patch("fuselage.platform.stat")
+    def test_refresh_when_stale(self, stat, exists):
+        stat.return_value = mock.Mock(st_mtime=0)
+        index = AptIndex.get(self.runner)
+        with mock.patch.object(index, "update") as update:
+            index.refresh(self.provider, ["hello"], 3600)
+        update.assert_called_once_with(self.provider)
@@ -15,8 +15,12 @@
 import os
 import stat
 import tempfile
+import unittest
+from unittest import mock
+import zipfile
 
 from fuselage import error, platform
+from fuselage.providers import files
 from fuselage.resources import File
 
 from tests.base import TestCaseWithRealRunner, TestCaseWithRunner
@@ -36,6 +40,21 @@ class TestFileIntegration(TestCaseWithRealRunner):
             self.assertTrue(os.path.exists(fp.name))
             self.assertEqual(open(fp.name, "rb").read(), b"hello")
 
+    def test_file_apply_streamed(self):
+        with tempfile.NamedTemporaryFile(delete=False) as source:
+            source.write(b"hello world")
+        with tempfile.NamedTemporaryFile(delete=True) as fp:
+            fp.close()
+            self.bundle.add(File(name=fp.name, source=source.name))
+            try:
+                with mock.patch.object(files, "STREAM_THRESHOLD", 4):
+                    with mock.patch.object(platform, "CHUNK_SIZE", 4):
+                        self.check_apply()
+                self.assertEqual(open(fp.name, "rb").read(), b"hello world")
+            finally:
+                os.unlink(source.name)
+                os.unlink(fp.name)
+
     def test_file_remove(self):
         with tempfile.NamedTemporaryFile(delete=False) as fp:
             fp.write(b"HELLO")
@@ -162,3 +181,53 @@ class TestFileRemove(TestCaseWithRunner):
             )
         )
         self.assertRaises(error.InvalidProvider, self.apply)
+
+
+class TestGetAsset(unittest.TestCase):
+    def test_streamed_asset_closes_archive(self):
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as fp:
+            archive = fp.name
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("assets/big", b"hello world")
+
+        opened = []
+        ZipFile = zipfile.ZipFile
+
+        def open_archive(*args):
+            zf = ZipFile(*args)
+            opened.append(zf)
+            return zf
+
+        loader = mock.Mock(archive=archive)
+        try:
+            with mock.patch("pkgutil.get_loader", return_value=loader):
+                with mock.patch.object(files, "STREAM_THRESHOLD", 4):
+                    contents = files.get_asset("big")
+            with mock.patch("zipfile.ZipFile", side_effect=open_archive):
+                with contents.open() as stream:
+                    self.assertEqual(stream.read(), b"hello world")
+            self.assertTrue(stream.closed)
+            self.assertEqual([zf.fp for zf in opened], [None])
+        finally:
+            os.unlink(archive)
+
+    def test_missing_asset(self):
+        store = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(error.MissingAsset) as cm:
+                files.get_asset("0123abcd", store)
+            self.assertIn("0123abcd", str(cm.exception))
+            self.assertIn(store, str(cm.exception))
+        finally:
+            os.rmdir(store)
+
+    def test_stored_asset(self):
+        store = tempfile.mkdtemp()
+        path = os.path.join(store, "0123abcd")
+        with open(path, "wb") as fp:
+            fp.write(b"hello")
+        try:
+            self.assertEqual(files.get_asset("0123abcd", store), b"hello")
+        finally:
+            os.unlink(path)
+            os.rmdir(store)
@@ -12,7 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fuselage import error, platform
+from concurrent import futures
+import time
+import unittest
+from unittest import mock
+
+from fuselage import bundle, error, platform
+from fuselage.providers.line import LineApply, LineBatch, LineRemove
 from fuselage.resources import Line
 
 from tests.base import TestCaseWithRunner
@@ -131,3 +137,67 @@ class TestLine(TestCaseWithRunner):
         )
         self.check_apply()
         self.assertEqual(platform.get("/multiple_lines"), b"FOO 2\nBAR 3\nBAZ 4")
+
+
+class TestLineBatch(unittest.TestCase):
+    def setUp(self):
+        self.bundle = bundle.ResourceBundle()
+        self.bundle.add(Line(name="/a", match="^FOO", line="FOO 2"))
+        self.bundle.add(Line(name="/b", match="^BAR", line="BAR 2"))
+        self.bundle.add(Line(name="/a", match="^BAR", line="BAR 1"))
+        self.bundle.add(Line(name="/a", match="^BAZ", policy="remove"))
+        self.runner = mock.Mock(
+            resources=self.bundle, shared={}, simulate=False, fingerprints=None
+        )
+        self.files = {"/a": b"FOO 1\nBAR 1\nBAZ 1", "/b": b"BAR 1"}
+
+    def apply(self):
+        with mock.patch("fuselage.platform.exists") as exists, mock.patch(
+            "fuselage.platform.get"
+        ) as get, mock.patch("fuselage.platform.put") as put:
+            exists.side_effect = lambda path: path in self.files
+            get.side_effect = lambda path: self.files[path]
+            put.side_effect = self.files.__setitem__
+            changed = [
+                LineApply(self.bundle.resources[0], self.runner).apply(),
+                LineApply(self.bundle.resources[1], self.runner).apply(),
+                LineApply(self.bundle.resources[2], self.runner).apply(),
+                LineRemove(self.bundle.resources[3], self.runner).apply(),
+            ]
+        return changed, get, put
+
+    def test_batch(self):
+        changed, get, put = self.apply()
+        self.assertEqual(changed, [True, True, False, True])
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(put.call_count, 2)
+        self.assertEqual(self.files["/a"], b"FOO 2\nBAR 1")
+        self.assertEqual(self.files["/b"], b"BAR 2")
+
+    def test_batch_nothing_to_do(self):
+        self.files["/a"] = b"FOO 2\nBAR 1"
+        self.files["/b"] = b"BAR 2"
+        changed, get, put = self.apply()
+        self.assertEqual(changed, [False, False, False, False])
+        self.assertEqual(put.call_count, 0)
+
+    def test_concurrent_apply(self):
+        converged = []
+
+        def converge(batch, provider):
+            converged.append(batch.resources[0].name)
+            time.sleep(0.01)
+            return dict.fromkeys(batch.resources, True)
+
+        providers = [
+            LineApply(self.bundle.resources[0], self.runner),
+            LineApply(self.bundle.resources[1], self.runner),
+            LineApply(self.bundle.resources[2], self.runner),
+            LineRemove(self.bundle.resources[3], self.runner),
+        ]
+        with mock.patch.object(LineBatch, "converge", converge):
+            with futures.ThreadPoolExecutor(max_workers=4) as executor:
+                changed = list(executor.map(lambda p: p.apply(), providers))
+
+        self.assertEqual(changed, [True] * 4)
+        self.assertEqual(sorted(converged), ["/a", "/b"])
@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import unittest
+from unittest import mock
+
 from fuselage import error, platform
+from fuselage.changes import ShellCommand
 from fuselage.resources import Group, User
 
 from tests.base import TestCaseWithRunner
@@ -89,3 +93,20 @@ class TestUserRemove(TestCaseWithRunner):
         self.bundle.add(User(name="zzidontexistzz", policy="remove"))
         self.assertRaises(error.NothingChanged, self.apply)
         self.assertRaises(KeyError, platform.getpwnam, "zzidontexistzz")
+
+
+class TestIdentityInvalidation(unittest.TestCase):
+    def test_changes_identities(self):
+        self.assertTrue(ShellCommand(["useradd", "-N", "test"]).changes_identities())
+        self.assertTrue(ShellCommand(["sh", "-c", "groupadd x"]).changes_identities())
+        self.assertTrue(ShellCommand(["apt-get", "install", "x"]).changes_identities())
+        self.assertFalse(ShellCommand(["chown", "test", "/x"]).changes_identities())
+
+    def test_invalidated_after_command(self):
+        ctx = mock.Mock(simulate=False)
+        command = ShellCommand(["/usr/sbin/usermod", "-s", "/bin/sh", "test"])
+        with mock.patch.object(command, "command_exists", return_value=True):
+            with mock.patch.object(platform, "check_call", return_value=("", "")):
+                with mock.patch.object(platform, "invalidate_identities") as inv:
+                    command.apply(ctx)
+        self.assertTrue(inv.called)
@@ -0,0 +1,68 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import unittest
+from unittest import mock
+
+from fuselage import error
+from fuselage.changes import ShellCommand
+from fuselage.providers.yum import RpmDatabase, YumInstall
+from fuselage.resources import Package
+
+
+class TestRpmDatabase(unittest.TestCase):
+    def setUp(self):
+        self.runner = mock.Mock(shared={})
+
+    @mock.patch("fuselage.platform.check_call")
+    def test_snapshot(self, check_call):
+        check_call.return_value = ("bash\nbash.x86_64\nglibc-common\n", "")
+        db = RpmDatabase.get(self.runner)
+        self.assertIs(RpmDatabase.get(self.runner), db)
+
+        self.assertTrue(db.is_installed(Package(name="bash")))
+        self.assertTrue(db.is_installed(Package(name="bash.x86_64")))
+        self.assertTrue(db.is_installed(Package(name="glibc-common")))
+        self.assertFalse(db.is_installed(Package(name="zsh")))
+        self.assertFalse(db.is_installed(Package(name="zsh-5.8")))
+        self.assertEqual(check_call.call_count, 1)
+
+    @mock.patch("fuselage.platform.check_call")
+    def test_versioned_name(self, check_call):
+        check_call.side_effect = [
+            ("bash\nbash.x86_64\n", ""),
+            error.SystemError(1, "", ""),
+        ]
+        db = RpmDatabase.get(self.runner)
+        self.assertFalse(db.is_installed(Package(name="bash-4.0-1.el9")))
+        self.assertEqual(check_call.call_args[0][0], ["rpm", "-q", "bash-4.0-1.el9"])
+
+    @mock.patch("fuselage.platform.async_check_call")
+    def test_install_async(self, async_check_call):
+        async_check_call.side_effect = [
+            ("bash\nbash.x86_64\n", ""),
+            error.SystemError(1, "", ""),
+            ("", ""),
+        ]
+        self.runner.simulate = False
+        yum = YumInstall(Package(name="bash-4.0-1.el9"), self.runner)
+        with mock.patch.object(ShellCommand, "command_exists") as command_exists:
+            command_exists.return_value = True
+            with mock.patch.object(ShellCommand, "apply") as apply:
+                self.assertTrue(asyncio.run(yum.apply_async()))
+        self.assertEqual(apply.call_count, 0)
+        rpm, query, yum = async_check_call.call_args_list
+        self.assertEqual(query[0][0], ["rpm", "-q", "bash-4.0-1.el9"])
+        self.assertEqual(yum[1]["command"], ["yum", "install", "-y", "bash-4.0-1.el9"])
@@ -12,10 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import logging
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
-from fuselage import bundle, error, runner
+from fuselage import bundle, error, provider, runner
+from fuselage.providers.files import File as FileProvider
+from fuselage.resources import Execute, File
+from fuselage.resources.file import FileApplyPolicy
 
 
 class TestRunner(unittest.TestCase):
@@ -37,7 +45,77 @@ class TestRunner(unittest.TestCase):
         self.assertEqual(r.simulate, True)
         self.assertEqual(r.state.simulate, True)
 
+    def test_setup_from_cmdline__jobs(self):
+        r = runner.Runner.setup_from_cmdline(["--jobs", "8"])
+        self.assertEqual(r.jobs, 8)
+
+    def test_invalid_jobs(self):
+        self.assertRaises(error.ParseError, runner.Runner, [], jobs=0)
+
     def test_resume_and_not_resume(self):
         self.assertRaises(
             error.ParseError, runner.Runner, [], resume=True, no_resume=True
         )
+
+
+class TestAsyncRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.bundle = bundle.ResourceBundle()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def apply(self, **kwargs):
+        r = runner.AsyncRunner(
+            self.bundle, state_path=os.path.join(self.tmp, "state"), **kwargs
+        )
+        return r.run()
+
+    def test_apply(self):
+        for i in range(5):
+            path = os.path.join(self.tmp, "file%d" % i)
+            self.bundle.add(File(name=path, contents="hello %d" % i))
+        self.apply(jobs=3)
+        for i in range(5):
+            with open(os.path.join(self.tmp, "file%d" % i)) as fp:
+                self.assertEqual(fp.read(), "hello %d" % i)
+        self.assertRaises(error.NothingChanged, self.apply, jobs=3)
+
+    def test_async_provider(self):
+        path = os.path.join(self.tmp, "file")
+
+        class AsyncFileProvider(provider.AsyncProvider):
+            async def apply_async(self):
+                await asyncio.sleep(0)
+                return True
+
+        self.bundle.add(File(name=path, contents="hello"))
+        with mock.patch.object(FileApplyPolicy, "get_provider") as get_provider:
+            get_provider.return_value = AsyncFileProvider
+            self.apply()
+        self.assertFalse(os.path.exists(path))
+
+    def test_sync_provider_adapter(self):
+        path = os.path.join(self.tmp, "file")
+        self.bundle.add(File(name=path, contents="hello"))
+        with mock.patch.object(FileProvider, "apply") as apply:
+            apply.return_value = True
+            self.apply()
+        self.assertEqual(apply.call_count, 1)
+
+    def test_native_async_provider(self):
+        path = os.path.join(self.tmp, "file")
+        self.bundle.add(
+            Execute(
+                command="touch " + path,
+                unless="test -e " + path,
+            )
+        )
+        with mock.patch.object(
+            asyncio.BaseEventLoop, "run_in_executor"
+        ) as run_in_executor:
+            self.apply()
+            self.assertRaises(error.NothingChanged, self.apply)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(run_in_executor.call_count, 0)
@@ -0,0 +1,257 @@
+# Copyright 2026 Isotoma Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import posixpath
+import stat
+import unittest
+from unittest import mock
+
+import paramiko
+
+from fuselage import bundle, ssh
+
+
+class FakeChannel:
+    def __init__(self, chunks, status=0):
+        self.chunks = list(chunks)
+        self.status = status
+        self.command = None
+
+    def get_pty(self):
+        pass
+
+    def set_combine_stderr(self, combine):
+        pass
+
+    def exec_command(self, command):
+        self.command = command
+
+    def shutdown_write(self):
+        pass
+
+    def recv(self, size):
+        return self.chunks.pop(0) if self.chunks else b""
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        pass
+
+
+class FakeSFTP:
+    def __init__(self):
+        self.files = {}
+        self.modes = {}
+        self.uploads = []
+
+    def chdir(self, path):
+        pass
+
+    def getcwd(self):
+        return "/root"
+
+    def stat(self, path):
+        if path != "/" and not any(f.startswith(path + "/") for f in self.files):
+            raise FileNotFoundError(path)
+        attrs = paramiko.SFTPAttributes()
+        attrs.st_mode = stat.S_IFDIR | self.modes.get(path, 0o755)
+        return attrs
+
+    def mkdir(self, path, mode):
+        self.files[path + "/."] = b""
+        self.modes[path] = mode
+
+    def listdir_attr(self, path):
+        listing = []
+        for name in self.listdir(path):
+            if name == ".":
+                continue
+            attrs = paramiko.SFTPAttributes()
+            attrs.filename = name
+            attrs.st_mode = stat.S_IFREG | self.modes[posixpath.join(path, name)]
+            listing.append(attrs)
+        return listing
+
+    def listdir(self, path):
+        return [
+            posixpath.basename(f) for f in self.files if posixpath.dirname(f) == path
+        ]
+
+    def putfo(self, fp, path):
+        self.files[path] = fp.read()
+        self.modes[path] = 0o600
+        self.uploads.append(path)
+
+    def posix_rename(self, old, new):
+        self.files[new] = self.files.pop(old)
+        self.modes[new] = self.modes.pop(old)
+
+    def chmod(self, path, mode):
+        self.modes[path] = mode
+
+    def remove(self, path):
+        del self.files[path]
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    def __init__(self, host, status=0):
+        self.host = host
+        self.status = status
+        self.channels = []
+        self.closed = False
+
+    def is_active(self):
+        return not self.closed
+
+    def get_username(self):
+        return "root"
+
+    def open_session(self):
+        channel = FakeChannel([self.host.encode("utf-8") + b"\n"], self.status)
+        self.channels.append(channel)
+        return channel
+
+    def open_sftp_client(self):
+        return FakeSFTP()
+
+    def close(self):
+        self.closed = True
+
+
+class TestIterLines(unittest.TestCase):
+    def test_lines_split_across_chunks(self):
+        channel = FakeChannel([b"hel", b"lo\nwor", b"ld\n\nlast"])
+        self.assertEqual(list(ssh.iter_lines(channel)), ["hello", "world", "", "last"])
+
+
+class TestDeploy(unittest.TestCase):
+    def setUp(self):
+        self.statuses = {}
+        self.connections = []
+        self.pool = ssh.TransportPool(self.connect)
+        self.lines = []
+
+    def connect(self, host):
+        if self.statuses.get(host) == "unreachable":
+            raise OSError("unreachable")
+        transport = FakeTransport(host, self.statuses.get(host, 0))
+        self.connections.append(transport)
+        return transport
+
+    def deploy(self, hosts, **kwargs):
+        with mock.patch.object(ssh, "build") as build:
+            build.return_value = io.BytesIO(b"payload")
+            results = ssh.deploy(
+                self.pool,
+                hosts,
+                bundle.ResourceBundle(),
+                output=lambda host, line: self.lines.append((host, line)),
+                **kwargs,
+            )
+        self.assertEqual(build.call_count, 1)
+        return results
+
+    def test_deploy(self):
+        hosts = ["host%d" % i for i in range(20)]
+        results = self.deploy(hosts, parallelism=5)
+        self.assertEqual(results, dict.fromkeys(hosts, 0))
+        self.assertEqual(sorted(self.lines), sorted((h, h) for h in hosts))
+
+    def test_dry_run(self):
+        self.deploy(["host"], dry_run=True)
+        command = self.connections[0].channels[0].command
+        self.assertEqual(command, "/root/.payload.pex --resume --simulate")
+
+    def test_transports_reused(self):
+        self.deploy(["host1", "host2"])
+        self.deploy(["host1", "host2"])
+        self.assertEqual(len(self.connections), 2)
+
+    def test_nothing_changed_is_success(self):
+        self.statuses["host1"] = 254
+        results = self.deploy(["host1", "host2"], parallelism=1)
+        self.assertEqual(results, {"host1": 254, "host2": 0})
+
+    def test_failure_budget(self):
+        self.statuses["host1"] = 1
+        self.statuses["host2"] = "unreachable"
+        hosts = ["host%d" % i for i in range(10)]
+        results = self.deploy(hosts, parallelism=1, max_failures=1)
+        self.assertEqual(list(results), ["host0", "host1", "host2"])
+        self.assertEqual(results["host1"], 1)
+        self.assertIsInstance(results["host2"], OSError)
+
+    def test_failed_transport_discarded(self):
+        self.statuses["host"] = 1
+        transport = self.connect("host")
+        transport.open_session = mock.Mock(side_effect=EOFError())
+        self.pool._transports["host"] = transport
+        results = self.deploy(["host"])
+        self.assertIsInstance(results["host"], EOFError)
+        self.assertTrue(transport.closed)
+        self.assertNotIn("host", self.pool._transports)
+
+    def test_delta_upload(self):
+        sftp = FakeSFTP()
+        self.pool._sftp["host"] = sftp
+        self.pool._transports["host"] = self.connect("host")
+
+        with mock.patch.object(ssh, "build_delta") as build_delta:
+            build_delta.return_value = (io.BytesIO(b"payload"), {"abc": b"asset"})
+            for i in range(2):
+                ssh.deploy(
+                    self.pool,
+                    ["host"],
+                    bundle.ResourceBundle(),
+                    output=lambda host, line: None,
+                    asset_store=".fuselage/assets",
+                )
+
+        self.assertEqual(sftp.files["/root/.fuselage/assets/abc"], b"asset")
+        uploads = [p for p in sftp.uploads if "assets" in p]
+        self.assertEqual(uploads, ["/root/.fuselage/assets/.abc.tmp"])
+        command = self.connections[0].channels[-1].command
+        self.assertIn("--asset-store /root/.fuselage/assets", command)
+
+    def test_delta_upload_shared_with_sudo_user(self):
+        sftp = FakeSFTP()
+        self.pool._sftp["host"] = sftp
+        self.pool._transports["host"] = self.connect("host")
+        sftp.mkdir("/root/.fuselage", 0o700)
+        sftp.mkdir("/root/.fuselage/assets", 0o700)
+        sftp.files["/root/.fuselage/assets/old"] = b"old"
+        sftp.modes["/root/.fuselage/assets/old"] = 0o600
+
+        with mock.patch.object(ssh, "build_delta") as build_delta:
+            assets = {"old": b"old", "new": b"new"}
+            build_delta.return_value = (io.BytesIO(b"payload"), assets)
+            ssh.deploy(
+                self.pool,
+                ["host"],
+                bundle.ResourceBundle(),
+                output=lambda host, line: None,
+                asset_store=".fuselage/assets",
+                username="deploy",
+            )
+
+        self.assertEqual(sftp.modes["/root/.fuselage/assets"], 0o755)
+        self.assertEqual(sftp.modes["/root/.fuselage/assets/old"], 0o644)
+        self.assertEqual(sftp.modes["/root/.fuselage/assets/new"], 0o644)
+        command = self.connections[0].channels[-1].command
+        self.assertTrue(command.startswith("sudo -u deploy "))